@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+Read/write benchmark for the partitioned expenses schema.
+
+Creates a scratch table with the expenses schema (same indexes and
+auto-partitioning settings as ExpenseStorage), then runs rounds of
+concurrent writers (multi-row inserts) and readers (one user's last day,
+like the /today report). After every round it prints the throughput and
+the table's current partition count, so throughput can be compared as
+load-based splitting adds partitions.
+
+Start with --min-partitions 1 to watch the table split from a single
+shard; the default pre-splits it like init_ydb.py does.
+
+User ids are a contiguous block starting at --first-user-id by default,
+like the recently issued Telegram ids most active users have; they fall
+into one or two of the initial partitions. --user-ids uniform spreads
+them over the whole id space instead.
+
+Usage:
+    python scripts/benchmark_partitions.py [--rounds N] [--round-seconds S]
+        [--writers W] [--readers R] [--users U] [--batch B]
+        [--user-ids recent|uniform] [--first-user-id ID]
+        [--min-partitions N] [--max-partitions N] [--keep]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.db import schema  # noqa: E402
+from src.db.ydb_client import AsyncYDBClient  # noqa: E402
+
+BENCH_TABLE = "expenses_bench"
+CATEGORIES = ["Еда", "Транспорт", "Развлечения", "Покупки", "Здоровье", "Другое"]
+ITEMS = ["кофе", "обед", "такси", "метро", "кино", "продукты", "аптека"]
+# Start of the recently issued Telegram id block
+RECENT_USER_ID = 7_500_000_000
+
+
+def user_ids(distribution: str, count: int, first: int) -> List[int]:
+    """`count` user ids: a contiguous block from `first`, or uniform over the id space"""
+    if distribution == "uniform":
+        return random.sample(range(1, schema.USER_ID_SPACE), count)
+    return list(range(first, first + count))
+
+
+def make_rows(users: List[int], batch: int) -> List[Dict]:
+    now = datetime.now()
+    rows = []
+    for i in range(batch):
+        item = random.choice(ITEMS)
+        rows.append({
+            "user_id": random.choice(users),
+            "item": item,
+            "item_key": item,
+            "amount": random.randint(50, 5000),
+            "category": random.choice(CATEGORIES),
+            # distinct keys within one batch for the same user
+            "created_at": now - timedelta(microseconds=i),
+        })
+    return rows
+
+
+async def writer(db: AsyncYDBClient, table: str, users: List[int], batch: int, deadline: float) -> int:
+    written = 0
+    while time.monotonic() < deadline:
+        await db.insert_many(table, make_rows(users, batch))
+        written += batch
+    return written
+
+
+async def reader(db: AsyncYDBClient, table: str, users: List[int], deadline: float) -> int:
+    reads = 0
+    while time.monotonic() < deadline:
+        until = datetime.now()
+        await db.select_range(
+            table, {"user_id": random.choice(users)}, "created_at",
+            until - timedelta(days=1), until, tx_mode="snapshot",
+        )
+        reads += 1
+    return reads
+
+
+async def partition_count(db: AsyncYDBClient, table: str) -> int:
+    import ydb
+
+    settings = ydb.DescribeTableSettings().with_include_table_stats(True)
+
+    async def callee(session):
+        return await session.describe_table(f"{db.database}/{table}", settings)
+
+    description = await db.pool.retry_operation(callee)
+    return description.table_stats.partitions
+
+
+async def run(args):
+    # The scratch table is created with a Timestamp created_at; detection
+    # would read the production expenses table instead
+    db = AsyncYDBClient(timestamp_columns=["created_at"], pool_size=args.writers + args.readers + 1)
+    limits = {**schema.partition_limits(), "min": args.min_partitions, "max": args.max_partitions}
+    users = user_ids(args.user_ids, args.users, args.first_user_id)
+
+    print(f"Creating table: {args.table} ({limits['min']}..{limits['max']} partitions)")
+    await db.execute_scheme(schema.expenses_table_ddl(args.table, limits))
+
+    try:
+        print(f"{'round':>5} {'partitions':>10} {'writes/s':>10} {'reads/s':>10}")
+        for n in range(1, args.rounds + 1):
+            deadline = time.monotonic() + args.round_seconds
+            writes = [writer(db, args.table, users, args.batch, deadline) for _ in range(args.writers)]
+            reads = [reader(db, args.table, users, deadline) for _ in range(args.readers)]
+            started = time.monotonic()
+            counts = await asyncio.gather(*writes, *reads)
+            elapsed = time.monotonic() - started
+
+            written = sum(counts[:args.writers])
+            read = sum(counts[args.writers:])
+            partitions = await partition_count(db, args.table)
+            print(f"{n:>5} {partitions:>10} {written / elapsed:>10.0f} {read / elapsed:>10.0f}")
+    finally:
+        if not args.keep:
+            await db.execute_scheme(f"DROP TABLE {args.table}")
+            print(f"Dropped table: {args.table}")
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--table", default=BENCH_TABLE)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--round-seconds", type=float, default=30)
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=50, help="rows per insert")
+    parser.add_argument("--user-ids", choices=["recent", "uniform"], default="recent",
+                        help="contiguous block of recent ids, or uniform over the id space")
+    parser.add_argument("--first-user-id", type=int, default=RECENT_USER_ID)
+    parser.add_argument("--min-partitions", type=int, default=schema.partition_limits()["min"])
+    parser.add_argument("--max-partitions", type=int, default=schema.partition_limits()["max"])
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark table")
+    args = parser.parse_args()
+
+    print("Expenses partitioning benchmark")
+    print("=" * 40)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,22 @@
 #!/usr/bin/env python
 """
 Initialize YDB tables for NLExam bot.
-Run this script once before first deployment.
+Run this script before each deployment: it applies only the migrations
+(src/db/schema.py) newer than the version recorded in schema_version.
 
 Usage:
     python scripts/init_ydb.py
 """
 import os
 import sys
+from pathlib import Path
+
 import httpx
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.db import schema  # noqa: E402
+
 try:
     import ydb
 except ImportError:
@@ -35,30 +42,68 @@ def get_iam_token():
     return resp.json().get('iamToken')
 
 
-def create_expenses_table(pool, database):
-    """Create expenses table"""
-    table_path = f"{database}/expenses"
-
-    def create_table(session):
-        session.create_table(
-            table_path,
-            ydb.TableDescription()
-                .with_column(ydb.Column('user_id', ydb.OptionalType(ydb.PrimitiveType.Int64)))
-                .with_column(ydb.Column('item', ydb.OptionalType(ydb.PrimitiveType.Utf8)))
-                .with_column(ydb.Column('amount', ydb.OptionalType(ydb.PrimitiveType.Int64)))
-                .with_column(ydb.Column('category', ydb.OptionalType(ydb.PrimitiveType.Utf8)))
-                .with_column(ydb.Column('created_at', ydb.OptionalType(ydb.PrimitiveType.Utf8)))
-                .with_primary_keys('user_id', 'created_at')
-        )
-
-    try:
-        pool.retry_operation_sync(create_table)
-        print(f"  Created table: {table_path}")
-    except ydb.issues.SchemeError as e:
-        if "already exists" in str(e):
-            print(f"  Table already exists: {table_path}")
-        else:
-            raise
+def run_scheme(pool, query):
+    pool.retry_operation_sync(lambda session: session.execute_scheme(query))
+
+
+def run_data(pool, query, parameters=None):
+    def callee(session):
+        prepared = session.prepare(query) if parameters else query
+        return session.transaction().execute(prepared, parameters or {}, commit_tx=True)
+
+    return pool.retry_operation_sync(callee)
+
+
+def current_version(pool):
+    """Latest applied migration (0 for a database without schema_version)"""
+    run_scheme(pool, schema.schema_version_table_ddl())
+    result = run_data(pool, f"SELECT MAX(version) AS version FROM {schema.SCHEMA_VERSION_TABLE}")
+    rows = result[0].rows
+    return int(rows[0].version or 0) if rows else 0
+
+
+def record_version(pool, migration):
+    run_data(pool, f"""
+        DECLARE $version AS Int64;
+        DECLARE $description AS Utf8;
+        UPSERT INTO {schema.SCHEMA_VERSION_TABLE} (version, description, applied_at)
+        VALUES ($version, $description, CurrentUtcTimestamp());
+    """, {'$version': migration.version, '$description': migration.description})
+
+
+def apply_migration(pool, migration):
+    for query in migration.scheme:
+        try:
+            run_scheme(pool, query)
+        except ydb.issues.Error as e:
+            if "already exists" not in str(e):
+                raise
+            print(f"    Already applied: {query.strip().splitlines()[0]}")
+    for query in migration.data:
+        run_data(pool, query)
+    for query in migration.backfill:
+        ranges = schema.backfill_ranges()
+        for n, (start, end) in enumerate(ranges, 1):
+            run_data(pool, query, {'$from_user_id': start, '$to_user_id': end})
+            if n % 32 == 0 or n == len(ranges):
+                print(f"    Backfilled {n}/{len(ranges)} user_id ranges")
+    record_version(pool, migration)
+
+
+def migrate(pool, database):
+    """Apply migrations missing from the schema_version table"""
+    version = current_version(pool)
+    print(f"  Current schema version: {version}")
+
+    pending = schema.pending_migrations(version)
+    if not pending:
+        print(f"  Up to date (version {schema.SCHEMA_VERSION})")
+        return
+
+    for migration in pending:
+        print(f"  Applying {migration.version}: {migration.description}")
+        apply_migration(pool, migration)
+    print(f"  {database} migrated to version {pending[-1].version}")
 
 
 def main():
@@ -95,9 +140,9 @@ def main():
     pool = ydb.SessionPool(driver)
     print("  OK")
 
-    # Create tables
-    print("Creating tables...")
-    create_expenses_table(pool, database)
+    # Create tables and apply pending migrations
+    print("Migrating schema...")
+    migrate(pool, database)
 
     # Done
     driver.stop()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""
+Migrate expenses.created_at from Utf8 to a native Timestamp key column.
+
+created_at is part of the primary key, so its type cannot be altered in
+place. Rows are read in key order, in batches, and streamed into
+`expenses_ts` (the current expenses schema from src/db/schema.py:
+Timestamp created_at, item_key, secondary indexes and partitioning)
+with BulkUpsert; item_key is filled in for rows written before it
+existed. The copy is idempotent and can be re-run while the bot keeps
+writing, but rows deleted from the source after they were copied stay
+in the target until the swap.
+
+`--swap` must run while nothing writes to expenses: stop the bot (e.g.
+scale the container to zero) and pass --writes-stopped to confirm. It
+runs a final catch-up pass, deletes target rows whose source rows are
+gone, and renames the tables:
+
+    expenses     -> expenses_utf8_backup
+    expenses_ts  -> expenses
+
+Then start the bot again. With YDB_TIMESTAMP_COLUMNS unset the client
+reads the created_at type on connect, so the same build works before
+and after the swap.
+
+Usage:
+    python scripts/migrate_created_at.py [--batch-size N]
+    python scripts/migrate_created_at.py --swap --writes-stopped
+"""
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.db import schema  # noqa: E402
+from src.db.timestamps import to_micros  # noqa: E402
+from src.db.ydb_client import YDBClient  # noqa: E402
+from src.services.expense_storage import item_key  # noqa: E402
+
+SOURCE_TABLE = schema.EXPENSES_TABLE
+TARGET_TABLE = "expenses_ts"
+BACKUP_TABLE = "expenses_utf8_backup"
+TARGET_COLUMNS = {
+    "user_id": "Int64",
+    "item": "Utf8",
+    "amount": "Int64",
+    "category": "Utf8",
+    "created_at": "Timestamp",
+    "item_key": "Utf8",
+}
+
+
+def build_batch_query(
+    after: Optional[Tuple[int, str]],
+    batch_size: int,
+    table: str = SOURCE_TABLE,
+    columns: str = "*",
+    created_at_type: str = "Utf8",
+) -> Tuple[str, Optional[dict]]:
+    """Build a keyset-paginated read of the Utf8 source table (or of the target's keys)"""
+    limit = int(batch_size)
+    if after is None:
+        # nosec B608 - constant table name, integer limit
+        return f"SELECT {columns} FROM {table} ORDER BY user_id, created_at LIMIT {limit}", None
+
+    query = f"""
+        DECLARE $after_user_id AS Int64;
+        DECLARE $after_created_at AS {created_at_type};
+        SELECT {columns} FROM {table}
+        WHERE (user_id, created_at) > ($after_user_id, $after_created_at)
+        ORDER BY user_id, created_at
+        LIMIT {limit}
+    """
+    return query, {"$after_user_id": int(after[0]), "$after_created_at": after[1]}
+
+
+def convert_rows(rows: List[dict]) -> Tuple[List[dict], int]:
+    """Keep rows whose created_at parses as ISO datetime.
+
+    Returns (rows for the Timestamp table, number of skipped rows).
+    """
+    converted = []
+    skipped = 0
+    for row in rows:
+        try:
+            datetime.fromisoformat(str(row.get("created_at")))
+        except ValueError:
+            skipped += 1
+            continue
+        item = str(row.get("item") or "")
+        converted.append({
+            "user_id": int(row.get("user_id") or 0),
+            "item": item,
+            "item_key": str(row.get("item_key") or item_key(item)),
+            "amount": int(row.get("amount") or 0),
+            "category": str(row.get("category") or "Другое"),
+            "created_at": str(row["created_at"]),
+        })
+    return converted, skipped
+
+
+def create_target_table(target: YDBClient):
+    target.execute_scheme(schema.expenses_table_ddl(TARGET_TABLE))
+
+
+def read_rows(
+    source: YDBClient, batch_size: int, counts: Dict[str, int], keys: Optional[Set[Tuple[int, int]]] = None
+) -> Iterator[dict]:
+    """Stream convertible source rows in key order, counting skipped ones.
+
+    `keys` collects the (user_id, micros) key of every converted row.
+    """
+    after = None
+    while True:
+        query, params = build_batch_query(after, batch_size)
+        rows = source.execute(query, params)
+        if not rows:
+            return
+
+        converted, batch_skipped = convert_rows(rows)
+        counts["read"] += len(rows)
+        counts["skipped"] += batch_skipped
+        if keys is not None:
+            keys.update((row["user_id"], to_micros(row["created_at"])) for row in converted)
+        yield from converted
+        after = (rows[-1]["user_id"], str(rows[-1]["created_at"]))
+        print(f"  Read {counts['read']} rows (skipped {counts['skipped']})")
+
+        if len(rows) < batch_size:
+            return
+
+
+def copy_rows(
+    source: YDBClient, target: YDBClient, batch_size: int, keys: Optional[Set[Tuple[int, int]]] = None
+) -> Tuple[int, int]:
+    """Copy all source rows into the Timestamp table. Returns (copied, skipped)."""
+    counts = {"read": 0, "skipped": 0}
+    copied = target.bulk_upsert(
+        TARGET_TABLE,
+        read_rows(source, batch_size, counts, keys),
+        batch_size=batch_size,
+        column_types=TARGET_COLUMNS,
+    )
+    return copied, counts["skipped"]
+
+
+def delete_stale_rows(target: YDBClient, source_keys: Set[Tuple[int, int]], batch_size: int) -> int:
+    """Delete target rows whose source rows were deleted after being copied"""
+    deleted = 0
+    after = None
+    while True:
+        query, params = build_batch_query(
+            after, batch_size, TARGET_TABLE, "user_id, created_at", created_at_type="Timestamp"
+        )
+        rows = target.execute(query, params)
+        if not rows:
+            return deleted
+
+        stale = [row for row in rows if (row["user_id"], row["created_at"]) not in source_keys]
+        if stale:
+            target.batch([
+                ("delete", TARGET_TABLE, {"user_id": row["user_id"], "created_at": row["created_at"]})
+                for row in stale
+            ])
+            deleted += len(stale)
+        after = (rows[-1]["user_id"], rows[-1]["created_at"])
+
+        if len(rows) < batch_size:
+            return deleted
+
+
+def swap_tables(target: YDBClient):
+    target.execute_scheme(f"ALTER TABLE {SOURCE_TABLE} RENAME TO {BACKUP_TABLE}")
+    target.execute_scheme(f"ALTER TABLE {TARGET_TABLE} RENAME TO {SOURCE_TABLE}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--swap", action="store_true", help="final copy pass, then rename tables")
+    parser.add_argument(
+        "--writes-stopped", action="store_true", help="confirm the bot is stopped (required by --swap)"
+    )
+    args = parser.parse_args()
+    if args.swap and not args.writes_stopped:
+        parser.error("--swap loses writes made while it runs: stop the bot, then add --writes-stopped")
+
+    print("created_at Utf8 -> Timestamp migration")
+    print("=" * 40)
+
+    source = YDBClient(timestamp_columns=[])
+    target = YDBClient(timestamp_columns=["created_at"])
+
+    print(f"Creating table: {TARGET_TABLE}")
+    create_target_table(target)
+
+    print(f"Copying {SOURCE_TABLE} -> {TARGET_TABLE}...")
+    source_keys: Optional[Set[Tuple[int, int]]] = set() if args.swap else None
+    copied, skipped = copy_rows(source, target, args.batch_size, source_keys)
+    print(f"  Done: {copied} copied, {skipped} skipped")
+
+    if args.swap:
+        print(f"Deleting rows removed from {SOURCE_TABLE} during the copy...")
+        print(f"  Done: {delete_stale_rows(target, source_keys, args.batch_size)} deleted")
+        print("Swapping tables...")
+        swap_tables(target)
+        print(f"  {SOURCE_TABLE} now has a Timestamp created_at; old data in {BACKUP_TABLE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,18 +7,20 @@ BDD Reference: NLE-A-11, NLE-A-15 (Confirmation Flow)
 import uuid
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
-from src.services.yagpt_service import YaGPTService, ParsedExpense, CATEGORY_KEYWORDS, CATEGORIES
+from src.services.yagpt_service import AsyncYaGPTService, ParsedExpense, CATEGORY_KEYWORDS, CATEGORIES
 from src.services.speech_service import SpeechService
-from src.services.expense_storage import ExpenseStorage, Expense
+from src.services.expense_storage import ExpenseStorage, AsyncExpenseStorage, Expense, item_key
 
 
 class BotHandlers:
     """Telegram bot message handlers"""
 
     def __init__(self, use_memory_db: bool = True):
-        self.yagpt = YaGPTService()
+        self.yagpt = AsyncYaGPTService()
         self.speech = SpeechService()
         self.storage = ExpenseStorage(use_memory=use_memory_db)
+        # Same backend, awaited by the async handlers
+        self.async_storage = AsyncExpenseStorage.from_storage(self.storage)
         # Pending expenses awaiting confirmation (user_id -> {expense_id: PendingExpense})
         self._pending_expenses: Dict[int, Dict[str, dict]] = {}
 
@@ -79,8 +81,12 @@ class BotHandlers:
 
     async def _handle_expense(self, user_id: int, text: str) -> str:
         """Handle expense message (supports multiple expenses)"""
+        # Categories this user taught for the items in the message win over
+        # keywords and YaGPT
+        learned = await self.async_storage.get_learned_categories(user_id, self.yagpt.candidate_items(text))
+
         # Parse expenses (can be one or multiple)
-        parsed_list = self.yagpt.parse_multiple_expenses(text)
+        parsed_list = await self.yagpt.parse_multiple_expenses(text, lambda item: learned.get(item_key(item)))
 
         if not parsed_list:
             return (
@@ -89,23 +95,33 @@ class BotHandlers:
                 "Или отправь голосовое сообщение."
             )
 
-        # Save all expenses
+        # YaGPT may find items the local rules did not ("обед 1 500")
+        unseen = [p.item for p in parsed_list if item_key(p.item) not in learned]
+        if unseen:
+            learned.update(await self.async_storage.get_learned_categories(user_id, unseen))
         for parsed in parsed_list:
-            expense = Expense(
+            category = learned.get(item_key(parsed.item))
+            if category in CATEGORIES:
+                parsed.category = category
+
+        # Save all expenses in one write
+        await self.async_storage.save_expenses([
+            Expense(
                 user_id=user_id,
                 item=parsed.item,
                 amount=parsed.amount,
                 category=parsed.category
             )
-            self.storage.save_expense(expense)
+            for parsed in parsed_list
+        ])
 
         # Generate confirmation
         return self.yagpt.generate_multiple_confirmation(parsed_list)
 
     async def _handle_report(self, user_id: int) -> str:
         """Handle monthly report request"""
-        totals = self.storage.get_category_totals(user_id)
-        total = self.storage.get_total(user_id)
+        totals = await self.async_storage.get_category_totals(user_id)
+        total = sum(totals.values())
 
         if not totals:
             return (
@@ -117,7 +133,7 @@ class BotHandlers:
 
     async def _handle_top_expenses(self, user_id: int) -> str:
         """Handle top expenses request"""
-        top = self.storage.get_top_categories(user_id)
+        top = await self.async_storage.get_top_categories(user_id)
 
         if not top:
             return "📊 Пока нет расходов за этот месяц."
@@ -140,7 +156,7 @@ class BotHandlers:
         # Clean item name
         item_clean = item.replace("за месяц", "").replace("за неделю", "").strip()
 
-        total = self.storage.get_item_total(user_id, item_clean)
+        total = await self.async_storage.get_item_total(user_id, item_clean)
 
         if total == 0:
             return f"🤷 Не нашёл расходов на «{item_clean}» за этот месяц."
@@ -203,7 +219,7 @@ class BotHandlers:
             amount=pending["amount"],
             category=pending["category"],
         )
-        self.storage.save_expense(expense)
+        await self.async_storage.save_expense(expense, confirmed=True)
 
         emoji_map = {
             "Еда": "🍕", "Транспорт": "🚕", "Развлечения": "🎉",
@@ -281,20 +297,13 @@ class BotHandlers:
 
     async def delete_expense(self, user_id: int, created_at: str) -> Dict[str, Any]:
         """Delete a saved expense by created_at timestamp"""
-        expenses = self.storage.get_expenses(user_id)
-
-        # Find expense with matching created_at
-        target = None
-        for exp in expenses:
-            if exp.created_at.isoformat() == created_at:
-                target = exp
-                break
+        target = await self.async_storage.get_expense(user_id, created_at)
 
         if not target:
             return {"success": False, "message": "Расход не найден"}
 
         # Delete from storage
-        success = self.storage.delete_expense(user_id, created_at)
+        success = await self.async_storage.delete_expense(user_id, created_at)
 
         if success:
             return {
@@ -313,7 +322,7 @@ class BotHandlers:
         if new_category not in CATEGORIES:
             return {"success": False, "message": f"Неизвестная категория: {new_category}"}
 
-        success = self.storage.update_expense_category(user_id, created_at, new_category)
+        success = await self.async_storage.update_expense_category(user_id, created_at, new_category)
 
         if success:
             return {
@@ -328,7 +337,7 @@ class BotHandlers:
 
     async def handle_today(self, user_id: int) -> str:
         """Handle /today command - show today's expenses"""
-        expenses = self.storage.get_today_expenses(user_id)
+        expenses = await self.async_storage.get_today_expenses(user_id)
 
         if not expenses:
             return "📅 Сегодня расходов нет.\n\nНапиши что-нибудь типа `кофе 300`"
@@ -353,8 +362,8 @@ class BotHandlers:
 
     async def handle_week(self, user_id: int) -> str:
         """Handle /week command - show weekly comparison"""
-        this_week = self.storage.get_week_expenses(user_id, weeks_ago=0)
-        last_week = self.storage.get_week_expenses(user_id, weeks_ago=1)
+        this_week = await self.async_storage.get_week_expenses(user_id, weeks_ago=0)
+        last_week = await self.async_storage.get_week_expenses(user_id, weeks_ago=1)
 
         this_week_total = sum(e.amount for e in this_week)
         last_week_total = sum(e.amount for e in last_week)
@@ -390,7 +399,7 @@ class BotHandlers:
             return {"success": False, "message": "Бюджет должен быть больше 0"}
 
         # Save budget to database
-        self.storage.save_budget(user_id, amount)
+        await self.async_storage.save_budget(user_id, amount)
 
         return {
             "success": True,
@@ -398,13 +407,13 @@ class BotHandlers:
                        f"Буду следить за расходами и предупреждать о превышении.",
         }
 
-    def get_user_budget(self, user_id: int) -> Optional[int]:
+    async def get_user_budget(self, user_id: int) -> Optional[int]:
         """Get user's budget from database"""
-        return self.storage.get_budget(user_id)
+        return await self.async_storage.get_budget(user_id)
 
     async def get_budget_status(self, user_id: int) -> Dict[str, Any]:
         """Get budget status with progress"""
-        budget = self.get_user_budget(user_id)
+        budget = await self.async_storage.get_budget(user_id)
 
         if not budget:
             return {
@@ -414,7 +423,7 @@ class BotHandlers:
             }
 
         # Get current month total
-        total_spent = self.storage.get_total(user_id)
+        total_spent = await self.async_storage.get_total(user_id)
         remaining = budget - total_spent
         percentage = min(100, (total_spent / budget) * 100)
 
@@ -450,11 +459,11 @@ class BotHandlers:
 
     async def check_budget_warning(self, user_id: int) -> Optional[str]:
         """Check if budget warning should be shown after adding expense"""
-        budget = self.get_user_budget(user_id)
+        budget = await self.async_storage.get_budget(user_id)
         if not budget:
             return None
 
-        total = self.storage.get_total(user_id)
+        total = await self.async_storage.get_total(user_id)
         percentage = (total / budget) * 100
 
         if percentage >= 100:
@@ -471,7 +480,8 @@ class BotHandlers:
 
     async def handle_undo(self, user_id: int) -> Dict[str, Any]:
         """Handle /undo command - delete last expense"""
-        last_expense = self.storage.get_last_expense(user_id)
+        # Find and delete the last expense in one storage call
+        last_expense = await self.async_storage.pop_last_expense(user_id)
 
         if not last_expense:
             return {
@@ -479,9 +489,6 @@ class BotHandlers:
                 "message": "🤷 Нечего отменять — расходов пока нет.",
             }
 
-        # Delete the expense
-        self.storage.delete_expense(user_id, last_expense.created_at.isoformat())
-
         return {
             "success": True,
             "message": f"↩️ Удалено: {last_expense.item} — {last_expense.amount}₽ ({last_expense.category})",
@@ -489,7 +496,7 @@ class BotHandlers:
 
     async def handle_export(self, user_id: int, period: str = "month") -> Dict[str, Any]:
         """Handle /export command - generate CSV export"""
-        expenses = self.storage.get_monthly_expenses(user_id)
+        expenses = await self.async_storage.get_monthly_expenses(user_id)
 
         if not expenses:
             return {
@@ -530,16 +537,13 @@ class BotHandlers:
 
     async def handle_find(self, user_id: int, query: str) -> Dict[str, Any]:
         """Handle /find command - search expenses"""
-        expenses = self.storage.get_monthly_expenses(user_id)
-
         if not query:
             return {
                 "success": False,
                 "message": "🔍 Укажите что искать: `/find кофе`",
             }
 
-        query_lower = query.lower()
-        matches = [e for e in expenses if query_lower in e.item.lower()]
+        matches = await self.async_storage.find_expenses(user_id, query)
 
         if not matches:
             return {
@@ -571,9 +575,9 @@ class BotHandlers:
     # Analytics and Visualization (NLE-A-20)
     # ═══════════════════════════════════════════════════════════
 
-    def generate_ascii_chart(self, user_id: int, max_bar_length: int = 15) -> str:
+    async def generate_ascii_chart(self, user_id: int, max_bar_length: int = 15) -> str:
         """Generate ASCII bar chart for category totals"""
-        totals = self.storage.get_category_totals(user_id)
+        totals = await self.async_storage.get_category_totals(user_id)
 
         if not totals:
             return "📊 Нет данных для графика"
@@ -606,7 +610,7 @@ class BotHandlers:
 
     async def handle_day_stats(self, user_id: int) -> Dict[str, Any]:
         """Handle day-of-week statistics command"""
-        expenses = self.storage.get_monthly_expenses(user_id)
+        expenses = await self.async_storage.get_monthly_expenses(user_id)
 
         if not expenses:
             return {
@@ -5,10 +5,12 @@ Expense tracker bot with YaGPT and Yandex SpeechKit integration.
 Supports both webhook mode (for production) and polling mode (for local dev).
 """
 import os
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -322,12 +324,21 @@ async def lifespan(app: FastAPI):
     """FastAPI lifespan handler - initialize and cleanup PTB"""
     global ptb_app
     ptb_app = create_ptb_application()
-    await ptb_app.initialize()
+    # Warm the YDB driver and session pool while PTB initializes, so the
+    # first user after a cold start does not pay for connection setup
+    _, storage_ready = await asyncio.gather(
+        ptb_app.initialize(),
+        bot_handlers.async_storage.warmup(),
+    )
+    if not storage_ready:
+        logger.warning("Storage warmup failed, retrying in background")
     await ptb_app.start()
     logger.info("Bot started in webhook mode")
     yield
     await ptb_app.stop()
     await ptb_app.shutdown()
+    await bot_handlers.async_storage.close()
+    await bot_handlers.yagpt.close()
     logger.info("Bot stopped")
 
 
@@ -343,7 +354,9 @@ async def root():
 
 @app.get("/health")
 async def health():
-    """Health check for container orchestration"""
+    """Health check for container orchestration (ready once storage is warm)"""
+    if not bot_handlers.async_storage.ready:
+        return JSONResponse(status_code=503, content={"status": "warming"})
     return {"status": "healthy"}
 
 
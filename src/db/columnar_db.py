@@ -0,0 +1,337 @@
+"""
+Columnar in-memory backend for expense rows.
+
+Each user's expenses are kept in parallel typed arrays sorted by
+created_at (epoch micros), with category and item strings interned into
+small integer codes. Range scans bisect the time column and aggregations
+loop over array slices without building per-row dicts or datetimes.
+Rows are returned with created_at as epoch micros, which Expense.from_row
+takes as is.
+"""
+import bisect
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.db.timestamps import to_micros
+from src.db.ydb_client import MemoryDB
+
+
+class _StringTable:
+    """Interned strings addressed by integer code"""
+
+    __slots__ = ('codes', 'values')
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class _UserColumns:
+    """One user's expenses as parallel arrays sorted by created_at"""
+
+    __slots__ = ('created_at', 'amount', 'category', 'item', 'item_key')
+
+    def __init__(self):
+        self.created_at = array('q')
+        self.amount = array('q')
+        self.category = array('H')
+        self.item = array('l')
+        self.item_key = array('l')
+
+    def __len__(self) -> int:
+        return len(self.created_at)
+
+    def put(self, micros: int, amount: int, category: int, item: int, item_key: int):
+        """Insert or replace the row keyed by `micros`"""
+        ts = self.created_at
+        if not ts or ts[-1] < micros:
+            ts.append(micros)
+            self.amount.append(amount)
+            self.category.append(category)
+            self.item.append(item)
+            self.item_key.append(item_key)
+            return
+
+        i = bisect.bisect_left(ts, micros)
+        if i < len(ts) and ts[i] == micros:
+            self.amount[i] = amount
+            self.category[i] = category
+            self.item[i] = item
+            self.item_key[i] = item_key
+            return
+
+        ts.insert(i, micros)
+        self.amount.insert(i, amount)
+        self.category.insert(i, category)
+        self.item.insert(i, item)
+        self.item_key.insert(i, item_key)
+
+    def remove_at(self, indexes: Iterable[int]):
+        for i in sorted(indexes, reverse=True):
+            del self.created_at[i]
+            del self.amount[i]
+            del self.category[i]
+            del self.item[i]
+            del self.item_key[i]
+
+    def span(self, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[int, int]:
+        """Index range [lo, hi) of rows with start <= created_at < end"""
+        lo = bisect.bisect_left(self.created_at, start) if start is not None else 0
+        hi = bisect.bisect_left(self.created_at, end) if end is not None else len(self)
+        return lo, hi
+
+
+class ColumnarMemoryDB(MemoryDB):
+    """MemoryDB variant storing expense tables column-wise.
+
+    Tables listed in `columnar_tables` must have the expense schema
+    (user_id, created_at, amount, category, item, item_key) keyed by
+    (user_id, created_at); all other tables use the row-based MemoryDB.
+    """
+
+    COLUMNS = ('user_id', 'created_at', 'amount', 'category', 'item', 'item_key')
+
+    def __init__(self, columnar_tables: Iterable[str] = ('expenses',)):
+        super().__init__()
+        self.columnar_tables = set(columnar_tables)
+        self.columns: Dict[str, Dict[int, _UserColumns]] = {t: {} for t in self.columnar_tables}
+        self.categories = _StringTable()
+        self.items = _StringTable()
+
+    # ── helpers ─────────────────────────────────────────────
+
+    def _column_users(self, table: str, where: Optional[dict]) -> List[Tuple[int, _UserColumns]]:
+        users = self.columns[table]
+        if where and 'user_id' in where:
+            user_id = int(where['user_id'])
+            cols = users.get(user_id)
+            return [(user_id, cols)] if cols else []
+        return list(users.items())
+
+    def _column_candidates(self, cols: _UserColumns, where: Optional[dict]) -> range:
+        if where and 'created_at' in where:
+            micros = to_micros(where['created_at'])
+            return range(*cols.span(micros, micros + 1))
+        return range(len(cols))
+
+    def _column_matches(self, cols: _UserColumns, i: int, where: Optional[dict]) -> bool:
+        for k, v in (where or {}).items():
+            if k in ('user_id', 'created_at'):
+                continue  # resolved by _column_users / _column_candidates
+            if k == 'amount':
+                if cols.amount[i] != int(v):
+                    return False
+            elif k == 'category':
+                if self.categories.values[cols.category[i]] != v:
+                    return False
+            elif k == 'item':
+                if self.items.values[cols.item[i]] != v:
+                    return False
+            elif k == 'item_key':
+                if self.items.values[cols.item_key[i]] != v:
+                    return False
+            else:
+                return False
+        return True
+
+    def _row(self, user_id: int, cols: _UserColumns, i: int) -> Dict[str, Any]:
+        return {
+            'user_id': user_id,
+            'created_at': cols.created_at[i],
+            'amount': cols.amount[i],
+            'category': self.categories.values[cols.category[i]],
+            'item': self.items.values[cols.item[i]],
+            'item_key': self.items.values[cols.item_key[i]],
+        }
+
+    def _put(self, table: str, data: dict):
+        users = self.columns[table]
+        user_id = int(data.get('user_id') or 0)
+        cols = users.get(user_id)
+        if cols is None:
+            cols = users[user_id] = _UserColumns()
+        cols.put(
+            to_micros(data['created_at']),
+            int(data.get('amount') or 0),
+            self.categories.code(str(data.get('category', 'Другое'))),
+            self.items.code(str(data.get('item', ''))),
+            self.items.code(str(data.get('item_key', ''))),
+        )
+
+    # ── MemoryDB interface ──────────────────────────────────
+
+    def insert(self, table: str, data: dict) -> bool:
+        if table not in self.columnar_tables:
+            return super().insert(table, data)
+        self._put(table, data)
+        return True
+
+    def insert_many(self, table: str, rows: List[dict]) -> bool:
+        if table not in self.columnar_tables:
+            return super().insert_many(table, rows)
+        for row in rows:
+            self._put(table, row)
+        return True
+
+    def select(
+        self,
+        table: str,
+        where: dict = None,
+        limit: int = 100,
+        tx_mode: Optional[str] = None,
+        view: Optional[str] = None,
+    ) -> List[Dict]:
+        if table not in self.columnar_tables:
+            return super().select(table, where, limit)
+        results = []
+        for user_id, cols in self._column_users(table, where):
+            for i in self._column_candidates(cols, where):
+                if self._column_matches(cols, i, where):
+                    results.append(self._row(user_id, cols, i))
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def select_range(
+        self, table: str, where: dict, column: str, start, end, tx_mode: Optional[str] = None
+    ) -> List[Dict]:
+        if table not in self.columnar_tables:
+            return super().select_range(table, where, column, start, end)
+        if column != 'created_at':
+            raise ValueError(f"Columnar range scans only support created_at, got: {column}")
+        lo_micros, hi_micros = to_micros(start), to_micros(end)
+        results = []
+        for user_id, cols in self._column_users(table, where):
+            lo, hi = cols.span(lo_micros, hi_micros)
+            results.extend(
+                self._row(user_id, cols, i)
+                for i in range(lo, hi)
+                if self._column_matches(cols, i, where)
+            )
+        if not (where and 'user_id' in where):
+            results.sort(key=lambda r: r['created_at'])
+        return results
+
+    def select_page(
+        self,
+        table: str,
+        where: dict,
+        column: str,
+        start=None,
+        end=None,
+        after=None,
+        limit: int = 100,
+        tx_mode: Optional[str] = None,
+        view: Optional[str] = None,
+        descending: bool = False,
+    ) -> List[Dict]:
+        if table not in self.columnar_tables:
+            return super().select_page(table, where, column, start, end, after, limit, descending=descending)
+        if column != 'created_at':
+            raise ValueError(f"Columnar pages only by created_at, got: {column}")
+        lo_micros = to_micros(start) if start is not None else None
+        hi_micros = to_micros(end) if end is not None else None
+        results = []
+        for user_id, cols in self._column_users(table, where):
+            lo, hi = cols.span(lo_micros, hi_micros)
+            if after is not None and descending:
+                hi = min(hi, bisect.bisect_left(cols.created_at, to_micros(after)))
+            elif after is not None:
+                lo = max(lo, bisect.bisect_right(cols.created_at, to_micros(after)))
+            for i in (range(hi - 1, lo - 1, -1) if descending else range(lo, hi)):
+                if self._column_matches(cols, i, where):
+                    results.append(self._row(user_id, cols, i))
+                    if len(results) >= limit and where and 'user_id' in where:
+                        return results
+        results.sort(key=lambda r: r['created_at'], reverse=descending)
+        return results[:limit]
+
+    def aggregate(
+        self,
+        table: str,
+        where: dict,
+        column: str,
+        start,
+        end,
+        group_by: str,
+        value: str,
+        tx_mode: Optional[str] = None,
+        view: Optional[str] = None,
+    ) -> List[Dict]:
+        if table not in self.columnar_tables:
+            return super().aggregate(table, where, column, start, end, group_by, value)
+        if column != 'created_at' or group_by not in ('category', 'item') or value != 'amount':
+            raise ValueError(f"Unsupported columnar aggregation: {group_by}/{value} over {column}")
+
+        names = self.categories if group_by == 'category' else self.items
+        totals: Dict[int, int] = {}
+        counts: Dict[int, int] = {}
+        lo_micros, hi_micros = to_micros(start), to_micros(end)
+        filtered = {k: v for k, v in (where or {}).items() if k != 'user_id'}
+
+        for _, cols in self._column_users(table, where):
+            lo, hi = cols.span(lo_micros, hi_micros)
+            codes = getattr(cols, group_by)
+            if filtered:
+                positions = [i for i in range(lo, hi) if self._column_matches(cols, i, filtered)]
+                pairs = ((codes[i], cols.amount[i]) for i in positions)
+            else:
+                pairs = zip(codes[lo:hi], cols.amount[lo:hi])
+            for code, amount in pairs:
+                totals[code] = totals.get(code, 0) + amount
+                counts[code] = counts.get(code, 0) + 1
+
+        return [
+            {group_by: names.values[code], 'total': total, 'count': counts[code]}
+            for code, total in totals.items()
+        ]
+
+    def delete(self, table: str, where: dict) -> bool:
+        if table not in self.columnar_tables:
+            return super().delete(table, where)
+        users = self.columns[table]
+        for user_id, cols in self._column_users(table, where):
+            cols.remove_at([i for i in self._column_candidates(cols, where) if self._column_matches(cols, i, where)])
+            if not len(cols):
+                del users[user_id]
+        return True
+
+    def update(self, table: str, where: dict, data: dict) -> bool:
+        if table not in self.columnar_tables:
+            return super().update(table, where, data)
+        unknown = set(data) - set(self.COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+
+        rekey = 'user_id' in data or 'created_at' in data
+        moved = []
+        updated = False
+        for user_id, cols in self._column_users(table, where):
+            matched = [i for i in self._column_candidates(cols, where) if self._column_matches(cols, i, where)]
+            for i in matched:
+                updated = True
+                if rekey:
+                    moved.append({**self._row(user_id, cols, i), **data})
+                    continue
+                if 'amount' in data:
+                    cols.amount[i] = int(data['amount'])
+                if 'category' in data:
+                    cols.category[i] = self.categories.code(str(data['category']))
+                if 'item' in data:
+                    cols.item[i] = self.items.code(str(data['item']))
+                if 'item_key' in data:
+                    cols.item_key[i] = self.items.code(str(data['item_key']))
+            if rekey and matched:
+                cols.remove_at(matched)
+
+        for row in moved:
+            self._put(table, row)
+        return updated
@@ -0,0 +1,260 @@
+"""
+YDB schema of the bot tables and its migrations.
+
+scripts/init_ydb.py applies the migrations missing from the
+schema_version table; at runtime ExpenseStorage only compares the
+recorded version with SCHEMA_VERSION.
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+EXPENSES_TABLE = "expenses"
+SETTINGS_TABLE = "user_settings"
+ROLLUP_TABLE = "expense_rollups"
+SCHEMA_VERSION_TABLE = "schema_version"
+ITEM_CATEGORY_TABLE = "item_categories"
+
+CATEGORY_INDEX = "idx_user_category"
+ITEM_INDEX = "idx_user_item"
+
+# Global secondary indexes of the expenses table
+EXPENSE_INDEXES: Dict[str, str] = {
+    CATEGORY_INDEX: "GLOBAL ON (user_id, category, created_at) COVER (item, item_key, amount)",
+    ITEM_INDEX: "GLOBAL ON (user_id, item_key, created_at) COVER (item, category, amount)",
+}
+
+# Rollup month (YYYY-MM) of an expense row in YQL: cut from the ISO text, so it
+# works for a Timestamp created_at and for the Utf8 one of unmigrated tables
+CREATED_MONTH = "CAST(SUBSTRING(CAST(created_at AS String), 0, 7) AS Utf8)"
+
+# Telegram user ids are positive and (so far) below 2**33; initial split
+# points are spread evenly over this range. UNIFORM_PARTITIONS would need
+# an unsigned leading key column, and the tables are keyed by Int64 user_id.
+#
+# Telegram issues ids roughly in sequence, so the bot's active (mostly
+# recent) users sit in one or two of these ranges: the initial split only
+# spreads old users and does not balance the write load. That is left to
+# AUTO_PARTITIONING_BY_LOAD, which splits the hot ranges within minutes;
+# spreading writes from the start would need a hashed leading key column.
+USER_ID_SPACE = 2 ** 33
+
+
+def partition_limits() -> Dict[str, int]:
+    """Partition size and count limits (YDB_PARTITION_SIZE_MB, YDB_MIN/MAX_PARTITIONS)"""
+    min_partitions = int(os.getenv('YDB_MIN_PARTITIONS', '4'))
+    return {
+        'size_mb': int(os.getenv('YDB_PARTITION_SIZE_MB', '512')),
+        'min': min_partitions,
+        'max': max(min_partitions, int(os.getenv('YDB_MAX_PARTITIONS', '64'))),
+    }
+
+
+def split_points(partitions: int, space: int = USER_ID_SPACE) -> List[int]:
+    """user_id boundaries cutting [0, space) into `partitions` equal ranges"""
+    return [space * i // partitions for i in range(1, partitions)]
+
+
+def partitioning_settings(initial_split: bool = True, limits: Optional[Dict[str, int]] = None) -> List[str]:
+    """Auto-partitioning settings by size and load, with min/max partition counts.
+
+    `initial_split` adds PARTITION_AT_KEYS, which only CREATE TABLE accepts.
+    """
+    limits = limits or partition_limits()
+    settings = [
+        "AUTO_PARTITIONING_BY_SIZE = ENABLED",
+        f"AUTO_PARTITIONING_PARTITION_SIZE_MB = {int(limits['size_mb'])}",
+        "AUTO_PARTITIONING_BY_LOAD = ENABLED",
+        f"AUTO_PARTITIONING_MIN_PARTITIONS_COUNT = {int(limits['min'])}",
+        f"AUTO_PARTITIONING_MAX_PARTITIONS_COUNT = {int(limits['max'])}",
+    ]
+    if initial_split and limits['min'] > 1:
+        keys = ', '.join(str(k) for k in split_points(limits['min']))
+        settings.append(f"PARTITION_AT_KEYS = ({keys})")
+    return settings
+
+
+def _with(settings: List[str]) -> str:
+    return "WITH (\n    " + ",\n    ".join(settings) + "\n)"
+
+
+def expenses_table_ddl(table: str = EXPENSES_TABLE, limits: Optional[Dict[str, int]] = None) -> str:
+    indexes = "".join(f",\n    INDEX {name} {definition}" for name, definition in EXPENSE_INDEXES.items())
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table} (\n"
+        "    user_id Int64,\n"
+        "    item Utf8,\n"
+        "    amount Int64,\n"
+        "    category Utf8,\n"
+        "    created_at Timestamp,\n"
+        "    item_key Utf8,\n"
+        f"    PRIMARY KEY (user_id, created_at){indexes}\n"
+        f") {_with(partitioning_settings(limits=limits))}"
+    )
+
+
+def settings_table_ddl(table: str = SETTINGS_TABLE, limits: Optional[Dict[str, int]] = None) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table} (\n"
+        "    user_id Int64,\n"
+        "    budget Int64,\n"
+        "    PRIMARY KEY (user_id)\n"
+        f") {_with(partitioning_settings(limits=limits))}"
+    )
+
+
+def rollup_table_ddl(table: str = ROLLUP_TABLE, limits: Optional[Dict[str, int]] = None) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table} (\n"
+        "    user_id Int64,\n"
+        "    month Utf8,\n"
+        "    category Utf8,\n"
+        "    total Int64,\n"
+        "    expense_count Int64,\n"
+        "    PRIMARY KEY (user_id, month, category)\n"
+        f") {_with(partitioning_settings(limits=limits))}"
+    )
+
+
+def item_category_table_ddl(table: str = ITEM_CATEGORY_TABLE, limits: Optional[Dict[str, int]] = None) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table} (\n"
+        "    user_id Int64,\n"
+        "    item_key Utf8,\n"
+        "    category Utf8,\n"
+        "    PRIMARY KEY (user_id, item_key)\n"
+        f") {_with(partitioning_settings(limits=limits))}"
+    )
+
+
+def partitioning_alter_statements(table: str, indexes: Optional[List[str]] = None) -> List[str]:
+    """ALTER statements applying the partitioning settings to an existing table and its indexes"""
+    settings = ", ".join(partitioning_settings(initial_split=False))
+    statements = [f"ALTER TABLE {table} SET ({settings})"]
+    for index in indexes or []:
+        statements.append(f"ALTER TABLE {table} ALTER INDEX {index} SET ({settings})")
+    return statements
+
+
+def schema_version_table_ddl(table: str = SCHEMA_VERSION_TABLE) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table} (\n"
+        "    version Int64,\n"
+        "    description Utf8,\n"
+        "    applied_at Timestamp,\n"
+        "    PRIMARY KEY (version)\n"
+        ")"
+    )
+
+
+@dataclass(frozen=True)
+class Migration:
+    """One schema step: DDL statements, then data statements, then backfills.
+
+    A backfill statement declares $from_user_id and $to_user_id and is run
+    once per user_id range (see backfill_ranges), so no single request
+    rewrites the whole table.
+    """
+    version: int
+    description: str
+    scheme: List[str] = field(default_factory=list)
+    data: List[str] = field(default_factory=list)
+    backfill: List[str] = field(default_factory=list)
+
+
+# Version the running code expects; the last entry of migrations()
+SCHEMA_VERSION = 5
+
+# user_id ranges per backfill statement; the first and last are open-ended
+BACKFILL_RANGES = 256
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def backfill_ranges(ranges: int = BACKFILL_RANGES) -> List[Tuple[int, int]]:
+    """[from, to) user_id ranges covering every Int64 key"""
+    bounds = [INT64_MIN, *split_points(ranges), INT64_MAX]
+    return list(zip(bounds, bounds[1:]))
+
+
+_BACKFILL_RANGE = """
+            DECLARE $from_user_id AS Int64;
+            DECLARE $to_user_id AS Int64;"""
+
+
+def migrations() -> List[Migration]:
+    """All migrations in version order.
+
+    Each migration's DDL is the schema as of its own version; the *_ddl()
+    helpers above describe the current schema. Built on call, so the
+    partitioning settings follow the current environment. Scheme
+    statements failing with "already exists" are treated as applied, which
+    lets databases created before the schema_version table (whose tables
+    the bot created on startup) catch up.
+    """
+    return [
+        Migration(1, "expenses, user_settings and expense_rollups tables", scheme=[
+            f"""CREATE TABLE IF NOT EXISTS {EXPENSES_TABLE} (
+                user_id Int64,
+                item Utf8,
+                amount Int64,
+                category Utf8,
+                created_at Timestamp,
+                PRIMARY KEY (user_id, created_at)
+            )""",
+            f"""CREATE TABLE IF NOT EXISTS {SETTINGS_TABLE} (
+                user_id Int64,
+                budget Int64,
+                PRIMARY KEY (user_id)
+            )""",
+            f"""CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+                user_id Int64,
+                month Utf8,
+                category Utf8,
+                total Int64,
+                expense_count Int64,
+                PRIMARY KEY (user_id, month, category)
+            )""",
+        ]),
+        Migration(2, "expenses.item_key and secondary indexes", scheme=[
+            f"ALTER TABLE {EXPENSES_TABLE} ADD COLUMN item_key Utf8",
+            f"ALTER TABLE {EXPENSES_TABLE} ADD INDEX {CATEGORY_INDEX} "
+            "GLOBAL ON (user_id, category, created_at) COVER (item, item_key, amount)",
+            f"ALTER TABLE {EXPENSES_TABLE} ADD INDEX {ITEM_INDEX} "
+            "GLOBAL ON (user_id, item_key, created_at) COVER (item, category, amount)",
+        ], backfill=[
+            # Rows written before item_key existed (item_key() also collapses inner spaces)
+            f"""{_BACKFILL_RANGE}
+            UPDATE {EXPENSES_TABLE}
+            SET item_key = Unicode::ReplaceAll(Unicode::ToLower(Unicode::Strip(item)), "ё", "е")
+            WHERE user_id >= $from_user_id AND user_id < $to_user_id AND item_key IS NULL
+            """,
+        ]),
+        Migration(3, "auto-partitioning by size and load", scheme=[
+            *partitioning_alter_statements(EXPENSES_TABLE, [CATEGORY_INDEX, ITEM_INDEX]),
+            *partitioning_alter_statements(SETTINGS_TABLE),
+            *partitioning_alter_statements(ROLLUP_TABLE),
+        ]),
+        Migration(4, "per-user learned item categories", scheme=[
+            f"""CREATE TABLE IF NOT EXISTS {ITEM_CATEGORY_TABLE} (
+                user_id Int64,
+                item_key Utf8,
+                category Utf8,
+                PRIMARY KEY (user_id, item_key)
+            ) {_with(partitioning_settings())}""",
+        ]),
+        Migration(5, "backfill expense_rollups from expenses", backfill=[
+            # Recomputes every month from raw rows, so it is safe to re-run
+            f"""{_BACKFILL_RANGE}
+            UPSERT INTO {ROLLUP_TABLE} (user_id, month, category, total, expense_count)
+            SELECT user_id, month, category, SUM(amount) AS total, COUNT(*) AS expense_count
+            FROM {EXPENSES_TABLE}
+            WHERE user_id >= $from_user_id AND user_id < $to_user_id
+            GROUP BY user_id, {CREATED_MONTH} AS month, category
+            """,
+        ]),
+    ]
+
+
+def pending_migrations(current_version: int) -> List[Migration]:
+    """Migrations newer than `current_version`, in order"""
+    return [m for m in migrations() if m.version > current_version]
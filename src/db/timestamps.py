@@ -0,0 +1,27 @@
+"""
+Timestamp helpers shared by storage backends.
+
+Timestamps are naive local datetimes (as produced by datetime.now()),
+stored as integer microseconds since 1970-01-01.
+"""
+from datetime import datetime, timedelta
+from typing import Union
+
+EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_micros(value: Union[datetime, str, int]) -> int:
+    """Convert datetime, ISO string or micros to epoch microseconds"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return (value - EPOCH) // _MICROSECOND
+
+
+def from_micros(micros: int) -> datetime:
+    """Convert epoch microseconds to naive datetime"""
+    return EPOCH + timedelta(microseconds=micros)
@@ -5,7 +5,27 @@ YDB Client for Yandex Database (Serverless)
 import os
 import json
 import re
-from typing import Optional, List, Dict, Any, Tuple
+import asyncio
+import bisect
+import itertools
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Tuple, Iterable, Iterator, Callable
+
+from src.db import schema
+from src.db.timestamps import from_micros, to_micros
+
+# Python conversion per primitive YDB type, and the zero value bound for None
+_PRIMITIVE_CASTS: Dict[str, Callable[[Any], Any]] = {
+    **{t: int for t in ('Int8', 'Int16', 'Int32', 'Int64', 'Uint8', 'Uint16', 'Uint32', 'Uint64')},
+    'Float': float,
+    'Double': float,
+    'Bool': bool,
+}
+_ZERO_VALUES: Dict[str, Any] = {
+    **{t: cast() for t, cast in _PRIMITIVE_CASTS.items()},
+    'Timestamp': 0,
+}
 
 # YDB SDK is optional - works without it for basic operations
 try:
@@ -14,15 +34,77 @@ try:
 except ImportError:
     HAS_YDB = False
 
+try:
+    import ydb.aio
+    HAS_YDB_AIO = True
+except ImportError:
+    HAS_YDB_AIO = False
+
+
+class Prefix(str):
+    """`where` value matching strings that start with it.
+
+    Compiled to a key range (`col >= $p AND col < $p_end`), so a prefix
+    lookup on a key or index column reads only matching rows. In-memory
+    backends compare it with ==, which is overridden to startswith().
+    """
+
+    # Appended to the prefix for the exclusive upper bound (highest code point)
+    UPPER = '\U0010ffff'
+
+    def __eq__(self, other):
+        return isinstance(other, str) and other.startswith(self)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = str.__hash__
+
+
+def _chunks(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    """Split an iterable of rows into lists of at most `size` rows"""
+    it = iter(rows)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
 
 class YDBClient:
     """Yandex Database client for serverless YDB"""
-    
-    def __init__(self):
+
+    # Memoized statement texts per (kind, table, columns, types) (LRU)
+    TEMPLATE_CACHE_SIZE = 512
+    # Rows per BulkUpsert call and calls kept in flight by bulk_upsert()
+    BULK_BATCH_SIZE = 1000
+    BULK_MAX_IN_FLIGHT = 4
+    # execute(tx_mode=...) -> ydb transaction settings class
+    TX_MODES = {
+        None: None,
+        'serializable': 'SerializableReadWrite',
+        'snapshot': 'SnapshotReadOnly',
+        'stale': 'StaleReadOnly',
+        'online': 'OnlineReadOnly',
+    }
+
+    # Columns that may be stored as native Timestamp (Utf8 in tables created
+    # before scripts/migrate_created_at.py ran)
+    TIMESTAMP_COLUMNS = ('created_at',)
+
+    def __init__(self, timestamp_columns: Optional[Iterable[str]] = None):
         self.endpoint = os.getenv('YDB_ENDPOINT', '')
         self.database = os.getenv('YDB_DATABASE', '')
         self.driver = None
         self.pool = None
+        # Columns bound as native Timestamp. YDB_TIMESTAMP_COLUMNS pins them
+        # ("" = all Utf8); unset, they are read from the expenses table on connect
+        env_columns = os.getenv('YDB_TIMESTAMP_COLUMNS')
+        self.detect_timestamps = timestamp_columns is None and env_columns is None
+        if timestamp_columns is None:
+            timestamp_columns = self.TIMESTAMP_COLUMNS if env_columns is None else env_columns.split(',')
+        self.timestamp_columns = {c.strip() for c in timestamp_columns if c.strip()}
+        self._templates: "OrderedDict[tuple, Any]" = OrderedDict()
     
     def _get_credentials(self):
         """Get YDB credentials"""
@@ -49,11 +131,11 @@ class YDBClient:
     
     def connect(self):
         """Establish connection to YDB"""
-        if not HAS_YDB:
-            raise RuntimeError("YDB SDK not installed. Run: pip install ydb")
-        
         if self.driver:
             return
+
+        if not HAS_YDB:
+            raise RuntimeError("YDB SDK not installed. Run: pip install ydb")
         
         driver_config = ydb.DriverConfig(
             endpoint=self.endpoint,
@@ -64,21 +146,60 @@ class YDBClient:
         self.driver = ydb.Driver(driver_config)
         self.driver.wait(timeout=10)
         self.pool = ydb.SessionPool(self.driver)
+        if self.detect_timestamps:
+            self.detect_timestamp_columns()
+
+    def _stored_timestamp_columns(self, description) -> set:
+        """TIMESTAMP_COLUMNS that the described table stores as Timestamp"""
+        return {
+            column.name for column in description.columns
+            if column.name in self.TIMESTAMP_COLUMNS and 'Timestamp' in str(column.type)
+        }
+
+    def _timestamps_detected(self, description) -> bool:
+        columns = self._stored_timestamp_columns(description)
+        if columns != self.timestamp_columns:
+            self.timestamp_columns = columns
+            self._templates.clear()
+        self.detect_timestamps = False
+        return True
+
+    def detect_timestamp_columns(self) -> bool:
+        """Bind columns as Timestamp or Utf8 as the expenses table stores them.
+
+        Tables created before scripts/migrate_created_at.py keep a Utf8
+        created_at. On failure the current binding is kept; the async
+        client retries on its next warmup or keepalive round.
+        """
+        try:
+            description = self.pool.retry_operation_sync(
+                lambda session: session.describe_table(self._table_path(schema.EXPENSES_TABLE))
+            )
+        except Exception as e:
+            print(f"YDB column type check error: {e}")
+            return False
+        return self._timestamps_detected(description)
     
-    def execute(self, query: str, parameters: dict = None) -> List[Dict]:
-        """Execute YQL query"""
+    def execute(self, query: str, parameters: dict = None, tx_mode: Optional[str] = None) -> List[Dict]:
+        """Execute YQL query.
+
+        `tx_mode` is one of TX_MODES; the default is a serializable
+        read-write transaction. Read-only modes take no locks.
+        """
         self.connect()
-        
+        tx_settings = self._tx_settings(tx_mode)
+
         def callee(session):
             if parameters:
+                # the SDK keeps prepared queries in a per-session LRU
                 prepared = session.prepare(query)
-                result_sets = session.transaction().execute(
+                result_sets = self._transaction(session, tx_settings).execute(
                     prepared,
                     parameters,
                     commit_tx=True
                 )
             else:
-                result_sets = session.transaction().execute(
+                result_sets = self._transaction(session, tx_settings).execute(
                     query,
                     commit_tx=True
                 )
@@ -86,11 +207,64 @@ class YDBClient:
             results = []
             for result_set in result_sets:
                 for row in result_set.rows:
-                    results.append(dict(row))
+                    results.append(self._decode_row(row))
             return results
         
         return self.pool.retry_operation_sync(callee)
 
+    def execute_many(self, statements: List[Tuple[str, Optional[dict]]], tx_mode: Optional[str] = None) -> List[Dict]:
+        """Run several parameterized statements in one request and one commit.
+
+        Statements share one query, so named expressions ($name = ...) of
+        earlier statements are visible to later ones; parameter names must
+        be unique across statements. Returns the rows of every SELECT.
+        """
+        query, params = self._join_statements(statements)
+        return self.execute(query, params or None, tx_mode=tx_mode)
+
+    @staticmethod
+    def _join_statements(statements: List[Tuple[str, Optional[dict]]]) -> Tuple[str, dict]:
+        texts = []
+        params = {}
+        for text, statement_params in statements:
+            for name, value in (statement_params or {}).items():
+                if name in params:
+                    raise ValueError(f"Duplicate parameter across statements: {name}")
+                params[name] = value
+            texts.append(text)
+        return '\n'.join(texts), params
+
+    def _tx_settings(self, tx_mode: Optional[str]):
+        """ydb transaction settings for `tx_mode` (None: SDK default, serializable)"""
+        if tx_mode not in self.TX_MODES:
+            raise ValueError(f"Unknown transaction mode: {tx_mode}")
+        name = self.TX_MODES[tx_mode]
+        return getattr(ydb, name)() if name else None
+
+    @staticmethod
+    def _transaction(session, tx_settings):
+        return session.transaction(tx_settings) if tx_settings is not None else session.transaction()
+
+    def execute_scheme(self, query: str):
+        """Execute YQL scheme (DDL) query outside of a data transaction"""
+        self.connect()
+
+        def callee(session):
+            session.execute_scheme(query)
+
+        self.pool.retry_operation_sync(callee)
+
+    def _decode_row(self, row) -> Dict:
+        """Convert result row to dict, normalizing timestamps to epoch micros"""
+        data = dict(row)
+        for column in self.timestamp_columns:
+            value = data.get(column)
+            if isinstance(value, datetime):
+                if value.tzinfo is not None:
+                    value = value.astimezone(timezone.utc).replace(tzinfo=None)
+                data[column] = to_micros(value)
+        return data
+
     def _validate_table_name(self, table: str) -> str:
         """Validate table name to prevent injection.
 
@@ -100,213 +274,1269 @@ class YDBClient:
             raise ValueError(f"Invalid table name: {table}")
         return table
 
+    def _from(self, table: str, view: Optional[str] = None) -> str:
+        """FROM target: a table, or one of its secondary indexes (VIEW)"""
+        table = self._validate_table_name(table)
+        if view is None:
+            return table
+        return f"{table} VIEW {self._validate_table_name(view)}"
+
     def _get_ydb_type(self, key: str, value) -> str:
         """Determine YDB type based on column name and value"""
+        if key in self.timestamp_columns:
+            return 'Timestamp'
+        if key in self.TIMESTAMP_COLUMNS:
+            return 'Utf8'  # not migrated yet
         if key in ('user_id', 'amount') or (isinstance(value, int) and not isinstance(value, bool)):
             return 'Int64'
         return 'Utf8'
 
-    def _build_select_query(self, table: str, where: dict = None, limit: int = 100) -> Tuple[str, Optional[dict]]:
-        """Build a parameterized SELECT query.
+    def _build_select_query(
+        self,
+        table: str,
+        where: dict = None,
+        limit: int = 100,
+        view: Optional[str] = None,
+    ) -> Tuple[str, Optional[dict]]:
+        """Build a parameterized SELECT query, optionally reading a secondary index.
 
         Returns tuple of (query_string, parameters_dict).
         """
-        table = self._validate_table_name(table)
+        source = self._from(table, view)
 
         if where:
-            # Build parameterized query
-            declares = []
-            conditions = []
-            params = {}
-
-            for k, v in where.items():
-                param_name = f'p_{k}'
-                ydb_type = self._get_ydb_type(k, v)
-                declares.append(f'DECLARE ${param_name} AS {ydb_type};')
-                conditions.append(f'{k} = ${param_name}')
-                if ydb_type == 'Int64':
-                    params[f'${param_name}'] = int(v) if v is not None else 0
-                else:
-                    params[f'${param_name}'] = str(v) if v is not None else ''
+            declares, conditions, params = self._build_where(where, 'p_')
 
             # nosec B608 - table is validated, values use parameterized placeholders ($p_field)
-            query = f"{' '.join(declares)} SELECT * FROM {table} WHERE {' AND '.join(conditions)} LIMIT {limit}"
+            query = self._template(
+                ('select', source, tuple(declares), tuple(conditions), limit),
+                lambda: f"{' '.join(declares)} SELECT * FROM {source} WHERE {' AND '.join(conditions)} LIMIT {limit}",
+            )
             return query, params
         else:
-            return f"SELECT * FROM {table} LIMIT {limit}", None
+            return f"SELECT * FROM {source} LIMIT {limit}", None
 
-    def _build_delete_query(self, table: str, where: dict) -> Tuple[str, dict]:
-        """Build a parameterized DELETE query.
+    def _build_range_conditions(
+        self,
+        where: dict,
+        column: str,
+        start,
+        end,
+    ) -> Tuple[List[str], List[str], dict]:
+        """Build DECLAREs, conditions and params for an equality + range filter.
+
+        Equality conditions from `where` are combined with
+        `column >= $r_start AND column < $r_end`, so the predicate maps onto
+        a primary key prefix plus a range on the next key column.
+        """
+        column = self._validate_table_name(column)
+        declares, conditions, params = self._build_where(where, 'p_')
+
+        for name, value in (('r_start', start), ('r_end', end)):
+            declare, params[f'${name}'] = self._bind(name, column, value)
+            declares.append(declare)
+        conditions.append(f'{column} >= $r_start')
+        conditions.append(f'{column} < $r_end')
+
+        return declares, conditions, params
+
+    def _build_range_query(
+        self,
+        table: str,
+        where: dict,
+        column: str,
+        start,
+        end,
+    ) -> Tuple[str, dict]:
+        """Build a parameterized half-open range SELECT query.
 
         Returns tuple of (query_string, parameters_dict).
         """
         table = self._validate_table_name(table)
+        declares, conditions, params = self._build_range_conditions(where, column, start, end)
 
-        # Build parameterized query
-        declares = []
-        conditions = []
-        params = {}
+        # nosec B608 - table/column are validated, values use parameterized placeholders
+        query = (
+            f"{' '.join(declares)} SELECT * FROM {table} "
+            f"WHERE {' AND '.join(conditions)} ORDER BY {column}"
+        )
+        return query, params
+
+    def _build_page_query(
+        self,
+        table: str,
+        where: dict,
+        column: str,
+        start=None,
+        end=None,
+        after=None,
+        limit: int = 100,
+        view: Optional[str] = None,
+        descending: bool = False,
+    ) -> Tuple[str, dict]:
+        """Build a keyset-paginated SELECT query.
+
+        Rows satisfy `start <= column < end` (each bound optional) and
+        `column > after` (the last value of the previous page), ordered by
+        column and capped at `limit` (None: no cap, for scan queries).
+        `descending` pages from the end: `column < after`, newest first.
+
+        Returns tuple of (query_string, parameters_dict).
+        """
+        source = self._from(table, view)
+        column = self._validate_table_name(column)
+        declares, conditions, params = self._build_where(where, 'p_')
+
+        after_op = '<' if descending else '>'
+        for name, op, value in (('r_start', '>=', start), ('r_end', '<', end), ('r_after', after_op, after)):
+            if value is None:
+                continue
+            declare, params[f'${name}'] = self._bind(name, column, value)
+            declares.append(declare)
+            conditions.append(f'{column} {op} ${name}')
+
+        where_clause = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+        # nosec B608 - table/column are validated, values use parameterized placeholders
+        limit_clause = f" LIMIT {int(limit)}" if limit is not None else ''
+        query = (
+            f"{' '.join(declares)} SELECT * FROM {source} "
+            f"{where_clause}ORDER BY {column}{' DESC' if descending else ''}{limit_clause}"
+        )
+        return query, params
+
+    def _build_aggregate_query(
+        self,
+        table: str,
+        where: dict,
+        column: str,
+        start,
+        end,
+        group_by: str,
+        value: str,
+        view: Optional[str] = None,
+    ) -> Tuple[str, dict]:
+        """Build a parameterized SUM/COUNT ... GROUP BY query over a range.
+
+        Rows come back as {group_by: ..., "total": ..., "count": ...}.
+
+        Returns tuple of (query_string, parameters_dict).
+        """
+        source = self._from(table, view)
+        group_by = self._validate_table_name(group_by)
+        value = self._validate_table_name(value)
+        declares, conditions, params = self._build_range_conditions(where, column, start, end)
+
+        # nosec B608 - identifiers are validated, values use parameterized placeholders
+        query = (
+            f"{' '.join(declares)} "
+            f"SELECT {group_by}, SUM({value}) AS total, COUNT(*) AS count FROM {source} "
+            f"WHERE {' AND '.join(conditions)} GROUP BY {group_by}"
+        )
+        return query, params
+
+    def _bind(self, name: str, key: str, value) -> Tuple[str, Any]:
+        """Return (DECLARE line, bound value) for parameter `name` of column `key`"""
+        ydb_type = self._get_ydb_type(key, value)
+        return f'DECLARE ${name} AS {ydb_type};', self._convert(ydb_type, value, key)
+
+    def _convert(self, ydb_type: str, value, key: Optional[str] = None) -> Any:
+        """Convert Python value to the parameter value for `ydb_type` (of column `key`).
 
-        for k, v in where.items():
-            param_name = f'p_{k}'
+        Query parameters are declared non-optional, so None becomes the
+        type's zero value; see _bulk_rows for NULL-able columns.
+        """
+        if value is None:
+            return _ZERO_VALUES.get(ydb_type, '')
+        if ydb_type == 'Timestamp':
+            return to_micros(value)
+        if ydb_type in _PRIMITIVE_CASTS:
+            return _PRIMITIVE_CASTS[ydb_type](value)
+        if isinstance(value, dict):
+            return json.dumps(value)
+        if key in self.TIMESTAMP_COLUMNS and isinstance(value, int) and not isinstance(value, bool):
+            # epoch micros for a timestamp column still stored as Utf8
+            return from_micros(value).isoformat()
+        return str(value) if value is not None else ''
+
+    def _bind_all(self, values: dict, prefix: str) -> Tuple[tuple, dict]:
+        """Return (column types, params) for binding every value of `values`"""
+        types = []
+        params = {}
+        for k, v in values.items():
             ydb_type = self._get_ydb_type(k, v)
-            declares.append(f'DECLARE ${param_name} AS {ydb_type};')
-            conditions.append(f'{k} = ${param_name}')
-            if ydb_type == 'Int64':
-                params[f'${param_name}'] = int(v) if v is not None else 0
-            else:
-                params[f'${param_name}'] = str(v) if v is not None else ''
+            types.append(ydb_type)
+            params[f'${prefix}{k}'] = self._convert(ydb_type, v, k)
+        return tuple(types), params
+
+    def _template(self, key: tuple, build: Callable[[], Any]) -> Any:
+        """Memoized statement text for a (kind, table, columns, types, ...) key"""
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = build()
+            if len(self._templates) > self.TEMPLATE_CACHE_SIZE:
+                self._templates.popitem(last=False)
+        else:
+            self._templates.move_to_end(key)
+        return template
+
+    def _build_where(self, where: dict, prefix: str) -> Tuple[List[str], List[str], dict]:
+        """Build DECLAREs, conditions and params for a WHERE clause.
+
+        Values match by equality; Prefix values match as a key range.
+        """
+        types, params = self._bind_all(where, prefix)
+        prefixed = tuple(isinstance(v, Prefix) for v in where.values())
+        for k, is_prefix in zip(where, prefixed):
+            if is_prefix:
+                params[f'${prefix}{k}_end'] = params[f'${prefix}{k}'] + Prefix.UPPER
+
+        def build():
+            declares = []
+            conditions = []
+            for k, t, is_prefix in zip(where, types, prefixed):
+                declares.append(f'DECLARE ${prefix}{k} AS {t};')
+                if is_prefix:
+                    declares.append(f'DECLARE ${prefix}{k}_end AS {t};')
+                    conditions.append(f'{k} >= ${prefix}{k} AND {k} < ${prefix}{k}_end')
+                else:
+                    conditions.append(f'{k} = ${prefix}{k}')
+            return declares, conditions
+
+        declares, conditions = self._template(('where', tuple(where), types, prefixed, prefix), build)
+        return list(declares), list(conditions), params
+
+    def _build_insert_statement(self, table: str, data: dict, prefix: str = '') -> Tuple[List[str], str, dict]:
+        """Build an UPSERT statement.
+
+        Returns tuple of (declares, statement, parameters_dict).
+        """
+        table = self._validate_table_name(table)
+        types, params = self._bind_all(data, prefix)
+
+        def build():
+            columns = ', '.join(data.keys())
+            placeholders = ', '.join(f'${prefix}{k}' for k in data.keys())
+            declares = [f'DECLARE ${prefix}{k} AS {t};' for k, t in zip(data, types)]
+            return declares, f"UPSERT INTO {table} ({columns}) VALUES ({placeholders});"
+
+        declares, statement = self._template(('insert', table, tuple(data), types, prefix), build)
+        return list(declares), statement, params
+
+    def _build_delete_statement(self, table: str, where: dict, prefix: str = '') -> Tuple[List[str], str, dict]:
+        """Build a DELETE statement.
+
+        Returns tuple of (declares, statement, parameters_dict).
+        """
+        table = self._validate_table_name(table)
+        declares, conditions, params = self._build_where(where, f'{prefix}p_')
 
         # nosec B608 - table is validated, values use parameterized placeholders ($p_field)
-        query = f"{' '.join(declares)} DELETE FROM {table} WHERE {' AND '.join(conditions)}"
-        return query, params
+        return declares, f"DELETE FROM {table} WHERE {' AND '.join(conditions)};", params
 
-    def insert(self, table: str, data: dict) -> bool:
-        """Insert record into table with proper type handling"""
+    def _build_update_statement(
+        self,
+        table: str,
+        where: dict,
+        data: dict,
+        prefix: str = '',
+    ) -> Tuple[List[str], str, dict]:
+        """Build an UPDATE statement.
+
+        Returns tuple of (declares, statement, parameters_dict).
+        """
+        table = self._validate_table_name(table)
+        declares, conditions, params = self._build_where(where, f'{prefix}w_')
+        set_declares, _, set_params = self._build_where(data, f'{prefix}s_')
+        sets = [f'{k} = ${prefix}s_{k}' for k in data.keys()]
+
+        # nosec B608 - table is validated, values use parameterized placeholders
+        statement = f"UPDATE {table} SET {', '.join(sets)} WHERE {' AND '.join(conditions)};"
+        return declares + set_declares, statement, {**params, **set_params}
+
+    def _build_struct_list(self, name: str, rows: List[dict]) -> Tuple[str, List[dict]]:
+        """Return (DECLARE line, bound value) for a List<Struct<...>> parameter.
+
+        Column types are taken from the first row.
+        """
+        fields = ', '.join(
+            f'{self._validate_table_name(k)}: {self._get_ydb_type(k, v)}'
+            for k, v in rows[0].items()
+        )
+        bound = [
+            {k: self._bind(name, k, row.get(k))[1] for k in rows[0]}
+            for row in rows
+        ]
+        return f'DECLARE ${name} AS List<Struct<{fields}>>;', bound
+
+    def _build_insert_many_statement(
+        self,
+        table: str,
+        rows: List[dict],
+        prefix: str = '',
+    ) -> Tuple[List[str], str, dict]:
+        """Build one UPSERT writing all `rows` from an AS_TABLE list parameter.
+
+        Returns tuple of (declares, statement, parameters_dict).
+        """
         table = self._validate_table_name(table)
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join(f'${k}' for k in data.keys())
+        param_name = f'{prefix}rows'
+        declare, bound = self._build_struct_list(param_name, rows)
+
+        # nosec B608 - table is validated, values use parameterized placeholders
+        statement = f"UPSERT INTO {table} SELECT * FROM AS_TABLE(${param_name});"
+        return [declare], statement, {f'${param_name}': bound}
+
+    def _build_increment_statement(
+        self,
+        table: str,
+        rows: List[Tuple[dict, dict]],
+        prefix: str = '',
+    ) -> Tuple[List[str], str, dict]:
+        """Build one UPSERT adding `deltas` to counter columns of `key` rows.
+
+        Missing rows start from zero. All rows are written by a single
+        statement, so the table is read once before it is modified.
+
+        Returns tuple of (declares, statement, parameters_dict).
+        """
+        table = self._validate_table_name(table)
+        key, deltas = rows[0]
+        key_cols = [self._validate_table_name(k) for k in key]
+        delta_cols = [self._validate_table_name(k) for k in deltas]
+
+        param_name = f'{prefix}rows'
+        declare, bound = self._build_struct_list(
+            param_name, [{**row_key, **row_deltas} for row_key, row_deltas in rows]
+        )
+        declares = [declare]
+
+        selected = [f'k.{k} AS {k}' for k in key_cols] + [
+            f'COALESCE(r.{k}, 0) + k.{k} AS {k}' for k in delta_cols
+        ]
+        join_on = ' AND '.join(f'k.{k} = r.{k}' for k in key_cols)
+
+        # nosec B608 - identifiers are validated, values use parameterized placeholders
+        statement = (
+            f"UPSERT INTO {table} ({', '.join(key_cols + delta_cols)}) "
+            f"SELECT {', '.join(selected)} FROM AS_TABLE(${param_name}) AS k "
+            f"LEFT JOIN {table} AS r ON {join_on};"
+        )
+        return declares, statement, {f'${param_name}': bound}
+
+    def _build_delete_query(self, table: str, where: dict) -> Tuple[str, dict]:
+        """Build a parameterized DELETE query.
 
-        # Determine types based on values and column names
+        Returns tuple of (query_string, parameters_dict).
+        """
+        declares, statement, params = self._build_delete_statement(table, where)
+        return f"{' '.join(declares)} {statement}", params
+
+    def _build_batch_query(self, ops: List[tuple]) -> Tuple[str, dict]:
+        """Compile write operations into one multi-statement YQL query.
+
+        Supported operations:
+            ("insert", table, data)
+            ("insert_many", table, rows)
+            ("delete", table, where)
+            ("update", table, where, data)
+            ("upsert", table, key, data)
+            ("increment", table, key, deltas)
+
+        Increments of the same table are merged into one statement (deltas of
+        identical keys are summed), since YQL cannot read a table after it
+        has been modified in the same query.
+
+        Returns tuple of (query_string, parameters_dict).
+        """
         declares = []
+        statements = []
         params = {}
+        increments: Dict[str, Dict[tuple, Tuple[dict, dict]]] = {}
 
-        for k, v in data.items():
-            # Int64 for numeric fields
-            if k in ('user_id', 'amount') or (isinstance(v, int) and not isinstance(v, bool)):
-                declares.append(f'DECLARE ${k} AS Int64;')
-                params[f'${k}'] = int(v) if v is not None else 0
-            # Timestamp for datetime fields
-            elif k in ('created_at',) and v is not None:
-                declares.append(f'DECLARE ${k} AS Utf8;')
-                params[f'${k}'] = str(v)
-            # JSON for dict
-            elif isinstance(v, dict):
-                declares.append(f'DECLARE ${k} AS Utf8;')
-                params[f'${k}'] = json.dumps(v)
-            # Default to Utf8 (string)
+        for n, op in enumerate(ops):
+            kind, table, *args = op
+            prefix = f'o{n}_'
+            if kind == 'increment':
+                key, deltas = args
+                rows = increments.setdefault(table, {})
+                row_id = tuple(key.items())
+                if row_id in rows:
+                    merged = dict(rows[row_id][1])
+                    for k, v in deltas.items():
+                        merged[k] = merged.get(k, 0) + v
+                    rows[row_id] = (key, merged)
+                else:
+                    rows[row_id] = (key, dict(deltas))
+                continue
+            if kind == 'insert':
+                built = self._build_insert_statement(table, *args, prefix=prefix)
+            elif kind == 'insert_many':
+                if not args[0]:
+                    continue
+                built = self._build_insert_many_statement(table, *args, prefix=prefix)
+            elif kind == 'delete':
+                built = self._build_delete_statement(table, *args, prefix=prefix)
+            elif kind == 'update':
+                built = self._build_update_statement(table, *args, prefix=prefix)
+            elif kind == 'upsert':
+                key, data = args
+                built = self._build_insert_statement(table, {**key, **data}, prefix=prefix)
             else:
-                declares.append(f'DECLARE ${k} AS Utf8;')
-                params[f'${k}'] = str(v) if v is not None else ''
+                raise ValueError(f"Unknown batch operation: {kind}")
+            declares.extend(built[0])
+            statements.append(built[1])
+            params.update(built[2])
 
-        query = f"""
-            {' '.join(declares)}
+        for n, (table, rows) in enumerate(increments.items()):
+            built = self._build_increment_statement(table, list(rows.values()), prefix=f'inc{n}_')
+            declares.extend(built[0])
+            statements.append(built[1])
+            params.update(built[2])
 
-            UPSERT INTO {table} ({columns})
-            VALUES ({placeholders});
-        """
+        return '\n'.join(declares + statements), params
 
-        self.execute(query, params)
+    def insert(self, table: str, data: dict) -> bool:
+        """Insert record into table with proper type handling"""
+        self.connect()
+        declares, statement, params = self._build_insert_statement(table, data)
+        self.execute(f"{' '.join(declares)} {statement}", params)
         return True
     
-    def select(self, table: str, where: dict = None, limit: int = 100) -> List[Dict]:
+    def insert_many(self, table: str, rows: List[dict]) -> bool:
+        """Insert several records with one UPSERT statement."""
+        return self.batch([('insert_many', table, rows)])
+
+    def select(
+        self,
+        table: str,
+        where: dict = None,
+        limit: int = 100,
+        tx_mode: Optional[str] = None,
+        view: Optional[str] = None,
+    ) -> List[Dict]:
         """Select records from table using parameterized queries."""
-        query, params = self._build_select_query(table, where, limit)
-        return self.execute(query, params)
+        self.connect()
+        query, params = self._build_select_query(table, where, limit, view)
+        return self.execute(query, params, tx_mode=tx_mode)
+
+    def select_range(
+        self, table: str, where: dict, column: str, start, end, tx_mode: Optional[str] = None
+    ) -> List[Dict]:
+        """Select records with `start <= column < end`, ordered by column."""
+        self.connect()
+        query, params = self._build_range_query(table, where, column, start, end)
+        return self.execute(query, params, tx_mode=tx_mode)
+
+    def select_page(
+        self,
+        table: str,
+        where: dict,
+        column: str,
+        start=None,
+        end=None,
+        after=None,
+        limit: int = 100,
+        tx_mode: Optional[str] = None,
+        view: Optional[str] = None,
+        descending: bool = False,
+    ) -> List[Dict]:
+        """Select one keyset page: rows with column > after, ordered by column (or reversed)."""
+        self.connect()
+        query, params = self._build_page_query(table, where, column, start, end, after, limit, view, descending)
+        return self.execute(query, params, tx_mode=tx_mode)
+
+    def aggregate(
+        self,
+        table: str,
+        where: dict,
+        column: str,
+        start,
+        end,
+        group_by: str,
+        value: str,
+        tx_mode: Optional[str] = None,
+        view: Optional[str] = None,
+    ) -> List[Dict]:
+        """Sum and count `value` per `group_by` over `start <= column < end`."""
+        self.connect()
+        query, params = self._build_aggregate_query(table, where, column, start, end, group_by, value, view)
+        return self.execute(query, params, tx_mode=tx_mode)
 
     def delete(self, table: str, where: dict) -> bool:
         """Delete records from table using parameterized queries."""
+        self.connect()
         query, params = self._build_delete_query(table, where)
         self.execute(query, params)
         return True
 
     def update(self, table: str, where: dict, data: dict) -> bool:
         """Update records in table using parameterized queries."""
-        table = self._validate_table_name(table)
+        self.connect()
+        declares, statement, params = self._build_update_statement(table, where, data)
+        self.execute(f"{' '.join(declares)} {statement}", params)
+        return True
 
-        # Build parameterized query
-        declares = []
-        params = {}
+    def upsert(self, table: str, key: dict, data: dict) -> bool:
+        """Write the row identified by `key`, replacing any existing one."""
+        return self.batch([('upsert', table, key, data)])
 
-        # WHERE clause
-        conditions = []
-        for k, v in where.items():
-            param_name = f'w_{k}'
-            ydb_type = self._get_ydb_type(k, v)
-            declares.append(f'DECLARE ${param_name} AS {ydb_type};')
-            conditions.append(f'{k} = ${param_name}')
-            if ydb_type == 'Int64':
-                params[f'${param_name}'] = int(v) if v is not None else 0
+    def increment(self, table: str, key: dict, deltas: dict) -> bool:
+        """Add `deltas` to counter columns of the row identified by `key`."""
+        return self.batch([('increment', table, key, deltas)])
+
+    def batch(self, ops: List[tuple]) -> bool:
+        """Apply several write operations in one request and one commit."""
+        self.connect()
+        query, params = self._build_batch_query(ops)
+        self.execute(query, params)
+        return True
+
+    def _table_path(self, table: str) -> str:
+        return f"{self.database}/{self._validate_table_name(table)}"
+
+    def _bulk_column_types(self, row: dict, column_types: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Column -> YDB type name for bulk rows; explicit `column_types` win over inferred ones"""
+        types = {k: self._get_ydb_type(k, v) for k, v in row.items()}
+        types.update(column_types or {})
+        return types
+
+    def _bulk_columns(self, types: Dict[str, str]):
+        """BulkUpsertColumns schema for `types`"""
+        columns = ydb.BulkUpsertColumns()
+        for name, type_name in types.items():
+            columns.add_column(name, ydb.OptionalType(getattr(ydb.PrimitiveType, type_name)))
+        return columns
+
+    def _bulk_rows(self, rows: List[dict], types: Dict[str, str]) -> List[dict]:
+        """Rows converted to their column types; missing and None values stay NULL"""
+        return [
+            {k: None if row.get(k) is None else self._convert(t, row[k], k) for k, t in types.items()}
+            for row in rows
+        ]
+
+    def bulk_upsert(
+        self,
+        table: str,
+        rows: Iterable[dict],
+        batch_size: Optional[int] = None,
+        column_types: Optional[Dict[str, str]] = None,
+        max_in_flight: Optional[int] = None,
+    ) -> int:
+        """Load rows through the BulkUpsert RPC, keeping several batches in flight.
+
+        Rows are consumed lazily, so `rows` may be a generator over a large
+        import. Column types are inferred from the first row unless given in
+        `column_types`. Each batch is applied on its own, without a
+        transaction: a failed load can simply be re-run, since rows are
+        upserted by primary key. Returns the number of rows written.
+        """
+        self.connect()
+        batch_size = batch_size or self.BULK_BATCH_SIZE
+        max_in_flight = max_in_flight or self.BULK_MAX_IN_FLIGHT
+        path = self._table_path(table)
+        types = columns = None
+        in_flight = deque()
+        written = 0
+
+        for chunk in _chunks(rows, batch_size):
+            if types is None:
+                types = self._bulk_column_types(chunk[0], column_types)
+                columns = self._bulk_columns(types)
+            if len(in_flight) >= max_in_flight:
+                in_flight.popleft().result()
+            in_flight.append(
+                self.driver.table_client.async_bulk_upsert(path, self._bulk_rows(chunk, types), columns)
+            )
+            written += len(chunk)
+
+        while in_flight:
+            in_flight.popleft().result()
+        return written
+
+    @staticmethod
+    def _declared_types(query: str) -> Dict[str, str]:
+        """Parameter name -> type name from the query's DECLARE lines"""
+        return dict(re.findall(r'DECLARE (\$\w+) AS (\w+);', query))
+
+    def _scan_query(self, query: str, parameters: Optional[dict]):
+        """ydb.ScanQuery with parameter types taken from the DECLAREs"""
+        if not parameters:
+            return ydb.ScanQuery(query, {})
+        declared = self._declared_types(query)
+        missing = set(parameters) - set(declared)
+        if missing:
+            raise ValueError(f"Scan parameters need a primitive DECLARE: {', '.join(sorted(missing))}")
+        return ydb.ScanQuery(query, {name: getattr(ydb.PrimitiveType, declared[name]) for name in parameters})
+
+    def scan(self, query: str, parameters: dict = None, batches: bool = False) -> Iterator:
+        """Stream a read-only query through YDB scan queries.
+
+        Yields rows (or, with batches=True, lists of rows) as result parts
+        arrive, so long-range reads run in constant memory and are not cut
+        by the result size limit of data queries. Parameters must have
+        primitive-typed DECLAREs.
+        """
+        self.connect()
+        it = self.driver.table_client.scan_query(self._scan_query(query, parameters), parameters)
+        for response in it:
+            rows = [self._decode_row(row) for row in response.result_set.rows]
+            if batches:
+                if rows:
+                    yield rows
             else:
-                params[f'${param_name}'] = str(v) if v is not None else ''
+                yield from rows
 
-        # SET clause
-        sets = []
-        for k, v in data.items():
-            param_name = f's_{k}'
-            ydb_type = self._get_ydb_type(k, v)
-            declares.append(f'DECLARE ${param_name} AS {ydb_type};')
-            sets.append(f'{k} = ${param_name}')
-            if ydb_type == 'Int64':
-                params[f'${param_name}'] = int(v) if v is not None else 0
+    def scan_range(
+        self, table: str, where: dict, column: str, start=None, end=None, view: Optional[str] = None
+    ) -> Iterator[Dict]:
+        """Stream rows with `start <= column < end` (bounds optional), ordered by column."""
+        query, params = self._build_page_query(table, where, column, start, end, None, limit=None, view=view)
+        return self.scan(query, params)
+
+
+class AsyncYDBClient(YDBClient):
+    """YDBClient on the asyncio SDK (ydb.aio).
+
+    Query building and row decoding are inherited; every I/O method is a
+    coroutine, so callers on the event loop never block on YDB round trips.
+    """
+
+    def __init__(self, timestamp_columns: Optional[Iterable[str]] = None, pool_size: Optional[int] = None):
+        super().__init__(timestamp_columns)
+        self.pool_size = pool_size or int(os.getenv('YDB_POOL_SIZE', '10'))
+        # Sessions created by warmup() and kept alive while the instance is idle
+        self.warm_sessions = min(int(os.getenv('YDB_WARM_SESSIONS', '2')), self.pool_size)
+        self.keepalive_interval = float(os.getenv('YDB_KEEPALIVE_INTERVAL', '60'))
+        self.ready = False
+        self._connect_lock = asyncio.Lock()
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        """Establish connection to YDB"""
+        if self.pool:
+            return
+
+        if not HAS_YDB_AIO:
+            raise RuntimeError("YDB SDK not installed. Run: pip install ydb")
+
+        async with self._connect_lock:
+            if self.pool:
+                return
+            driver_config = ydb.DriverConfig(
+                endpoint=self.endpoint,
+                database=self.database,
+                credentials=self._get_credentials()
+            )
+            driver = ydb.aio.Driver(driver_config)
+            await driver.wait(timeout=10)
+            self.driver = driver
+            self.pool = ydb.aio.SessionPool(driver, size=self.pool_size)
+            if self.detect_timestamps:
+                await self.detect_timestamp_columns()
+
+    async def detect_timestamp_columns(self) -> bool:
+        """Bind columns as the expenses table stores them; see YDBClient.detect_timestamp_columns"""
+        async def callee(session):
+            return await session.describe_table(self._table_path(schema.EXPENSES_TABLE))
+
+        try:
+            description = await self.pool.retry_operation(callee)
+        except Exception as e:
+            print(f"YDB column type check error: {e}")
+            return False
+        return self._timestamps_detected(description)
+
+    async def warmup(self, sessions: Optional[int] = None) -> bool:
+        """Connect and pre-create sessions ahead of the first request.
+
+        Runs driver discovery, credential fetch and session creation at
+        startup instead of on a user's first query, then keeps the warm
+        sessions alive every `keepalive_interval` seconds. Returns whether
+        the pool is ready; failures are retried by the keepalive loop.
+        """
+        if sessions:
+            self.warm_sessions = min(sessions, self.pool_size)
+        ready = await self._refresh_sessions()
+        if self.keepalive_interval > 0 and self._keepalive_task is None:
+            self._keepalive_task = asyncio.ensure_future(self._keepalive_loop())
+        return ready
+
+    async def _refresh_sessions(self) -> bool:
+        """(Re)connect and ping `warm_sessions` pool sessions; updates `ready`"""
+        try:
+            await self.connect()
+            if self.detect_timestamps and not await self.detect_timestamp_columns():
+                raise RuntimeError("column types of the expenses table are unknown")
+            sessions = await asyncio.gather(*(self.pool.acquire() for _ in range(self.warm_sessions)))
+            try:
+                await asyncio.gather(*(session.keep_alive() for session in sessions))
+            finally:
+                for session in sessions:
+                    await self.pool.release(session)
+        except Exception as e:
+            print(f"YDB warmup error: {e}")
+            self.ready = False
+        else:
+            self.ready = True
+        return self.ready
+
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            await self._refresh_sessions()
+
+    async def close(self):
+        """Stop the session pool and driver"""
+        self.ready = False
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+            try:
+                await self._keepalive_task
+            except asyncio.CancelledError:
+                pass
+            self._keepalive_task = None
+        if self.pool:
+            await self.pool.stop()
+            self.pool = None
+        if self.driver:
+            await self.driver.stop()
+            self.driver = None
+
+    async def execute(self, query: str, parameters: dict = None, tx_mode: Optional[str] = None) -> List[Dict]:
+        """Execute YQL query"""
+        await self.connect()
+        tx_settings = self._tx_settings(tx_mode)
+
+        async def callee(session):
+            if parameters:
+                prepared = await session.prepare(query)
+                result_sets = await self._transaction(session, tx_settings).execute(
+                    prepared,
+                    parameters,
+                    commit_tx=True
+                )
             else:
-                params[f'${param_name}'] = str(v) if v is not None else ''
+                result_sets = await self._transaction(session, tx_settings).execute(
+                    query,
+                    commit_tx=True
+                )
 
-        # nosec B608 - table is validated, values use parameterized placeholders
-        query = f"{' '.join(declares)} UPDATE {table} SET {', '.join(sets)} WHERE {' AND '.join(conditions)}"
-        self.execute(query, params)
+            return [self._decode_row(row) for result_set in result_sets for row in result_set.rows]
+
+        return await self.pool.retry_operation(callee)
+
+    async def execute_many(
+        self, statements: List[Tuple[str, Optional[dict]]], tx_mode: Optional[str] = None
+    ) -> List[Dict]:
+        """Run several parameterized statements in one request; see YDBClient.execute_many"""
+        query, params = self._join_statements(statements)
+        return await self.execute(query, params or None, tx_mode=tx_mode)
+
+    async def execute_scheme(self, query: str):
+        """Execute YQL scheme (DDL) query outside of a data transaction"""
+        await self.connect()
+
+        async def callee(session):
+            await session.execute_scheme(query)
+
+        await self.pool.retry_operation(callee)
+
+    async def insert(self, table: str, data: dict) -> bool:
+        await self.connect()
+        declares, statement, params = self._build_insert_statement(table, data)
+        await self.execute(f"{' '.join(declares)} {statement}", params)
+        return True
+
+    async def insert_many(self, table: str, rows: List[dict]) -> bool:
+        return await self.batch([('insert_many', table, rows)])
+
+    async def select(
+        self,
+        table: str,
+        where: dict = None,
+        limit: int = 100,
+        tx_mode: Optional[str] = None,
+        view: Optional[str] = None,
+    ) -> List[Dict]:
+        await self.connect()
+        query, params = self._build_select_query(table, where, limit, view)
+        return await self.execute(query, params, tx_mode=tx_mode)
+
+    async def select_range(
+        self, table: str, where: dict, column: str, start, end, tx_mode: Optional[str] = None
+    ) -> List[Dict]:
+        await self.connect()
+        query, params = self._build_range_query(table, where, column, start, end)
+        return await self.execute(query, params, tx_mode=tx_mode)
+
+    async def select_page(
+        self,
+        table: str,
+        where: dict,
+        column: str,
+        start=None,
+        end=None,
+        after=None,
+        limit: int = 100,
+        tx_mode: Optional[str] = None,
+        view: Optional[str] = None,
+        descending: bool = False,
+    ) -> List[Dict]:
+        await self.connect()
+        query, params = self._build_page_query(table, where, column, start, end, after, limit, view, descending)
+        return await self.execute(query, params, tx_mode=tx_mode)
+
+    async def aggregate(
+        self,
+        table: str,
+        where: dict,
+        column: str,
+        start,
+        end,
+        group_by: str,
+        value: str,
+        tx_mode: Optional[str] = None,
+        view: Optional[str] = None,
+    ) -> List[Dict]:
+        await self.connect()
+        query, params = self._build_aggregate_query(table, where, column, start, end, group_by, value, view)
+        return await self.execute(query, params, tx_mode=tx_mode)
+
+    async def delete(self, table: str, where: dict) -> bool:
+        await self.connect()
+        query, params = self._build_delete_query(table, where)
+        await self.execute(query, params)
         return True
 
+    async def update(self, table: str, where: dict, data: dict) -> bool:
+        await self.connect()
+        declares, statement, params = self._build_update_statement(table, where, data)
+        await self.execute(f"{' '.join(declares)} {statement}", params)
+        return True
+
+    async def upsert(self, table: str, key: dict, data: dict) -> bool:
+        return await self.batch([('upsert', table, key, data)])
+
+    async def increment(self, table: str, key: dict, deltas: dict) -> bool:
+        return await self.batch([('increment', table, key, deltas)])
+
+    async def batch(self, ops: List[tuple]) -> bool:
+        await self.connect()
+        query, params = self._build_batch_query(ops)
+        await self.execute(query, params)
+        return True
+
+    async def bulk_upsert(
+        self,
+        table: str,
+        rows: Iterable[dict],
+        batch_size: Optional[int] = None,
+        column_types: Optional[Dict[str, str]] = None,
+        max_in_flight: Optional[int] = None,
+    ) -> int:
+        """Load rows through the BulkUpsert RPC; see YDBClient.bulk_upsert"""
+        await self.connect()
+        batch_size = batch_size or self.BULK_BATCH_SIZE
+        max_in_flight = max_in_flight or self.BULK_MAX_IN_FLIGHT
+        path = self._table_path(table)
+        types = columns = None
+        in_flight = set()
+        written = 0
+
+        try:
+            for chunk in _chunks(rows, batch_size):
+                if types is None:
+                    types = self._bulk_column_types(chunk[0], column_types)
+                    columns = self._bulk_columns(types)
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result()
+                in_flight.add(asyncio.ensure_future(
+                    self.driver.table_client.bulk_upsert(path, self._bulk_rows(chunk, types), columns)
+                ))
+                written += len(chunk)
+
+            await asyncio.gather(*in_flight)
+        except BaseException:
+            for task in in_flight:
+                task.cancel()
+            raise
+        return written
+
+    async def scan(self, query: str, parameters: dict = None, batches: bool = False):
+        """Stream a read-only query through YDB scan queries; see YDBClient.scan"""
+        await self.connect()
+        it = await self.driver.table_client.scan_query(self._scan_query(query, parameters), parameters)
+        async for response in it:
+            rows = [self._decode_row(row) for row in response.result_set.rows]
+            if batches:
+                if rows:
+                    yield rows
+            else:
+                for row in rows:
+                    yield row
+
+    def scan_range(self, table: str, where: dict, column: str, start=None, end=None, view: Optional[str] = None):
+        query, params = self._build_page_query(table, where, column, start, end, None, limit=None, view=view)
+        return self.scan(query, params)
+
+
+class AsyncMemoryDB:
+    """Awaitable view of an in-memory database.
+
+    Gives MemoryDB (or ColumnarMemoryDB) the AsyncYDBClient interface;
+    calls run inline since there is no I/O to wait for.
+    """
+
+    ready = True
+
+    def __init__(self, db: "MemoryDB"):
+        self.db = db
+
+    def __getattr__(self, name: str):
+        method = getattr(self.db, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+    async def scan_range(self, table: str, where: dict, column: str, start=None, end=None, view: Optional[str] = None):
+        for row in self.db.scan_range(table, where, column, start, end, view):
+            yield row
+
+    async def warmup(self, sessions: Optional[int] = None) -> bool:
+        return True
+
+    async def close(self):
+        pass
+
+
+class _IndexedRows:
+    """Rows of one index bucket, kept sorted by the sort column"""
+
+    __slots__ = ('keys', 'rows')
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.rows: List[Dict] = []
+
+    def add(self, row: dict, key: str):
+        i = bisect.bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.rows.insert(i, row)
+
+    def extend(self, rows: List[Dict], keys: List[str]):
+        """Append rows, falling back to sorted inserts when out of order"""
+        if keys == sorted(keys) and (not self.keys or self.keys[-1] <= keys[0]):
+            self.keys.extend(keys)
+            self.rows.extend(rows)
+            return
+        for row, key in zip(rows, keys):
+            self.add(row, key)
+
+    def span(self, start: Optional[str] = None, end: Optional[str] = None) -> Tuple[int, int]:
+        """Index range [lo, hi) of rows with start <= key < end"""
+        lo = bisect.bisect_left(self.keys, start) if start is not None else 0
+        hi = bisect.bisect_left(self.keys, end) if end is not None else len(self.keys)
+        return lo, hi
+
+    def equal_span(self, key: str) -> Tuple[int, int]:
+        """Index range [lo, hi) of rows with key == `key`"""
+        return bisect.bisect_left(self.keys, key), bisect.bisect_right(self.keys, key)
+
+    def remove_at(self, indexes: List[int]):
+        for i in sorted(indexes, reverse=True):
+            del self.keys[i]
+            del self.rows[i]
+
 
 # Simple in-memory fallback when YDB is not available
 class MemoryDB:
-    """In-memory database for development/testing"""
-    
+    """In-memory database for development/testing.
+
+    Each table is hash-indexed on INDEX_COLUMN; every bucket keeps its rows
+    sorted by SORT_COLUMN, so per-user lookups, range scans and deletes
+    bisect instead of scanning the whole table.
+    """
+
+    INDEX_COLUMN = 'user_id'
+    SORT_COLUMN = 'created_at'
+
     def __init__(self):
-        self.tables: Dict[str, List[Dict]] = {}
-    
-    def execute(self, query: str, parameters: dict = None) -> List[Dict]:
+        self.tables: Dict[str, Dict[str, _IndexedRows]] = {}
+
+    @classmethod
+    def _index_key(cls, row: dict) -> str:
+        value = row.get(cls.INDEX_COLUMN)
+        return str(value) if value is not None else ''
+
+    @classmethod
+    def _sort_key(cls, row: dict) -> str:
+        value = row.get(cls.SORT_COLUMN)
+        return str(value) if value is not None else ''
+
+    def _buckets(self, table: str, where: Optional[dict]) -> List[_IndexedRows]:
+        """Buckets that can hold rows matching `where`"""
+        buckets = self.tables.get(table, {})
+        if where and self.INDEX_COLUMN in where:
+            bucket = buckets.get(str(where[self.INDEX_COLUMN]))
+            return [bucket] if bucket else []
+        return list(buckets.values())
+
+    def _candidates(self, bucket: _IndexedRows, where: Optional[dict]) -> range:
+        """Row positions in `bucket` that can match `where`"""
+        if where and self.SORT_COLUMN in where:
+            return range(*bucket.equal_span(str(where[self.SORT_COLUMN])))
+        return range(len(bucket.rows))
+
+    def _drop_empty(self, table: str):
+        buckets = self.tables.get(table, {})
+        for key in [k for k, b in buckets.items() if not b.rows]:
+            del buckets[key]
+
+    def execute(self, query: str, parameters: dict = None, tx_mode: Optional[str] = None) -> List[Dict]:
         # Very basic query parsing for simple cases
         return []
+
+    def execute_many(self, statements: List[Tuple[str, Optional[dict]]], tx_mode: Optional[str] = None) -> List[Dict]:
+        return []
     
+    @classmethod
+    def _stored(cls, row: dict) -> dict:
+        """Row as kept here: epoch micros in SORT_COLUMN become ISO text, like the range bounds"""
+        value = row.get(cls.SORT_COLUMN)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return {**row, cls.SORT_COLUMN: from_micros(value).isoformat()}
+        return row
+
     def insert(self, table: str, data: dict) -> bool:
-        if table not in self.tables:
-            self.tables[table] = []
-        self.tables[table].append(data)
+        data = self._stored(data)
+        buckets = self.tables.setdefault(table, {})
+        key = self._index_key(data)
+        if key not in buckets:
+            buckets[key] = _IndexedRows()
+        buckets[key].add(data, self._sort_key(data))
+        return True
+
+    def insert_many(self, table: str, rows: List[dict]) -> bool:
+        buckets = self.tables.setdefault(table, {})
+        grouped: Dict[str, List[Dict]] = {}
+        for row in map(self._stored, rows):
+            grouped.setdefault(self._index_key(row), []).append(row)
+        for key, group in grouped.items():
+            if key not in buckets:
+                buckets[key] = _IndexedRows()
+            buckets[key].extend(group, [self._sort_key(r) for r in group])
         return True
     
-    def select(self, table: str, where: dict = None, limit: int = 100) -> List[Dict]:
-        if table not in self.tables:
-            return []
-        
-        results = self.tables[table]
-        
-        if where:
-            results = [
-                r for r in results
-                if all(r.get(k) == v for k, v in where.items())
-            ]
-        
+    def select(
+        self,
+        table: str,
+        where: dict = None,
+        limit: int = 100,
+        tx_mode: Optional[str] = None,
+        view: Optional[str] = None,
+    ) -> List[Dict]:
+        results = []
+        for bucket in self._buckets(table, where):
+            for i in self._candidates(bucket, where):
+                r = bucket.rows[i]
+                if not where or all(r.get(k) == v for k, v in where.items()):
+                    results.append(r)
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def select_range(
+        self, table: str, where: dict, column: str, start, end, tx_mode: Optional[str] = None
+    ) -> List[Dict]:
+        start, end = str(start), str(end)
+        results = []
+        for bucket in self._buckets(table, where):
+            if column == self.SORT_COLUMN:
+                positions = range(*bucket.span(start, end))
+            else:
+                positions = range(len(bucket.rows))
+            for i in positions:
+                r = bucket.rows[i]
+                if all(r.get(k) == v for k, v in where.items()) and start <= str(r.get(column)) < end:
+                    results.append(r)
+        return sorted(results, key=lambda r: str(r.get(column)))
+
+    def select_page(
+        self,
+        table: str,
+        where: dict,
+        column: str,
+        start=None,
+        end=None,
+        after=None,
+        limit: int = 100,
+        tx_mode: Optional[str] = None,
+        view: Optional[str] = None,
+        descending: bool = False,
+    ) -> List[Dict]:
+        if column != self.SORT_COLUMN:
+            raise ValueError(f"MemoryDB pages only by {self.SORT_COLUMN}, got: {column}")
+        start = str(start) if start is not None else None
+        end = str(end) if end is not None else None
+        results = []
+        for bucket in self._buckets(table, where):
+            lo, hi = bucket.span(start, end)
+            if after is not None and descending:
+                hi = min(hi, bisect.bisect_left(bucket.keys, str(after)))
+            elif after is not None:
+                lo = max(lo, bisect.bisect_right(bucket.keys, str(after)))
+            indexes = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+            matched = (
+                bucket.rows[i] for i in indexes
+                if all(bucket.rows[i].get(k) == v for k, v in where.items())
+            )
+            # rows of a bucket are sorted: its first `limit` matches are all it can contribute
+            results.extend(itertools.islice(matched, limit))
+        results.sort(key=self._sort_key, reverse=descending)
         return results[:limit]
+
+    def aggregate(
+        self,
+        table: str,
+        where: dict,
+        column: str,
+        start,
+        end,
+        group_by: str,
+        value: str,
+        tx_mode: Optional[str] = None,
+        view: Optional[str] = None,
+    ) -> List[Dict]:
+        groups: Dict[Any, Dict] = {}
+        for r in self.select_range(table, where, column, start, end):
+            key = r.get(group_by)
+            group = groups.setdefault(key, {group_by: key, "total": 0, "count": 0})
+            group["total"] += int(r.get(value) or 0)
+            group["count"] += 1
+        return list(groups.values())
     
     def delete(self, table: str, where: dict) -> bool:
-        if table not in self.tables:
-            return True
-
-        self.tables[table] = [
-            r for r in self.tables[table]
-            if not all(r.get(k) == v for k, v in where.items())
-        ]
+        for bucket in self._buckets(table, where):
+            bucket.remove_at([
+                i for i in self._candidates(bucket, where)
+                if all(bucket.rows[i].get(k) == v for k, v in where.items())
+            ])
+        self._drop_empty(table)
         return True
 
     def update(self, table: str, where: dict, data: dict) -> bool:
         if table not in self.tables:
             return False
 
+        # Compare as strings, like YDB parameter binding does
+        str_where = {k: str(v) for k, v in where.items()}
+        reindex = self.INDEX_COLUMN in data or self.SORT_COLUMN in data
+        moved = []
         updated = False
-        for record in self.tables[table]:
-            if all(str(record.get(k)) == str(v) for k, v in where.items()):
-                record.update(data)
+        for bucket in self._buckets(table, str_where):
+            matched = [
+                i for i in self._candidates(bucket, str_where)
+                if all(str(bucket.rows[i].get(k)) == v for k, v in str_where.items())
+            ]
+            for i in matched:
+                bucket.rows[i].update(data)
                 updated = True
+            if reindex and matched:
+                moved.extend(bucket.rows[i] for i in matched)
+                bucket.remove_at(matched)
+
+        for record in moved:
+            self.insert(table, record)
+        self._drop_empty(table)
         return updated
 
+    def upsert(self, table: str, key: dict, data: dict) -> bool:
+        self.delete(table, key)
+        return self.insert(table, {**key, **data})
+
+    def increment(self, table: str, key: dict, deltas: dict) -> bool:
+        rows = self.select(table, key, limit=1)
+        if rows:
+            for k, v in deltas.items():
+                rows[0][k] = int(rows[0].get(k) or 0) + v
+        else:
+            self.insert(table, {**key, **deltas})
+        return True
+
+    def scan_range(
+        self, table: str, where: dict, column: str, start=None, end=None, view: Optional[str] = None
+    ) -> Iterator[Dict]:
+        after = None
+        while True:
+            rows = self.select_page(table, where, column, start, end, after, limit=YDBClient.BULK_BATCH_SIZE)
+            yield from rows
+            if len(rows) < YDBClient.BULK_BATCH_SIZE:
+                return
+            after = rows[-1][column]
+
+    def bulk_upsert(
+        self,
+        table: str,
+        rows: Iterable[dict],
+        batch_size: Optional[int] = None,
+        column_types: Optional[Dict[str, str]] = None,
+        max_in_flight: Optional[int] = None,
+    ) -> int:
+        written = 0
+        for chunk in _chunks(rows, batch_size or YDBClient.BULK_BATCH_SIZE):
+            self.insert_many(table, chunk)
+            written += len(chunk)
+        return written
+
+    def batch(self, ops: List[tuple]) -> bool:
+        for kind, table, *args in ops:
+            if kind not in ('insert', 'insert_many', 'delete', 'update', 'upsert', 'increment'):
+                raise ValueError(f"Unknown batch operation: {kind}")
+            getattr(self, kind)(table, *args)
+        return True
+
+
+def get_memory_db():
+    """Get in-memory database.
+
+    MEMORY_DB_LAYOUT=columnar selects the array-backed ColumnarMemoryDB
+    (staging and load tests); the default is the row-based MemoryDB.
+    """
+    if os.getenv('MEMORY_DB_LAYOUT', 'rows') == 'columnar':
+        from src.db.columnar_db import ColumnarMemoryDB
+        return ColumnarMemoryDB()
+    return MemoryDB()
+
 
 def get_db():
     """Get database client (YDB or fallback)"""
     if os.getenv('YDB_ENDPOINT') and HAS_YDB:
         return YDBClient()
     else:
-        return MemoryDB()
+        return get_memory_db()
+
+
+def get_async_db(db=None):
+    """Get async database client (AsyncYDBClient or wrapped MemoryDB).
+
+    Given a sync client, returns its async counterpart: a YDBClient maps
+    to an AsyncYDBClient with the same settings, an in-memory database is
+    wrapped so both views share the same tables.
+    """
+    if db is None:
+        db = get_db()
+    if isinstance(db, YDBClient):
+        client = AsyncYDBClient(db.timestamp_columns)
+        client.endpoint, client.database = db.endpoint, db.database
+        client.detect_timestamps = db.detect_timestamps
+        return client
+    return AsyncMemoryDB(db)
 
 
 # CLI
@@ -0,0 +1,217 @@
+"""
+Rule-based expense parser.
+
+Parses the common phrasings ("кофе 300", "такси 2к", "маме две тыщи",
+"жене 500 и маме 500, пиво косарь") locally, so YaGPT is only asked
+about messages the rules are not sure about.
+
+BDD Reference: NLE-A-8
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Number word kinds
+UNIT = 0      # adds to the current group: пять, двести, пятихатка
+HUNDREDS = 1  # multiplies the current group: сотни, сотка
+SCALE = 2     # multiplies and closes the group: тысяча, лям, косарь
+
+NUMBER_WORDS: Dict[str, Tuple[int, float]] = {
+    **{w: (UNIT, v) for v, words in {
+        1: "один одна одну", 2: "два две", 3: "три", 4: "четыре", 5: "пять",
+        6: "шесть", 7: "семь", 8: "восемь", 9: "девять", 10: "десять",
+        11: "одиннадцать", 12: "двенадцать", 13: "тринадцать", 14: "четырнадцать",
+        15: "пятнадцать", 16: "шестнадцать", 17: "семнадцать", 18: "восемнадцать",
+        19: "девятнадцать", 20: "двадцать", 30: "тридцать", 40: "сорок",
+        50: "пятьдесят полтинник полтос", 60: "шестьдесят", 70: "семьдесят",
+        80: "восемьдесят", 90: "девяносто", 100: "сто", 200: "двести", 300: "триста",
+        400: "четыреста", 500: "пятьсот пятихатка пятихатку пятисотка пятисотку",
+        600: "шестьсот", 700: "семьсот", 800: "восемьсот", 900: "девятьсот",
+        # slang
+        0.5: "пол", 1.5: "полтора полторы", 3000: "трешка трешку",
+    }.items() for w in words.split()},
+    # "двадцатка" is a note, not a multiplier
+    "двадцатка": (UNIT, 20), "двадцатку": (UNIT, 20),
+    **{w: (HUNDREDS, 100) for w in "сотня сотню сотни сотен сотка сотку сотки сотке соток".split()},
+    **{w: (SCALE, 1000) for w in (
+        "тысяча тысячу тысячи тысяч тыща тыщу тыщи тыщ "
+        "косарь косаря косарей штука штуку кусок куска кусков"
+    ).split()},
+    **{w: (SCALE, 1_000_000) for w in "миллион миллиона миллионов лям ляма лямов".split()},
+}
+
+# Kinds that only count as a number after another number ("3 сотни", "5 к")
+NEEDS_NUMBER: Dict[str, Tuple[int, float]] = {
+    "к": (SCALE, 1000), "k": (SCALE, 1000), "тыс": (SCALE, 1000),
+}
+# ...and only at the end of a phrase: "кофе 300 к обеду" is not 300 000
+PHRASE_END_ONLY = frozenset("к k".split())
+
+CURRENCY_WORDS = frozenset("р руб рубль рубля рублей рублика рэ ₽ r".split())
+
+# Words that make a message ambiguous: quantities ("по 200"), estimates
+HEDGE_WORDS = frozenset("по примерно около где-то наверное вроде почти каждый каждому".split())
+
+# Dropped from item names (still used for categorization)
+FILLER_WORDS = frozenset(
+    "потратил потратила купил купила заплатил заплатила отдал отдала взял взяла "
+    "отправил отправила скинул скинула перевел перевела закинул закинула "
+    "вчера сегодня утром днем вечером ночью ушло ушла эээ ээ э ну там".split()
+) | HEDGE_WORDS
+EDGE_WORDS = frozenset("на за в во у".split())
+
+_TOKEN = re.compile(r"\d+(?:[.,]\d+)?[a-zа-яё₽]*|[a-zа-яё]+(?:-[a-zа-яё]+)*|[,;+₽]", re.IGNORECASE)
+_DIGITS = re.compile(r"(\d+(?:[.,]\d+)?)(к|k|тыс)?(р|руб|рэ|₽|r)?")
+# "15 000", "1 000 000"; other adjacent digit groups ("150 200") stay apart and are not confident
+_THOUSANDS_GROUP = re.compile(r"(?<![\d.,])\d{1,3}(?: 000)+(?!\d)")
+_SEPARATORS = frozenset(",;+и")
+
+
+@dataclass(slots=True)
+class LocalExpense:
+    """Expense found by the rules"""
+    item: str
+    amount: int
+    category: str
+
+
+@dataclass(slots=True)
+class LocalParse:
+    """Parser output; `confident` is False when YaGPT should take a look"""
+    expenses: List[LocalExpense] = field(default_factory=list)
+    confident: bool = False
+
+
+def _number(low: str, after_number: bool) -> Optional[Tuple[int, float, bool]]:
+    """(kind, value, is_digits) of a number token, None for words"""
+    match = _DIGITS.fullmatch(low)
+    if match:
+        value = float(match.group(1).replace(",", "."))
+        kind = UNIT
+        if match.group(2):
+            value *= 1000
+        return kind, value, True
+    if low in NUMBER_WORDS:
+        return (*NUMBER_WORDS[low], False)
+    if after_number and low in NEEDS_NUMBER:
+        return (*NEEDS_NUMBER[low], False)
+    return None
+
+
+def amount_value(numbers: List[Tuple[int, float, bool]]) -> Optional[int]:
+    """Value of consecutive number tokens ("две тыщи двести" -> 2200), None if malformed"""
+    total = current = 0.0
+    last = float("inf")  # word units must decrease: "сто пятьдесят", not "пять пять"
+    for kind, value, is_digits in numbers:
+        if kind == UNIT:
+            if is_digits:
+                if last != float("inf") or current or total:
+                    return None
+                last = 0.0
+            elif value >= last:
+                return None
+            else:
+                last = value
+            current += value
+        elif kind == HUNDREDS:
+            current = (current or 1) * value
+            last = value
+        else:
+            group = (current or 1) * value
+            if total and group >= total:
+                return None
+            total += group
+            current = 0.0
+            last = value
+    amount = total + current
+    if amount <= 0 or amount != int(amount):
+        return None
+    return int(amount)
+
+
+class LocalExpenseParser:
+    """Deterministic parser for common expense phrasings.
+
+    A message is split into phrases on "и", commas and semicolons; a
+    phrase without an amount is joined to the next one ("интернет и
+    связь 900"). The result is confident when every phrase has exactly
+    one well-formed amount, a non-empty item and no hedge words; the
+    caller decides whether the detected categories are good enough.
+    """
+
+    def __init__(self, detect_category: Callable[[str], str]):
+        self.detect_category = detect_category
+
+    def _phrases(self, message: str) -> List[List[Tuple[str, str]]]:
+        """Phrases as lists of (word, lowercase word)"""
+        text = _THOUSANDS_GROUP.sub(lambda m: m.group().replace(" ", ""), message)
+        phrases: List[List[Tuple[str, str]]] = [[]]
+        for word in _TOKEN.findall(text):
+            low = word.lower().replace("ё", "е")
+            if low in _SEPARATORS:
+                if phrases[-1]:
+                    phrases.append([])
+            elif low not in CURRENCY_WORDS:
+                phrases[-1].append((word, low))
+        return [p for p in phrases if p]
+
+    def _phrase(self, words: List[Tuple[str, str]]) -> Tuple[Optional[LocalExpense], bool, int]:
+        """(expense, confident, amount count) of one phrase"""
+        runs: List[List[Tuple[int, float, bool]]] = []
+        item_words: List[Tuple[str, str]] = []
+        context: List[str] = []
+        confident = True
+        previous_number = False
+        for i, (word, low) in enumerate(words):
+            number = _number(low, previous_number)
+            if number and low in PHRASE_END_ONLY and i < len(words) - 1:
+                number = None
+                confident = False
+            if number:
+                if not previous_number:
+                    runs.append([])
+                runs[-1].append(number)
+            else:
+                context.append(low)
+                if low in HEDGE_WORDS:
+                    confident = False
+                if low not in FILLER_WORDS:
+                    item_words.append((word, low))
+            previous_number = number is not None
+
+        if not runs:
+            return None, confident, 0
+        amount = amount_value(runs[0]) if len(runs) == 1 else None
+
+        while item_words and item_words[0][1] in EDGE_WORDS:
+            item_words.pop(0)
+        while item_words and item_words[-1][1] in EDGE_WORDS:
+            item_words.pop()
+        if amount is None or not item_words:
+            return None, False, len(runs)
+
+        item = " ".join(word for word, _ in item_words)
+        # Categorized by the whole phrase: "маме отправил" is a transfer, the item is "маме"
+        category = self.detect_category(" ".join(context))
+        return LocalExpense(item=item, amount=amount, category=category), confident, len(runs)
+
+    def parse(self, message: str) -> LocalParse:
+        result = LocalParse(confident=True)
+        pending: List[Tuple[str, str]] = []
+        for words in self._phrases(message):
+            words = pending + ([("и", "и")] if pending else []) + words
+            expense, confident, amounts = self._phrase(words)
+            if amounts == 0:
+                pending = words
+                continue
+            pending = []
+            if expense is None:
+                result.confident = False
+                continue
+            if not confident:
+                result.confident = False
+            result.expenses.append(expense)
+
+        if pending or not result.expenses:
+            result.confident = False
+        return result
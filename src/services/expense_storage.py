@@ -4,202 +4,659 @@ Stores and retrieves expenses from YDB or in-memory storage.
 
 BDD Reference: NLE-A-10
 """
+import asyncio
 import os
-from dataclasses import dataclass, field
+from dataclasses import FrozenInstanceError
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-from collections import defaultdict
+from typing import AsyncIterator, List, Dict, Iterator, Optional, Tuple, Union
 
-from src.db.ydb_client import get_db, YDBClient, MemoryDB
+from src.db import schema
+from src.db.timestamps import to_micros, from_micros
+from src.db.ydb_client import get_db, get_memory_db, get_async_db, Prefix, YDBClient
+from src.services.parse_cache import ParseCache
+from src.services.yagpt_service import CATEGORIES
+
+
+# Canonical category strings, so every Expense shares the same objects
+_CATEGORY_INTERN: Dict[str, str] = {c: c for c in CATEGORIES}
+
+# Schema version read per (endpoint, database), checked once per process
+_schema_versions: Dict[Tuple[str, str], int] = {}
+
+
+def item_key(item: str) -> str:
+    """Normalized item name stored for indexed lookups (lowercase, ё -> е, single spaces)"""
+    return " ".join(item.lower().replace("ё", "е").split())
+
+
+def learned_category_cache() -> ParseCache:
+    """Cache of learned item categories (LEARNED_CATEGORY_CACHE_SIZE, LEARNED_CATEGORY_CACHE_TTL seconds)"""
+    return ParseCache(
+        max_size=int(os.getenv("LEARNED_CATEGORY_CACHE_SIZE", "10000")),
+        ttl=float(os.getenv("LEARNED_CATEGORY_CACHE_TTL", "3600")),
+    )
 
 
-@dataclass
 class Expense:
-    """Expense record"""
-    user_id: int
-    item: str
-    amount: int
-    category: str
-    created_at: datetime = field(default_factory=datetime.now)
+    """Expense record.
+
+    Slotted and immutable. created_at is stored as epoch microseconds
+    (created_at_us) and converted to a datetime only when accessed.
+    """
+
+    __slots__ = ("user_id", "item", "amount", "category", "created_at_us")
+
+    def __init__(
+        self,
+        user_id: int,
+        item: str,
+        amount: int,
+        category: str,
+        created_at: Union[datetime, str, int, None] = None,
+    ):
+        setattr_ = object.__setattr__
+        setattr_(self, "user_id", user_id)
+        setattr_(self, "item", item)
+        setattr_(self, "amount", amount)
+        setattr_(self, "category", _CATEGORY_INTERN.get(category, category))
+        setattr_(self, "created_at_us", to_micros(created_at if created_at is not None else datetime.now()))
+
+    @classmethod
+    def from_row(cls, row: dict) -> "Expense":
+        """Build Expense from a database row without intermediate objects.
+
+        created_at may be epoch micros, datetime or ISO string; missing or
+        unparseable values fall back to now.
+        """
+        created_at = row.get("created_at")
+        if not isinstance(created_at, int):
+            try:
+                created_at = to_micros(created_at)
+            except (TypeError, ValueError):
+                created_at = to_micros(datetime.now())
+
+        category = str(row.get("category", "Другое"))
+        expense = object.__new__(cls)
+        setattr_ = object.__setattr__
+        setattr_(expense, "user_id", int(row.get("user_id", 0)))
+        setattr_(expense, "item", str(row.get("item", "")))
+        setattr_(expense, "amount", int(row.get("amount", 0)))
+        setattr_(expense, "category", _CATEGORY_INTERN.get(category, category))
+        setattr_(expense, "created_at_us", created_at)
+        return expense
+
+    @property
+    def created_at(self) -> datetime:
+        return from_micros(self.created_at_us)
+
+    def __setattr__(self, name, value):
+        raise FrozenInstanceError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name):
+        raise FrozenInstanceError(f"cannot delete field '{name}'")
+
+    def _key(self) -> tuple:
+        return (self.user_id, self.item, self.amount, self.category, self.created_at_us)
+
+    def __reduce__(self):
+        # copy and pickle rebuild through __init__, which accepts micros
+        return (self.__class__, self._key())
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __repr__(self) -> str:
+        return (
+            f"Expense(user_id={self.user_id!r}, item={self.item!r}, amount={self.amount!r}, "
+            f"category={self.category!r}, created_at={self.created_at!r})"
+        )
 
 
-class ExpenseStorage:
-    """Expense storage service with YDB or in-memory backend"""
+class _ExpenseStorageBase:
+    """Tables, row conversion and query planning shared by sync and async storage"""
+
+    TABLE_NAME = schema.EXPENSES_TABLE
+    SETTINGS_TABLE = schema.SETTINGS_TABLE
+    ROLLUP_TABLE = schema.ROLLUP_TABLE
+    # Per-user (item_key -> category) learned from corrections and confirmations
+    LEARNED_TABLE = schema.ITEM_CATEGORY_TABLE
+    # Global secondary indexes of the expenses table
+    CATEGORY_INDEX = schema.CATEGORY_INDEX
+    ITEM_INDEX = schema.ITEM_INDEX
+    DEFAULT_PAGE_SIZE = 500
+    # Reads run in read-only transactions and take no locks; snapshot keeps
+    # read-your-writes for the user who just saved an expense
+    READ_TX_MODE = "snapshot"
+    SCHEMA_VERSION_QUERY = f"SELECT MAX(version) AS version FROM {schema.SCHEMA_VERSION_TABLE}"
+
+    def _schema_key(self) -> Optional[Tuple[str, str]]:
+        """Cache key of the version check; None when there is nothing to check"""
+        if not isinstance(self.db, YDBClient) or os.getenv('YDB_SCHEMA_CHECK', '1') == '0':
+            return None
+        return (self.db.endpoint, self.db.database)
+
+    @staticmethod
+    def _schema_version(rows: List[Dict]) -> int:
+        return int(rows[0].get("version") or 0) if rows else 0
+
+    @staticmethod
+    def _schema_current(version: int) -> bool:
+        if version < schema.SCHEMA_VERSION:
+            print(
+                f"YDB schema version {version} is behind {schema.SCHEMA_VERSION}; "
+                "run scripts/init_ydb.py"
+            )
+            return False
+        return True
+
+    @staticmethod
+    def _month_key(created_at) -> str:
+        """Rollup month key (YYYY-MM) for a datetime, epoch micros or ISO string"""
+        if isinstance(created_at, int):
+            created_at = from_micros(created_at)
+        if isinstance(created_at, datetime):
+            return created_at.strftime("%Y-%m")
+        return str(created_at)[:7]
+
+    def _rollup_op(self, user_id: int, created_at, category: str, amount: int, count: int) -> tuple:
+        """Batch operation adding amount/count to a monthly rollup row"""
+        return (
+            "increment",
+            self.ROLLUP_TABLE,
+            {"user_id": user_id, "month": self._month_key(created_at), "category": category},
+            {"total": amount, "expense_count": count},
+        )
+
+    def _expense_to_row(self, expense: Expense) -> dict:
+        """Convert Expense object to database row"""
+        return {
+            "user_id": expense.user_id,
+            "item": expense.item,
+            "amount": expense.amount,
+            "category": expense.category,
+            "created_at": expense.created_at_us,
+            "item_key": item_key(expense.item),
+        }
+
+    def _row_to_expense(self, row: dict) -> Expense:
+        """Convert database row to Expense object"""
+        return Expense.from_row(row)
+
+    def _save_ops(self, expense: Expense) -> List[tuple]:
+        """Batch operations saving one expense and its rollup delta"""
+        data = self._expense_to_row(expense)
+        return [
+            ("insert", self.TABLE_NAME, data),
+            self._rollup_op(expense.user_id, data["created_at"], expense.category, expense.amount, 1),
+        ]
+
+    def _save_many_ops(self, expenses: List[Expense]) -> List[tuple]:
+        """Batch operations saving several expenses with one multi-row insert"""
+        rows = []
+        seen = set()
+        for expense in expenses:
+            row = self._expense_to_row(expense)
+            # (user_id, created_at) is the primary key: keep rows of one batch distinct
+            while (row["user_id"], row["created_at"]) in seen:
+                row["created_at"] += 1
+            seen.add((row["user_id"], row["created_at"]))
+            rows.append(row)
+
+        ops = [("insert_many", self.TABLE_NAME, rows)]
+        for row in rows:
+            ops.append(self._rollup_op(row["user_id"], row["created_at"], row["category"], row["amount"], 1))
+        return ops
+
+    def _delete_ops(self, user_id: int, created_at: str, row: dict) -> List[tuple]:
+        """Batch operations deleting an expense row and its rollup contribution"""
+        return [
+            ("delete", self.TABLE_NAME, {"user_id": user_id, "created_at": created_at}),
+            self._rollup_op(user_id, created_at, str(row.get("category")), -int(row.get("amount") or 0), -1),
+        ]
+
+    def _recategorize_ops(self, user_id: int, created_at: str, row: dict, new_category: str) -> List[tuple]:
+        """Batch operations moving an expense and its rollup contribution to new_category"""
+        amount = int(row.get("amount") or 0)
+        return [
+            ("update", self.TABLE_NAME, {"user_id": user_id, "created_at": created_at}, {"category": new_category}),
+            self._rollup_op(user_id, created_at, str(row.get("category")), -amount, -1),
+            self._rollup_op(user_id, created_at, new_category, amount, 1),
+            # The correction is remembered for the next expense with this item
+            *self._learn_ops(user_id, str(row.get("item") or ""), new_category),
+        ]
+
+    def _learn_ops(self, user_id: int, item: str, category: str) -> List[tuple]:
+        """Batch operations remembering the user's category for an item"""
+        key = {"user_id": user_id, "item_key": item_key(item)}
+        return [("upsert", self.LEARNED_TABLE, key, {"category": category})]
+
+    def _remember_category(self, user_id: int, item: str, category: str):
+        """Put a category just written to the learned table into the cache"""
+        self.category_cache.set(f"{user_id}:{item_key(item)}", category)
+
+    def _cached_categories(self, user_id: int, items: List[str]) -> Tuple[Dict[str, str], List[str]]:
+        """Learned categories found in the cache, and item keys to read from the table.
+
+        Items known to have no learned category are cached as "".
+        """
+        found: Dict[str, str] = {}
+        missing = []
+        for key in dict.fromkeys(item_key(item) for item in items):
+            category = self.category_cache.get(f"{user_id}:{key}")
+            if category is None:
+                missing.append(key)
+            elif category:
+                found[key] = category
+        return found, missing
+
+    def _store_categories(self, user_id: int, keys: List[str], results: List[List[Dict]], found: Dict[str, str]):
+        for key, rows in zip(keys, results):
+            category = str(rows[0].get("category") or "") if rows else ""
+            self.category_cache.set(f"{user_id}:{key}", category)
+            if category:
+                found[key] = category
+
+    def _budget_ops(self, user_id: int, amount: int) -> List[tuple]:
+        """Batch operations replacing the user's budget row"""
+        return [
+            ("delete", self.SETTINGS_TABLE, {"user_id": user_id}),
+            ("insert", self.SETTINGS_TABLE, {"user_id": user_id, "budget": amount}),
+        ]
+
+    def _pop_last_statements(self, user_id: int) -> List[Tuple[str, Optional[dict]]]:
+        """YDB statements that return, un-count and delete the user's latest expense.
+
+        Both tables are read before they are written, as YQL requires.
+        """
+        month = schema.CREATED_MONTH
+        return [
+            (f"""
+                DECLARE $user_id AS Int64;
+                $last = (
+                    SELECT * FROM {self.TABLE_NAME}
+                    WHERE user_id = $user_id
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                );
+                SELECT * FROM $last;
+            """, {"$user_id": user_id}),
+            (f"""
+                UPSERT INTO {self.ROLLUP_TABLE} (user_id, month, category, total, expense_count)
+                SELECT
+                    l.user_id AS user_id,
+                    l.month AS month,
+                    l.category AS category,
+                    COALESCE(r.total, 0) - l.amount AS total,
+                    COALESCE(r.expense_count, 0) - 1 AS expense_count
+                FROM (SELECT user_id, category, amount, {month} AS month FROM $last) AS l
+                LEFT JOIN {self.ROLLUP_TABLE} AS r
+                    ON l.user_id = r.user_id AND l.month = r.month AND l.category = r.category;
+            """, None),
+            (f"DELETE FROM {self.TABLE_NAME} ON SELECT user_id, created_at FROM $last;", None),
+        ]
+
+    def _page_query(
+        self,
+        user_id: int,
+        since: Optional[datetime],
+        until: Optional[datetime],
+        filters: Optional[dict] = None,
+        view: Optional[str] = None,
+    ) -> dict:
+        """select_page() arguments for a user's [since, until) history.
+
+        `filters` narrow the rows further and `view` names the secondary
+        index that serves them.
+        """
+        return {
+            "table": self.TABLE_NAME,
+            "where": {"user_id": user_id, **(filters or {})},
+            "column": "created_at",
+            "start": since.isoformat() if since else None,
+            "end": until.isoformat() if until else None,
+            "view": view,
+        }
+
+    def _category_query(self, user_id: int, category: str) -> dict:
+        """Current month's expenses of one category, read from the category index"""
+        return self._page_query(
+            user_id, *self._month_bounds(), filters={"category": category}, view=self.CATEGORY_INDEX
+        )
+
+    def _item_query(self, user_id: int, item: str) -> dict:
+        """Current month's expenses whose normalized name starts with `item`, read from the item index"""
+        return self._page_query(
+            user_id, *self._month_bounds(), filters={"item_key": Prefix(item_key(item))}, view=self.ITEM_INDEX
+        )
 
-    TABLE_NAME = "expenses"
-    SETTINGS_TABLE = "user_settings"
+    def _month_bounds(self) -> tuple:
+        """Get [start, end) of the current month"""
+        now = datetime.now()
+        start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if start_of_month.month == 12:
+            end_of_month = start_of_month.replace(year=start_of_month.year + 1, month=1)
+        else:
+            end_of_month = start_of_month.replace(month=start_of_month.month + 1)
+        return start_of_month, end_of_month
+
+    def _day_bounds(self) -> tuple:
+        """Get [start, end) of today"""
+        start_of_day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return start_of_day, start_of_day + timedelta(days=1)
+
+    def _week_bounds(self, weeks_ago: int = 0) -> tuple:
+        """Get [start, end) of a Monday-to-Sunday week"""
+        now = datetime.now()
+        days_since_monday = now.weekday()
+        week_start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days_since_monday)
+        week_start = week_start - timedelta(weeks=weeks_ago)
+        return week_start, week_start + timedelta(days=7)
+
+    def _rollup_where(self, user_id: int) -> dict:
+        """Rollup key prefix for the user's current month"""
+        start, _ = self._month_bounds()
+        return {"user_id": user_id, "month": self._month_key(start)}
+
+    @staticmethod
+    def _stats_from_rollup(rows: List[dict]) -> Dict[str, Tuple[int, int]]:
+        return {
+            str(row.get("category", "Другое")): (int(row.get("total") or 0), int(row.get("expense_count") or 0))
+            for row in rows
+            if int(row.get("expense_count") or 0) > 0
+        }
+
+    @staticmethod
+    def _stats_from_aggregate(rows: List[dict]) -> Dict[str, Tuple[int, int]]:
+        return {
+            str(row.get("category", "Другое")): (int(row.get("total") or 0), int(row.get("count") or 0))
+            for row in rows
+        }
+
+    def _aggregate_args(self, user_id: int, start: datetime, end: datetime) -> tuple:
+        """aggregate() arguments summing amount per category over [start, end)"""
+        return (self.TABLE_NAME, {"user_id": user_id}, "created_at", start.isoformat(), end.isoformat())
+
+    @staticmethod
+    def _sum_totals(rows: List[dict]) -> int:
+        return sum(int(row.get("total") or 0) for row in rows)
+
+    def _rebuild_range(self, month_start: Optional[datetime]) -> tuple:
+        """[start, end) of the month to rebuild"""
+        if month_start is None:
+            month_start, _ = self._month_bounds()
+        month_start = month_start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        return month_start, (month_start + timedelta(days=32)).replace(day=1)
+
+    def _rebuild_ops(self, user_id: int, month_start: datetime, stats: Dict[str, Tuple[int, int]]) -> List[tuple]:
+        """Batch operations replacing a month's rollup rows with `stats`"""
+        month = self._month_key(month_start)
+        ops = [("delete", self.ROLLUP_TABLE, {"user_id": user_id, "month": month})]
+        for category, (total, count) in stats.items():
+            ops.append(("insert", self.ROLLUP_TABLE, {
+                "user_id": user_id,
+                "month": month,
+                "category": category,
+                "total": total,
+                "expense_count": count,
+            }))
+        return ops
+
+    @staticmethod
+    def _top(totals: Dict[str, int], limit: int) -> List[tuple]:
+        return sorted(totals.items(), key=lambda x: -x[1])[:limit]
+
+    def _last_query(self, user_id: int) -> dict:
+        """select_page() arguments reading the user's newest expense"""
+        return {**self._page_query(user_id, None, None), "limit": 1, "descending": True}
+
+
+class ExpenseStorage(_ExpenseStorageBase):
+    """Expense storage service with YDB or in-memory backend"""
 
     def __init__(self, use_memory: bool = False):
         if use_memory:
-            self.db = MemoryDB()
+            self.db = get_memory_db()
         else:
             self.db = get_db()
-        self._ensure_table()
-        self._ensure_settings_table()
+        self.category_cache = learned_category_cache()
 
-    def _ensure_table(self):
-        """Ensure expenses table exists"""
-        if isinstance(self.db, YDBClient):
-            try:
-                self.db.execute(f"""
-                    CREATE TABLE IF NOT EXISTS {self.TABLE_NAME} (
-                        user_id Int64,
-                        item Utf8,
-                        amount Int64,
-                        category Utf8,
-                        created_at Timestamp,
-                        PRIMARY KEY (user_id, created_at)
-                    )
-                """)
-            except Exception:
-                pass  # Table may already exist
-
-    def _ensure_settings_table(self):
-        """Ensure user_settings table exists"""
-        if isinstance(self.db, YDBClient):
+    def check_schema(self) -> bool:
+        """Whether the database has the schema version this code expects.
+
+        Reads schema_version once per database; tables are created and
+        migrated by scripts/init_ydb.py, never on startup.
+        """
+        key = self._schema_key()
+        if key is None:
+            return True
+        if key not in _schema_versions:
             try:
-                self.db.execute(f"""
-                    CREATE TABLE IF NOT EXISTS {self.SETTINGS_TABLE} (
-                        user_id Int64,
-                        budget Int64,
-                        PRIMARY KEY (user_id)
-                    )
-                """)
-            except Exception:
-                pass  # Table may already exist
+                rows = self.db.execute(self.SCHEMA_VERSION_QUERY, tx_mode=self.READ_TX_MODE)
+            except Exception as e:
+                print(f"Schema version check error: {e}")
+                return False  # not cached; checked again next time
+            _schema_versions[key] = self._schema_version(rows)
+        return self._schema_current(_schema_versions[key])
 
     # Budget Management
     def save_budget(self, user_id: int, amount: int) -> bool:
         """Save user budget to database (upsert)"""
-        # Delete existing budget first (for MemoryDB compatibility)
-        self.db.delete(self.SETTINGS_TABLE, {"user_id": user_id})
-        # Insert new budget
-        data = {
-            "user_id": user_id,
-            "budget": amount,
-        }
-        return self.db.insert(self.SETTINGS_TABLE, data)
+        # Delete + insert (for MemoryDB compatibility) in one request and one commit
+        return self.db.batch(self._budget_ops(user_id, amount))
 
     def get_budget(self, user_id: int) -> Optional[int]:
         """Get user budget from database"""
-        rows = self.db.select(self.SETTINGS_TABLE, {"user_id": user_id}, limit=1)
+        rows = self.db.select(self.SETTINGS_TABLE, {"user_id": user_id}, limit=1, tx_mode=self.READ_TX_MODE)
         if rows:
             return int(rows[0].get("budget", 0)) or None
         return None
 
-    def save_expense(self, expense: Expense) -> bool:
-        """Save expense to storage"""
-        data = {
-            "user_id": expense.user_id,
-            "item": expense.item,
-            "amount": expense.amount,
-            "category": expense.category,
-            "created_at": expense.created_at.isoformat() if expense.created_at else datetime.now().isoformat(),
-        }
-        return self.db.insert(self.TABLE_NAME, data)
+    def save_expense(self, expense: Expense, confirmed: bool = False) -> bool:
+        """Save expense to storage.
+
+        A `confirmed` expense (the user accepted its category) also
+        teaches the user's category for the item.
+        """
+        if not confirmed:
+            return self.db.batch(self._save_ops(expense))
+        ops = self._save_ops(expense) + self._learn_ops(expense.user_id, expense.item, expense.category)
+        saved = self.db.batch(ops)
+        if saved:
+            self._remember_category(expense.user_id, expense.item, expense.category)
+        return saved
+
+    def get_learned_categories(self, user_id: int, items: List[str]) -> Dict[str, str]:
+        """Learned categories of the user's items, by item_key"""
+        found, missing = self._cached_categories(user_id, items)
+        results = [
+            self.db.select(self.LEARNED_TABLE, {"user_id": user_id, "item_key": key}, limit=1,
+                           tx_mode=self.READ_TX_MODE)
+            for key in missing
+        ]
+        self._store_categories(user_id, missing, results, found)
+        return found
+
+    def save_expenses(self, expenses: List[Expense]) -> bool:
+        """Save several expenses with one multi-row write"""
+        if not expenses:
+            return True
+        return self.db.batch(self._save_many_ops(expenses))
 
     def get_expenses(self, user_id: int, limit: int = 100) -> List[Expense]:
         """Get all expenses for user"""
-        rows = self.db.select(self.TABLE_NAME, {"user_id": user_id}, limit=limit)
+        rows = self.db.select(self.TABLE_NAME, {"user_id": user_id}, limit=limit, tx_mode=self.READ_TX_MODE)
         return [self._row_to_expense(row) for row in rows]
 
+    def iter_expenses(
+        self,
+        user_id: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        page_size: Optional[int] = None,
+    ) -> Iterator[Expense]:
+        """Stream expenses with since <= created_at < until, oldest first.
+
+        Pages through the (user_id, created_at) key with keyset
+        continuation, so only one page is held in memory at a time.
+        """
+        return self._iter_pages(self._page_query(user_id, since, until), page_size)
+
+    def _iter_pages(self, query: dict, page_size: Optional[int] = None) -> Iterator[Expense]:
+        """Keyset-page through select_page() arguments built by _page_query()"""
+        page_size = page_size or self.DEFAULT_PAGE_SIZE
+        after = None
+        while True:
+            rows = self.db.select_page(**query, after=after, limit=page_size, tx_mode=self.READ_TX_MODE)
+            for row in rows:
+                yield self._row_to_expense(row)
+            if len(rows) < page_size:
+                return
+            after = rows[-1]["created_at"]
+
+    def scan_expenses(
+        self,
+        user_id: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Iterator[Expense]:
+        """Stream expenses for long-range reads (year exports, all-time stats).
+
+        On YDB this is a single scan query: rows arrive as a stream, with no
+        per-page round trips and no data query result size limit.
+        """
+        for row in self.db.scan_range(**self._page_query(user_id, since, until)):
+            yield self._row_to_expense(row)
+
+    def get_expenses_between(self, user_id: int, start: datetime, end: datetime) -> List[Expense]:
+        """Get expenses with start <= created_at < end, oldest first"""
+        return list(self.iter_expenses(user_id, since=start, until=end))
+
     def get_monthly_expenses(self, user_id: int) -> List[Expense]:
         """Get expenses for current month"""
-        now = datetime.now()
-        start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-        expenses = self.get_expenses(user_id)
-        return [
-            e for e in expenses
-            if e.created_at and e.created_at >= start_of_month
-        ]
+        return self.get_expenses_between(user_id, *self._month_bounds())
 
     def get_by_category(self, user_id: int, category: str) -> List[Expense]:
         """Get expenses by category"""
-        expenses = self.get_monthly_expenses(user_id)
-        return [e for e in expenses if e.category == category]
+        return list(self._iter_pages(self._category_query(user_id, category)))
+
+    def find_expenses(self, user_id: int, item: str) -> List[Expense]:
+        """Get this month's expenses whose name starts with `item` (case-insensitive)"""
+        return list(self._iter_pages(self._item_query(user_id, item)))
 
     def get_item_total(self, user_id: int, item: str) -> int:
         """Get total spent on specific item"""
-        expenses = self.get_monthly_expenses(user_id)
-        item_lower = item.lower()
-        return sum(
-            e.amount for e in expenses
-            if item_lower in e.item.lower()
+        query = self._item_query(user_id, item)
+        rows = self.db.aggregate(
+            query["table"], query["where"], query["column"], query["start"], query["end"],
+            group_by="category", value="amount", tx_mode=self.READ_TX_MODE, view=query["view"],
+        )
+        return self._sum_totals(rows)
+
+    def get_category_stats(
+        self,
+        user_id: int,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Dict[str, Tuple[int, int]]:
+        """Get (sum, count) per category.
+
+        Defaults to the current month, which is read from the monthly
+        rollup; explicit ranges, and a month without rollup rows (expenses
+        saved before the rollup existed), run one aggregation query over
+        raw rows.
+        """
+        if start is None or end is None:
+            rows = self.db.select(self.ROLLUP_TABLE, self._rollup_where(user_id), tx_mode=self.READ_TX_MODE)
+            if rows:
+                return self._stats_from_rollup(rows)
+            start, end = self._month_bounds()
+
+        rows = self.db.aggregate(
+            *self._aggregate_args(user_id, start, end), group_by="category", value="amount", tx_mode=self.READ_TX_MODE
         )
+        return self._stats_from_aggregate(rows)
+
+    def rebuild_monthly_rollup(self, user_id: int, month_start: Optional[datetime] = None) -> bool:
+        """Recompute a user's monthly rollup from raw expense rows.
+
+        Used to backfill months written before the rollup existed.
+        """
+        month_start, month_end = self._rebuild_range(month_start)
+        stats = self.get_category_stats(user_id, month_start, month_end)
+        return self.db.batch(self._rebuild_ops(user_id, month_start, stats))
 
     def get_category_totals(self, user_id: int) -> Dict[str, int]:
         """Get totals by category"""
-        expenses = self.get_monthly_expenses(user_id)
-        totals: Dict[str, int] = defaultdict(int)
-        for e in expenses:
-            totals[e.category] += e.amount
-        return dict(totals)
+        stats = self.get_category_stats(user_id)
+        return {category: total for category, (total, _) in stats.items()}
 
     def get_total(self, user_id: int) -> int:
         """Get total expenses for current month"""
-        expenses = self.get_monthly_expenses(user_id)
-        return sum(e.amount for e in expenses)
+        return sum(self.get_category_totals(user_id).values())
 
     def get_top_categories(self, user_id: int, limit: int = 5) -> List[tuple]:
         """Get top spending categories"""
-        totals = self.get_category_totals(user_id)
-        sorted_totals = sorted(totals.items(), key=lambda x: -x[1])
-        return sorted_totals[:limit]
+        return self._top(self.get_category_totals(user_id), limit)
 
-    def _row_to_expense(self, row: dict) -> Expense:
-        """Convert database row to Expense object"""
-        created_at = row.get("created_at")
-        if isinstance(created_at, str):
-            try:
-                created_at = datetime.fromisoformat(created_at)
-            except ValueError:
-                created_at = datetime.now()
-        elif not isinstance(created_at, datetime):
-            created_at = datetime.now()
-
-        return Expense(
-            user_id=int(row.get("user_id", 0)),
-            item=str(row.get("item", "")),
-            amount=int(row.get("amount", 0)),
-            category=str(row.get("category", "Другое")),
-            created_at=created_at,
-        )
+    def _get_expense_row(self, user_id: int, created_at: str) -> Optional[dict]:
+        """Get raw expense row by primary key"""
+        rows = self.db.select(self.TABLE_NAME, {"user_id": user_id, "created_at": created_at}, limit=1)
+        return rows[0] if rows else None
+
+    def get_expense(self, user_id: int, created_at: str) -> Optional[Expense]:
+        """Get expense by user_id and created_at timestamp"""
+        row = self._get_expense_row(user_id, created_at)
+        return self._row_to_expense(row) if row else None
 
     def delete_expense(self, user_id: int, created_at: str) -> bool:
         """Delete expense by user_id and created_at timestamp"""
-        return self.db.delete(self.TABLE_NAME, {
-            "user_id": user_id,
-            "created_at": created_at,
-        })
+        row = self._get_expense_row(user_id, created_at)
+        if not row:
+            return self.db.delete(self.TABLE_NAME, {"user_id": user_id, "created_at": created_at})
+        return self.db.batch(self._delete_ops(user_id, created_at, row))
 
     def update_expense_category(self, user_id: int, created_at: str, new_category: str) -> bool:
         """Update category for an expense"""
-        return self.db.update(
-            self.TABLE_NAME,
-            {"user_id": user_id, "created_at": created_at},
-            {"category": new_category}
-        )
+        row = self._get_expense_row(user_id, created_at)
+        if not row:
+            return self.db.update(
+                self.TABLE_NAME, {"user_id": user_id, "created_at": created_at}, {"category": new_category}
+            )
+        if str(row.get("category")) == new_category:
+            return True
+        updated = self.db.batch(self._recategorize_ops(user_id, created_at, row, new_category))
+        if updated:
+            self._remember_category(user_id, str(row.get("item") or ""), new_category)
+        return updated
 
     def get_last_expense(self, user_id: int) -> Optional[Expense]:
         """Get the most recent expense for user (latest by created_at)"""
-        expenses = self.get_expenses(user_id)
-        if not expenses:
-            return None
-        # Sort by created_at descending and return the first (most recent)
-        sorted_expenses = sorted(expenses, key=lambda e: e.created_at, reverse=True)
-        return sorted_expenses[0]
+        rows = self.db.select_page(**self._last_query(user_id), tx_mode=self.READ_TX_MODE)
+        return self._row_to_expense(rows[0]) if rows else None
+
+    def pop_last_expense(self, user_id: int) -> Optional[Expense]:
+        """Delete the user's most recent expense and return it.
+
+        On YDB the lookup, the delete and the rollup update are one request
+        and one commit.
+        """
+        if isinstance(self.db, YDBClient):
+            rows = self.db.execute_many(self._pop_last_statements(user_id))
+            return self._row_to_expense(rows[0]) if rows else None
+
+        expense = self.get_last_expense(user_id)
+        if expense is not None:
+            self.delete_expense(user_id, expense.created_at.isoformat())
+        return expense
 
     def get_today_expenses(self, user_id: int) -> List[Expense]:
         """Get expenses for today only"""
-        now = datetime.now()
-        start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-
-        expenses = self.get_expenses(user_id)
-        return [
-            e for e in expenses
-            if e.created_at and e.created_at >= start_of_day
-        ]
+        return self.get_expenses_between(user_id, *self._day_bounds())
 
     def get_week_expenses(self, user_id: int, weeks_ago: int = 0) -> List[Expense]:
         """Get expenses for a specific week
@@ -208,19 +665,7 @@ class ExpenseStorage:
             user_id: User ID
             weeks_ago: 0 for current week, 1 for last week, etc.
         """
-        now = datetime.now()
-
-        # Calculate week boundaries (Monday to Sunday)
-        days_since_monday = now.weekday()
-        week_start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days_since_monday)
-        week_start = week_start - timedelta(weeks=weeks_ago)
-        week_end = week_start + timedelta(days=7)
-
-        expenses = self.get_expenses(user_id)
-        return [
-            e for e in expenses
-            if e.created_at and week_start <= e.created_at < week_end
-        ]
+        return self.get_expenses_between(user_id, *self._week_bounds(weeks_ago))
 
     def get_today_total(self, user_id: int) -> int:
         """Get total expenses for today"""
@@ -231,3 +676,255 @@ class ExpenseStorage:
         """Get total expenses for a specific week"""
         expenses = self.get_week_expenses(user_id, weeks_ago)
         return sum(e.amount for e in expenses)
+
+
+class AsyncExpenseStorage(_ExpenseStorageBase):
+    """ExpenseStorage with awaitable methods for use on the event loop.
+
+    Backed by AsyncYDBClient, or by an awaitable wrapper around the
+    in-memory database. Tables are created by scripts/init_ydb.py.
+    """
+
+    def __init__(self, db=None, use_memory: bool = False, category_cache: Optional[ParseCache] = None):
+        if db is None:
+            db = get_async_db(get_memory_db() if use_memory else None)
+        self.db = db
+        self.category_cache = category_cache if category_cache is not None else learned_category_cache()
+
+    @classmethod
+    def from_storage(cls, storage: ExpenseStorage) -> "AsyncExpenseStorage":
+        """Async storage over the same backend (and learned category cache) as `storage`"""
+        return cls(get_async_db(storage.db), category_cache=storage.category_cache)
+
+    @property
+    def ready(self) -> bool:
+        """Whether the backend is connected with warm sessions"""
+        return self.db.ready
+
+    async def warmup(self, sessions: Optional[int] = None) -> bool:
+        """Connect, pre-create backend sessions and check the schema version.
+
+        See AsyncYDBClient.warmup; an outdated schema is reported but
+        does not fail the warmup.
+        """
+        ready = await self.db.warmup(sessions)
+        if ready:
+            await self.check_schema()
+        return ready
+
+    async def check_schema(self) -> bool:
+        """Whether the database has the schema version this code expects; see ExpenseStorage"""
+        key = self._schema_key()
+        if key is None:
+            return True
+        if key not in _schema_versions:
+            try:
+                rows = await self.db.execute(self.SCHEMA_VERSION_QUERY, tx_mode=self.READ_TX_MODE)
+            except Exception as e:
+                print(f"Schema version check error: {e}")
+                return False  # not cached; checked again next time
+            _schema_versions[key] = self._schema_version(rows)
+        return self._schema_current(_schema_versions[key])
+
+    async def close(self):
+        await self.db.close()
+
+    # Budget Management
+    async def save_budget(self, user_id: int, amount: int) -> bool:
+        """Save user budget to database (upsert)"""
+        return await self.db.batch(self._budget_ops(user_id, amount))
+
+    async def get_budget(self, user_id: int) -> Optional[int]:
+        """Get user budget from database"""
+        rows = await self.db.select(self.SETTINGS_TABLE, {"user_id": user_id}, limit=1, tx_mode=self.READ_TX_MODE)
+        if rows:
+            return int(rows[0].get("budget", 0)) or None
+        return None
+
+    async def save_expense(self, expense: Expense, confirmed: bool = False) -> bool:
+        """Save expense to storage; see ExpenseStorage.save_expense"""
+        if not confirmed:
+            return await self.db.batch(self._save_ops(expense))
+        ops = self._save_ops(expense) + self._learn_ops(expense.user_id, expense.item, expense.category)
+        saved = await self.db.batch(ops)
+        if saved:
+            self._remember_category(expense.user_id, expense.item, expense.category)
+        return saved
+
+    async def get_learned_categories(self, user_id: int, items: List[str]) -> Dict[str, str]:
+        """Learned categories of the user's items, by item_key"""
+        found, missing = self._cached_categories(user_id, items)
+        results = await asyncio.gather(*(
+            self.db.select(self.LEARNED_TABLE, {"user_id": user_id, "item_key": key}, limit=1,
+                           tx_mode=self.READ_TX_MODE)
+            for key in missing
+        ))
+        self._store_categories(user_id, missing, list(results), found)
+        return found
+
+    async def save_expenses(self, expenses: List[Expense]) -> bool:
+        """Save several expenses with one multi-row write"""
+        if not expenses:
+            return True
+        return await self.db.batch(self._save_many_ops(expenses))
+
+    async def get_expenses(self, user_id: int, limit: int = 100) -> List[Expense]:
+        """Get all expenses for user"""
+        rows = await self.db.select(self.TABLE_NAME, {"user_id": user_id}, limit=limit, tx_mode=self.READ_TX_MODE)
+        return [self._row_to_expense(row) for row in rows]
+
+    def iter_expenses(
+        self,
+        user_id: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        page_size: Optional[int] = None,
+    ) -> AsyncIterator[Expense]:
+        """Stream expenses with since <= created_at < until, oldest first"""
+        return self._iter_pages(self._page_query(user_id, since, until), page_size)
+
+    async def _iter_pages(self, query: dict, page_size: Optional[int] = None) -> AsyncIterator[Expense]:
+        page_size = page_size or self.DEFAULT_PAGE_SIZE
+        after = None
+        while True:
+            rows = await self.db.select_page(**query, after=after, limit=page_size, tx_mode=self.READ_TX_MODE)
+            for row in rows:
+                yield self._row_to_expense(row)
+            if len(rows) < page_size:
+                return
+            after = rows[-1]["created_at"]
+
+    async def scan_expenses(
+        self,
+        user_id: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> AsyncIterator[Expense]:
+        """Stream expenses for long-range reads; see ExpenseStorage.scan_expenses"""
+        async for row in self.db.scan_range(**self._page_query(user_id, since, until)):
+            yield self._row_to_expense(row)
+
+    async def get_expenses_between(self, user_id: int, start: datetime, end: datetime) -> List[Expense]:
+        """Get expenses with start <= created_at < end, oldest first"""
+        return [e async for e in self.iter_expenses(user_id, since=start, until=end)]
+
+    async def get_monthly_expenses(self, user_id: int) -> List[Expense]:
+        """Get expenses for current month"""
+        return await self.get_expenses_between(user_id, *self._month_bounds())
+
+    async def get_by_category(self, user_id: int, category: str) -> List[Expense]:
+        """Get expenses by category"""
+        return [e async for e in self._iter_pages(self._category_query(user_id, category))]
+
+    async def find_expenses(self, user_id: int, item: str) -> List[Expense]:
+        """Get this month's expenses whose name starts with `item` (case-insensitive)"""
+        return [e async for e in self._iter_pages(self._item_query(user_id, item))]
+
+    async def get_item_total(self, user_id: int, item: str) -> int:
+        """Get total spent on specific item"""
+        query = self._item_query(user_id, item)
+        rows = await self.db.aggregate(
+            query["table"], query["where"], query["column"], query["start"], query["end"],
+            group_by="category", value="amount", tx_mode=self.READ_TX_MODE, view=query["view"],
+        )
+        return self._sum_totals(rows)
+
+    async def get_category_stats(
+        self,
+        user_id: int,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Dict[str, Tuple[int, int]]:
+        """Get (sum, count) per category; see ExpenseStorage.get_category_stats"""
+        if start is None or end is None:
+            rows = await self.db.select(self.ROLLUP_TABLE, self._rollup_where(user_id), tx_mode=self.READ_TX_MODE)
+            if rows:
+                return self._stats_from_rollup(rows)
+            start, end = self._month_bounds()
+
+        rows = await self.db.aggregate(
+            *self._aggregate_args(user_id, start, end), group_by="category", value="amount", tx_mode=self.READ_TX_MODE
+        )
+        return self._stats_from_aggregate(rows)
+
+    async def rebuild_monthly_rollup(self, user_id: int, month_start: Optional[datetime] = None) -> bool:
+        """Recompute a user's monthly rollup from raw expense rows"""
+        month_start, month_end = self._rebuild_range(month_start)
+        stats = await self.get_category_stats(user_id, month_start, month_end)
+        return await self.db.batch(self._rebuild_ops(user_id, month_start, stats))
+
+    async def get_category_totals(self, user_id: int) -> Dict[str, int]:
+        """Get totals by category"""
+        stats = await self.get_category_stats(user_id)
+        return {category: total for category, (total, _) in stats.items()}
+
+    async def get_total(self, user_id: int) -> int:
+        """Get total expenses for current month"""
+        return sum((await self.get_category_totals(user_id)).values())
+
+    async def get_top_categories(self, user_id: int, limit: int = 5) -> List[tuple]:
+        """Get top spending categories"""
+        return self._top(await self.get_category_totals(user_id), limit)
+
+    async def _get_expense_row(self, user_id: int, created_at: str) -> Optional[dict]:
+        """Get raw expense row by primary key"""
+        rows = await self.db.select(self.TABLE_NAME, {"user_id": user_id, "created_at": created_at}, limit=1)
+        return rows[0] if rows else None
+
+    async def get_expense(self, user_id: int, created_at: str) -> Optional[Expense]:
+        """Get expense by user_id and created_at timestamp"""
+        row = await self._get_expense_row(user_id, created_at)
+        return self._row_to_expense(row) if row else None
+
+    async def delete_expense(self, user_id: int, created_at: str) -> bool:
+        """Delete expense by user_id and created_at timestamp"""
+        row = await self._get_expense_row(user_id, created_at)
+        if not row:
+            return await self.db.delete(self.TABLE_NAME, {"user_id": user_id, "created_at": created_at})
+        return await self.db.batch(self._delete_ops(user_id, created_at, row))
+
+    async def update_expense_category(self, user_id: int, created_at: str, new_category: str) -> bool:
+        """Update category for an expense"""
+        row = await self._get_expense_row(user_id, created_at)
+        if not row:
+            return await self.db.update(
+                self.TABLE_NAME, {"user_id": user_id, "created_at": created_at}, {"category": new_category}
+            )
+        if str(row.get("category")) == new_category:
+            return True
+        updated = await self.db.batch(self._recategorize_ops(user_id, created_at, row, new_category))
+        if updated:
+            self._remember_category(user_id, str(row.get("item") or ""), new_category)
+        return updated
+
+    async def get_last_expense(self, user_id: int) -> Optional[Expense]:
+        """Get the most recent expense for user (latest by created_at)"""
+        rows = await self.db.select_page(**self._last_query(user_id), tx_mode=self.READ_TX_MODE)
+        return self._row_to_expense(rows[0]) if rows else None
+
+    async def pop_last_expense(self, user_id: int) -> Optional[Expense]:
+        """Delete the user's most recent expense and return it; see ExpenseStorage.pop_last_expense"""
+        if isinstance(self.db, YDBClient):
+            rows = await self.db.execute_many(self._pop_last_statements(user_id))
+            return self._row_to_expense(rows[0]) if rows else None
+
+        expense = await self.get_last_expense(user_id)
+        if expense is not None:
+            await self.delete_expense(user_id, expense.created_at.isoformat())
+        return expense
+
+    async def get_today_expenses(self, user_id: int) -> List[Expense]:
+        """Get expenses for today only"""
+        return await self.get_expenses_between(user_id, *self._day_bounds())
+
+    async def get_week_expenses(self, user_id: int, weeks_ago: int = 0) -> List[Expense]:
+        """Get expenses for a specific week (0 = current week)"""
+        return await self.get_expenses_between(user_id, *self._week_bounds(weeks_ago))
+
+    async def get_today_total(self, user_id: int) -> int:
+        """Get total expenses for today"""
+        return sum(e.amount for e in await self.get_today_expenses(user_id))
+
+    async def get_week_total(self, user_id: int, weeks_ago: int = 0) -> int:
+        """Get total expenses for a specific week"""
+        return sum(e.amount for e in await self.get_week_expenses(user_id, weeks_ago))
@@ -0,0 +1,137 @@
+"""
+Cache of YaGPT parse answers.
+
+Keyed by the normalized message text and a digest of the system prompt,
+so editing a prompt invalidates its entries. Entries live in a bounded
+in-process LRU with a TTL; an optional SQLite file behind it keeps them
+across restarts and can be shared by workers on the same host.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+
+def normalize_message(message: str) -> str:
+    """Cache form of a message: lowercase, ё -> е, single spaces, no trailing punctuation"""
+    return " ".join(message.lower().replace("ё", "е").split()).rstrip(".!?")
+
+
+def prompt_version(system_prompt: str) -> str:
+    """Short digest identifying a system prompt"""
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:12]
+
+
+class SQLiteCacheBackend:
+    """Parse answers in an SQLite file"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS parse_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM parse_cache WHERE expires_at <= ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM parse_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parse_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+
+    def close(self):
+        self._conn.close()
+
+
+class ParseCache:
+    """LRU + TTL cache of YaGPT answers with hit/miss counters"""
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: float = 7 * 24 * 3600,
+        backend: Optional[SQLiteCacheBackend] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(message: str, system_prompt: str) -> str:
+        return f"{prompt_version(system_prompt)}:{normalize_message(message)}"
+
+    def get(self, key: str) -> Optional[str]:
+        now = self.clock()
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= now:
+            del self._entries[key]
+            entry = None
+        if entry is None and self.backend is not None:
+            entry = self.backend.get(key)
+            if entry is not None and entry[1] > now:
+                self._remember(key, entry)
+            else:
+                entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: str, value: str):
+        entry = (value, self.clock() + self.ttl)
+        self._remember(key, entry)
+        if self.backend is not None:
+            self.backend.set(key, *entry)
+
+    def _remember(self, key: str, entry: Tuple[str, float]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        self._entries.clear()
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
+
+
+def get_parse_cache() -> ParseCache:
+    """Parse cache configured from env (PARSE_CACHE_SIZE, PARSE_CACHE_TTL, PARSE_CACHE_PATH)"""
+    path = os.getenv("PARSE_CACHE_PATH", "")
+    return ParseCache(
+        max_size=int(os.getenv("PARSE_CACHE_SIZE", "10000")),
+        ttl=float(os.getenv("PARSE_CACHE_TTL", str(7 * 24 * 3600))),
+        backend=SQLiteCacheBackend(path) if path else None,
+    )
@@ -4,18 +4,41 @@ Uses Yandex GPT API for natural language processing.
 
 BDD Reference: NLE-A-8
 """
+import asyncio
 import os
 import re
 import json
+import threading
+import time
 import httpx
+from concurrent.futures import Future
 from dataclasses import dataclass
-from typing import Optional, List
+from typing import Callable, Dict, Optional, List, Tuple
 from dotenv import load_dotenv
 
+from src.services.expense_parser import NUMBER_WORDS, LocalExpenseParser
+from src.services.parse_cache import ParseCache, get_parse_cache
+
+try:
+    import h2  # noqa: F401 (enables http2=True in httpx)
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
 load_dotenv()
 
 
-@dataclass
+def http_limits() -> httpx.Limits:
+    """Connection pool limits (YAGPT_MAX_CONNECTIONS, YAGPT_KEEPALIVE_EXPIRY seconds)"""
+    max_connections = int(os.getenv("YAGPT_MAX_CONNECTIONS", "20"))
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=float(os.getenv("YAGPT_KEEPALIVE_EXPIRY", "120")),
+    )
+
+
+@dataclass(slots=True)
 class ParsedExpense:
     """Parsed expense from user message"""
     item: str
@@ -23,6 +46,10 @@ class ParsedExpense:
     category: str
 
 
+# Per-user category lookup by item (learned from the user's corrections)
+LearnedCategories = Callable[[str], Optional[str]]
+
+
 @dataclass
 class Intent:
     """Detected user intent"""
@@ -52,49 +79,161 @@ CATEGORY_KEYWORDS = {
 }
 
 
+def compile_keywords(table: Dict[str, List[str]]) -> Tuple["re.Pattern[str]", Dict[str, int]]:
+    """One regex over all keywords, and keyword -> category rank.
+
+    The alternation is wrapped in a lookahead so a single finditer pass
+    reports a keyword at every start position, even when keywords
+    overlap. Alternatives are ordered by category rank (the table order),
+    so at each position the highest-priority keyword wins.
+    """
+    ranks: Dict[str, int] = {}
+    for rank, keywords in enumerate(table.values()):
+        for keyword in keywords:
+            ranks.setdefault(keyword, rank)
+    alternation = "|".join(re.escape(k) for k in sorted(ranks, key=lambda k: (ranks[k], -len(k), k)))
+    return re.compile(f"(?=({alternation}))"), ranks
+
+
+# Compiled at import; category names by rank
+_KEYWORD_PATTERN, _KEYWORD_RANKS = compile_keywords(CATEGORY_KEYWORDS)
+_KEYWORD_CATEGORIES = list(CATEGORY_KEYWORDS)
+
+# Case endings a keyword may take and still count as a word of its own:
+# "обеда", "врача", "обеды", but not "кафель" or "клубника"
+_INFLECTIONS = frozenset("а я у ю е и ы о ой ей ом ем ам ям ами ями ах ях ов ев".split())
+_KEYWORD_STEMS = frozenset(_KEYWORD_RANKS) | frozenset(k[:-1] for k in _KEYWORD_RANKS if k[-1] in "аяоеиыую")
+
+
+def has_keyword_word(text: str) -> bool:
+    """True when some word of `text` is a keyword or an inflected keyword.
+
+    _detect_category also matches keywords inside words ("клубника"
+    contains "клуб"); such hits are too weak to skip YaGPT.
+    """
+    for word in re.findall(r"[a-zа-я0-9]+", text.lower().replace("ё", "е")):
+        if word in _KEYWORD_RANKS:
+            return True
+        for n in (1, 2, 3):
+            if word[-n:] in _INFLECTIONS and word[:-n] in _KEYWORD_STEMS:
+                return True
+    return False
+
+
+# System prompts of the single and multi-expense parsers
+EXPENSE_PROMPT = f"""Ты парсер расходов. Твоя задача - извлечь из сообщения пользователя информацию о расходе.
+
+Извлеки:
+1. item - на что потрачено (краткое описание, 1-3 слова)
+2. amount - сумма в рублях (целое число)
+3. category - категория из списка: {', '.join(CATEGORIES)}
+
+Правила:
+- Если сумма указана словами (тыща, сотка, пятихатка), преобразуй в число
+- тыща/тысяча/штука/косарь = 1000
+- сотка/сотня = 100
+- полтинник/полтос = 50
+- пятихатка = 500
+- Если категория неясна, используй "Другое"
+- Если это не расход или сумма не указана, верни null
+
+Отвечай ТОЛЬКО валидным JSON без пояснений:
+{{"item": "описание", "amount": число, "category": "категория"}}
+или null если это не расход."""
+
+MULTIPLE_EXPENSES_PROMPT = f"""Ты парсер расходов. Извлеки ВСЕ расходы из сообщения пользователя.
+Сообщение может содержать один или несколько расходов, перечисленных через "и", запятую или просто подряд.
+
+Для каждого расхода извлеки:
+1. item - на что потрачено (краткое описание, 1-3 слова)
+2. amount - сумма в рублях (целое число)
+3. category - категория из списка: {', '.join(CATEGORIES)}
+
+Правила преобразования сумм:
+- тыща/тысяча/штука/косарь/кусок = 1000
+- сотка/сотня = 100
+- полтинник/полтос = 50
+- пятихатка = 500
+- двадцатка = 20
+- 2к/5к = 2000/5000
+- "две тыщи" = 2000, "три сотни" = 300
+
+Категории:
+- Переводы: маме, папе, жене, мужу, другу, перевод, скинул, отправил
+- Еда: кофе, обед, завтрак, ужин, продукты, ресторан
+- Транспорт: такси, метро, бензин
+- Развлечения: бар, кино, пиво, вино, игры
+- Подписки: подписка, netflix, spotify
+- Здоровье: аптека, врач, спортзал
+- Другое: если не подходит ни одна
+
+Отвечай ТОЛЬКО валидным JSON массивом:
+[{{"item": "описание", "amount": число, "category": "категория"}}]
+или [] если это не расход."""
+
+
 class YaGPTService:
     """YaGPT service for expense parsing using LLM"""
 
-    def __init__(self):
+    IAM_URL = "https://iam.api.cloud.yandex.net/iam/v1/tokens"
+    # Token valid for 12 hours, refresh after 11
+    IAM_TOKEN_TTL = 11 * 3600
+
+    def __init__(self, cache: Optional[ParseCache] = None):
         self.oauth_token = os.getenv("YC_TOKEN", "")
         self.folder_id = os.getenv("YC_FOLDER_ID", "")
         self.api_url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
         self._iam_token = None
         self._iam_token_expires = 0
+        self._client: Optional[httpx.Client] = None
+        self.local_parser = LocalExpenseParser(self._detect_category)
+        # YaGPT answers by (system prompt, normalized message)
+        self.cache = cache if cache is not None else get_parse_cache()
+        # Single flight: cache key -> answer of the call already in progress
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self.coalesced = 0
+
+    def _http(self) -> httpx.Client:
+        """Long-lived client, so connections to the API are reused between calls"""
+        if self._client is None:
+            self._client = httpx.Client(timeout=30, limits=http_limits())
+        return self._client
+
+    def _cached_iam_token(self) -> Optional[str]:
+        if self._iam_token and time.time() < self._iam_token_expires:
+            return self._iam_token
+        return None
+
+    def _store_iam_token(self, data: dict) -> str:
+        self._iam_token = data.get("iamToken", "")
+        self._iam_token_expires = time.time() + self.IAM_TOKEN_TTL
+        return self._iam_token
 
     def _get_iam_token(self) -> str:
         """Get IAM token from OAuth token"""
-        import time
-
         # Check if we have a valid cached token
-        if self._iam_token and time.time() < self._iam_token_expires:
-            return self._iam_token
+        cached = self._cached_iam_token()
+        if cached:
+            return cached
 
         if not self.oauth_token:
             return ""
 
         try:
-            with httpx.Client(timeout=10) as client:
-                response = client.post(
-                    "https://iam.api.cloud.yandex.net/iam/v1/tokens",
-                    json={"yandexPassportOauthToken": self.oauth_token}
-                )
-                response.raise_for_status()
-                data = response.json()
-                self._iam_token = data.get("iamToken", "")
-                # Token valid for 12 hours, refresh after 11
-                self._iam_token_expires = time.time() + 11 * 3600
-                return self._iam_token
+            response = self._http().post(
+                self.IAM_URL,
+                json={"yandexPassportOauthToken": self.oauth_token},
+                timeout=10,
+            )
+            response.raise_for_status()
+            return self._store_iam_token(response.json())
         except Exception as e:
             print(f"IAM token error: {e}")
             return ""
 
-    def _call_yagpt(self, prompt: str, system_prompt: str = "") -> str:
-        """Call YaGPT API"""
-        iam_token = self._get_iam_token()
-        if not iam_token or not self.folder_id:
-            return ""
-
+    def _completion_request(self, iam_token: str, prompt: str, system_prompt: str = "") -> Tuple[dict, dict]:
+        """Headers and body of a completion request"""
         headers = {
             "Authorization": f"Bearer {iam_token}",
             "Content-Type": "application/json",
@@ -114,25 +253,76 @@ class YaGPTService:
             },
             "messages": messages,
         }
+        return headers, data
+
+    @staticmethod
+    def _completion_text(result: dict) -> str:
+        return result.get("result", {}).get("alternatives", [{}])[0].get("message", {}).get("text", "")
+
+    def _call_yagpt(self, prompt: str, system_prompt: str = "") -> str:
+        """Call YaGPT API"""
+        iam_token = self._get_iam_token()
+        if not iam_token or not self.folder_id:
+            return ""
 
+        headers, data = self._completion_request(iam_token, prompt, system_prompt)
         try:
-            with httpx.Client(timeout=30) as client:
-                response = client.post(self.api_url, headers=headers, json=data)
-                response.raise_for_status()
-                result = response.json()
-                return result.get("result", {}).get("alternatives", [{}])[0].get("message", {}).get("text", "")
+            response = self._http().post(self.api_url, headers=headers, json=data)
+            response.raise_for_status()
+            return self._completion_text(response.json())
         except Exception as e:
             print(f"YaGPT API error: {e}")
             return ""
 
+    def _complete(self, message: str, system_prompt: str) -> str:
+        """YaGPT answer to a message, served from the parse cache when possible.
+
+        Threads asking the same question while it is in flight wait for
+        the first caller's answer instead of sending their own request.
+        """
+        key = self.cache.key(message, system_prompt)
+        response = self.cache.get(key)
+        if response is not None:
+            return response
+
+        with self._inflight_lock:
+            pending = self._inflight.get(key)
+            if pending is None:
+                self._inflight[key] = future = Future()
+            else:
+                self.coalesced += 1
+        if pending is not None:
+            return pending.result()
+
+        try:
+            response = self._call_yagpt(message, system_prompt)
+            if response:
+                self.cache.set(key, response)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        self.cache.close()
+
     def _detect_category(self, item: str) -> str:
-        """Detect category from item keywords (fallback)"""
-        item_lower = item.lower()
-        for category, keywords in CATEGORY_KEYWORDS.items():
-            for keyword in keywords:
-                if keyword in item_lower:
-                    return category
-        return "Другое"
+        """Detect category from item keywords; the earliest category in CATEGORY_KEYWORDS wins"""
+        best = None
+        for match in _KEYWORD_PATTERN.finditer(item.lower()):
+            rank = _KEYWORD_RANKS[match.group(1)]
+            if best is None or rank < best:
+                best = rank
+                if rank == 0:
+                    break
+        return _KEYWORD_CATEGORIES[best] if best is not None else "Другое"
 
     def _looks_like_expense(self, message: str) -> bool:
         """Check if message could possibly be an expense (has numbers or number words)"""
@@ -142,51 +332,68 @@ class YaGPTService:
         if re.search(r'\d+', text):
             return True
 
-        # Check for number words
-        number_words = [
-            "тысяч", "тыщ", "сотн", "сотк", "рубл", "руб",
-            "полтин", "косар", "штук", "кусок",
-            "сто", "двести", "триста", "четыреста", "пятьсот",
-            "шестьсот", "семьсот", "восемьсот", "девятьсот",
-            "тысяча", "тысячу", "тыща", "тыщу",
-            "один", "два", "три", "четыре", "пять",
-            "шесть", "семь", "восемь", "девять", "десять",
-        ]
-        for word in number_words:
-            if word in text:
-                return True
+        # Check for number words, including the slang the local parser reads
+        if not NUMBER_WORDS.keys().isdisjoint(re.findall(r"[a-zа-я]+", text.replace("ё", "е"))):
+            return True
+        number_stems = ["тысяч", "тыщ", "сотн", "сотк", "рубл", "руб", "полтин", "косар"]
+        return any(stem in text for stem in number_stems)
 
-        return False
+    def parse_expense(self, message: str, learned: Optional[LearnedCategories] = None) -> Optional[ParsedExpense]:
+        """Parse expense from user message, locally or using YaGPT.
 
-    def parse_expense(self, message: str) -> Optional[ParsedExpense]:
-        """Parse expense from user message using YaGPT"""
+        `learned` categories take precedence over keywords and YaGPT.
+        """
 
         # Pre-filter: if no numbers or number words, don't even try
         if not self._looks_like_expense(message):
             return None
 
-        system_prompt = f"""Ты парсер расходов. Твоя задача - извлечь из сообщения пользователя информацию о расходе.
+        local, confident = self._parse_locally(message, learned)
+        if confident and len(local) == 1:
+            return local[0]
 
-Извлеки:
-1. item - на что потрачено (краткое описание, 1-3 слова)
-2. amount - сумма в рублях (целое число)
-3. category - категория из списка: {', '.join(CATEGORIES)}
+        response = self._complete(message, EXPENSE_PROMPT)
+        if not response and local:
+            return local[0]
+        return self._with_learned(self._expense_from_response(message, response), learned)
 
-Правила:
-- Если сумма указана словами (тыща, сотка, пятихатка), преобразуй в число
-- тыща/тысяча/штука/косарь = 1000
-- сотка/сотня = 100
-- полтинник/полтос = 50
-- пятихатка = 500
-- Если категория неясна, используй "Другое"
-- Если это не расход или сумма не указана, верни null
+    def candidate_items(self, message: str) -> List[str]:
+        """Items the local rules find in a message, to look up learned categories for"""
+        return [e.item for e in self.local_parser.parse(message).expenses]
 
-Отвечай ТОЛЬКО валидным JSON без пояснений:
-{{"item": "описание", "amount": число, "category": "категория"}}
-или null если это не расход."""
-
-        response = self._call_yagpt(message, system_prompt)
+    def _parse_locally(
+        self, message: str, learned: Optional[LearnedCategories] = None
+    ) -> Tuple[List[ParsedExpense], bool]:
+        """Expenses found by the local rules, and whether they can be used without YaGPT.
 
+        Rules are trusted when they are sure of every amount and item and
+        every category is learned or comes from a whole keyword word.
+        """
+        result = self.local_parser.parse(message)
+        expenses = []
+        confident = result.confident
+        for e in result.expenses:
+            expense = ParsedExpense(item=e.item, amount=e.amount, category=e.category)
+            category = learned(e.item) if learned is not None else None
+            if category in CATEGORIES:
+                expense.category = category
+            elif not has_keyword_word(e.item):
+                confident = False
+            if expense.category == "Другое":
+                confident = False
+            expenses.append(expense)
+        return expenses, confident
+
+    @staticmethod
+    def _with_learned(expense: Optional[ParsedExpense], learned: Optional[LearnedCategories]) -> Optional[ParsedExpense]:
+        if expense is not None and learned is not None:
+            category = learned(expense.item)
+            if category in CATEGORIES:
+                expense.category = category
+        return expense
+
+    def _expense_from_response(self, message: str, response: str) -> Optional[ParsedExpense]:
+        """Expense from a YaGPT answer, falling back to the simple parser"""
         if response:
             try:
                 # Clean response - remove markdown code blocks if present
@@ -239,46 +446,30 @@ class YaGPTService:
 
         return None
 
-    def parse_multiple_expenses(self, message: str) -> List[ParsedExpense]:
+    def parse_multiple_expenses(
+        self, message: str, learned: Optional[LearnedCategories] = None
+    ) -> List[ParsedExpense]:
         """Parse multiple expenses from user message using YaGPT.
 
         Handles messages like: "жене перевел 500 и маме 500 и на пиво 1000"
-        Returns list of ParsedExpense objects.
+        Returns list of ParsedExpense objects. Messages the local rules
+        parse confidently (see LocalExpenseParser) are not sent to YaGPT;
+        `learned` categories take precedence over keywords and YaGPT.
         """
         if not self._looks_like_expense(message):
             return []
 
-        system_prompt = f"""Ты парсер расходов. Извлеки ВСЕ расходы из сообщения пользователя.
-Сообщение может содержать один или несколько расходов, перечисленных через "и", запятую или просто подряд.
-
-Для каждого расхода извлеки:
-1. item - на что потрачено (краткое описание, 1-3 слова)
-2. amount - сумма в рублях (целое число)
-3. category - категория из списка: {', '.join(CATEGORIES)}
+        local, confident = self._parse_locally(message, learned)
+        if confident:
+            return local
 
-Правила преобразования сумм:
-- тыща/тысяча/штука/косарь/кусок = 1000
-- сотка/сотня = 100
-- полтинник/полтос = 50
-- пятихатка = 500
-- двадцатка = 20
-- 2к/5к = 2000/5000
-- "две тыщи" = 2000, "три сотни" = 300
+        response = self._complete(message, MULTIPLE_EXPENSES_PROMPT)
+        if not response:
+            return local  # YaGPT unavailable: best local guess
+        return [self._with_learned(e, learned) for e in self._expenses_from_response(response)]
 
-Категории:
-- Переводы: маме, папе, жене, мужу, другу, перевод, скинул, отправил
-- Еда: кофе, обед, завтрак, ужин, продукты, ресторан
-- Транспорт: такси, метро, бензин
-- Развлечения: бар, кино, пиво, вино, игры
-- Подписки: подписка, netflix, spotify
-- Здоровье: аптека, врач, спортзал
-- Другое: если не подходит ни одна
-
-Отвечай ТОЛЬКО валидным JSON массивом:
-[{{"item": "описание", "amount": число, "category": "категория"}}]
-или [] если это не расход."""
-
-        response = self._call_yagpt(message, system_prompt)
+    def _expenses_from_response(self, response: str) -> List[ParsedExpense]:
+        """Expenses from a YaGPT JSON array answer"""
         expenses = []
 
         if response:
@@ -387,3 +578,138 @@ class YaGPTService:
 
         lines.append(f"\n💰 *Итого: {total:,}₽*")
         return "\n".join(lines)
+
+
+class AsyncYaGPTService(YaGPTService):
+    """YaGPTService over a shared httpx.AsyncClient.
+
+    One client per service keeps a pool of keep-alive connections (HTTP/2
+    when the h2 package is installed), so a message costs one request
+    instead of a TCP and TLS handshake, and parsing does not block the
+    event loop. Parsing methods are awaitable; intent detection and
+    response formatting are inherited unchanged.
+    """
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, cache: Optional[ParseCache] = None):
+        super().__init__(cache)
+        self._async_client = client
+        self._iam_lock = asyncio.Lock()
+        self._inflight_tasks: Dict[str, "asyncio.Task[str]"] = {}
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                http2=HAS_HTTP2,
+                timeout=httpx.Timeout(30, connect=10),
+                limits=http_limits(),
+            )
+        return self._async_client
+
+    async def _get_iam_token(self) -> str:
+        """Get IAM token from OAuth token; concurrent callers share one refresh"""
+        cached = self._cached_iam_token()
+        if cached:
+            return cached
+
+        if not self.oauth_token:
+            return ""
+
+        async with self._iam_lock:
+            cached = self._cached_iam_token()
+            if cached:
+                return cached
+            try:
+                response = await self._http().post(
+                    self.IAM_URL,
+                    json={"yandexPassportOauthToken": self.oauth_token},
+                    timeout=10,
+                )
+                response.raise_for_status()
+                return self._store_iam_token(response.json())
+            except Exception as e:
+                print(f"IAM token error: {e}")
+                return ""
+
+    async def _call_yagpt(self, prompt: str, system_prompt: str = "") -> str:
+        """Call YaGPT API"""
+        iam_token = await self._get_iam_token()
+        if not iam_token or not self.folder_id:
+            return ""
+
+        headers, data = self._completion_request(iam_token, prompt, system_prompt)
+        try:
+            response = await self._http().post(self.api_url, headers=headers, json=data)
+            response.raise_for_status()
+            return self._completion_text(response.json())
+        except Exception as e:
+            print(f"YaGPT API error: {e}")
+            return ""
+
+    async def _fetch(self, key: str, message: str, system_prompt: str) -> str:
+        response = await self._call_yagpt(message, system_prompt)
+        if response:
+            self.cache.set(key, response)
+        return response
+
+    def _forget(self, key: str, task: "asyncio.Task[str]"):
+        if self._inflight_tasks.get(key) is task:
+            del self._inflight_tasks[key]
+
+    async def _complete(self, message: str, system_prompt: str) -> str:
+        """YaGPT answer to a message, served from the parse cache when possible.
+
+        The call runs as a task shared by every coroutine asking the same
+        question while it is in flight; shielding it means a caller that
+        is cancelled (e.g. a timed-out update) does not cancel the others.
+        """
+        key = self.cache.key(message, system_prompt)
+        response = self.cache.get(key)
+        if response is not None:
+            return response
+
+        task = self._inflight_tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, message, system_prompt))
+            self._inflight_tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def parse_expense(
+        self, message: str, learned: Optional[LearnedCategories] = None
+    ) -> Optional[ParsedExpense]:
+        """Parse expense from user message, locally or using YaGPT"""
+        if not self._looks_like_expense(message):
+            return None
+
+        local, confident = self._parse_locally(message, learned)
+        if confident and len(local) == 1:
+            return local[0]
+
+        response = await self._complete(message, EXPENSE_PROMPT)
+        if not response and local:
+            return local[0]
+        return self._with_learned(self._expense_from_response(message, response), learned)
+
+    async def parse_multiple_expenses(
+        self, message: str, learned: Optional[LearnedCategories] = None
+    ) -> List[ParsedExpense]:
+        """Parse multiple expenses from user message using YaGPT; see YaGPTService"""
+        if not self._looks_like_expense(message):
+            return []
+
+        local, confident = self._parse_locally(message, learned)
+        if confident:
+            return local
+
+        response = await self._complete(message, MULTIPLE_EXPENSES_PROMPT)
+        if not response:
+            return local  # YaGPT unavailable: best local guess
+        return [self._with_learned(e, learned) for e in self._expenses_from_response(response)]
+
+    async def close(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.cache.close()
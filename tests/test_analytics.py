@@ -26,7 +26,8 @@ class TestAnalytics:
         )
         handlers.storage.save_expense(expense)
 
-    def test_ascii_chart_in_report(self, handlers):
+    @pytest.mark.asyncio
+    async def test_ascii_chart_in_report(self, handlers):
         """Scenario: ASCII chart in monthly report
         Given user has expenses in multiple categories
         When generating report
@@ -38,7 +39,7 @@ class TestAnalytics:
         self._add_expense(handlers, user_id, "такси", 5000, "Транспорт")
         self._add_expense(handlers, user_id, "кино", 3000, "Развлечения")
 
-        chart = handlers.generate_ascii_chart(user_id)
+        chart = await handlers.generate_ascii_chart(user_id)
 
         # Should have bar characters
         assert "█" in chart or "▓" in chart or "■" in chart
@@ -90,7 +91,8 @@ class TestAsciiChartGeneration:
     def handlers(self):
         return BotHandlers(use_memory_db=True)
 
-    def test_chart_proportional_bars(self, handlers):
+    @pytest.mark.asyncio
+    async def test_chart_proportional_bars(self, handlers):
         """Test that bars are proportional to values"""
         user_id = 12345
 
@@ -100,7 +102,7 @@ class TestAsciiChartGeneration:
         handlers.storage.save_expense(expense1)
         handlers.storage.save_expense(expense2)
 
-        chart = handlers.generate_ascii_chart(user_id)
+        chart = await handlers.generate_ascii_chart(user_id)
 
         # Count bar characters for each category
         lines = chart.split("\n")
@@ -117,11 +119,12 @@ class TestAsciiChartGeneration:
         # Еда should have more bar characters than Транспорт
         assert еда_bar.count("█") >= транспорт_bar.count("█")
 
-    def test_chart_empty_data(self, handlers):
+    @pytest.mark.asyncio
+    async def test_chart_empty_data(self, handlers):
         """Test chart generation with no data"""
         user_id = 12345
 
-        chart = handlers.generate_ascii_chart(user_id)
+        chart = await handlers.generate_ascii_chart(user_id)
 
         assert "нет" in chart.lower() or chart == ""
 
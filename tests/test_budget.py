@@ -144,7 +144,7 @@ class TestBudgetStorage:
 
         await handlers.set_budget(user_id, 75000)
 
-        budget = handlers.get_user_budget(user_id)
+        budget = await handlers.get_user_budget(user_id)
         assert budget == 75000
 
     @pytest.mark.asyncio
@@ -155,5 +155,5 @@ class TestBudgetStorage:
         await handlers.set_budget(user_id, 50000)
         await handlers.set_budget(user_id, 60000)
 
-        budget = handlers.get_user_budget(user_id)
+        budget = await handlers.get_user_budget(user_id)
         assert budget == 60000
@@ -0,0 +1,88 @@
+"""Tests for the columnar in-memory expense backend."""
+from datetime import datetime, timedelta
+
+from src.db.columnar_db import ColumnarMemoryDB
+from src.db.timestamps import from_micros
+from src.services.expense_storage import ExpenseStorage, Expense
+
+
+class TestColumnarMemoryDB:
+    """Columnar storage keeps the MemoryDB interface."""
+
+    def _db(self):
+        db = ColumnarMemoryDB()
+        db.insert('expenses', {'user_id': 1, 'item': 'обед', 'amount': 500,
+                               'category': 'Еда', 'created_at': '2026-01-02T12:00:00'})
+        db.insert('expenses', {'user_id': 1, 'item': 'кофе', 'amount': 300,
+                               'category': 'Еда', 'created_at': '2026-01-01T09:00:00'})
+        db.insert('expenses', {'user_id': 1, 'item': 'такси', 'amount': 600,
+                               'category': 'Транспорт', 'created_at': '2026-01-03T18:00:00'})
+        db.insert('expenses', {'user_id': 2, 'item': 'кофе', 'amount': 250,
+                               'category': 'Еда', 'created_at': '2026-01-01T10:00:00'})
+        return db
+
+    def test_select_range_sorted_per_user(self):
+        """Range scans bisect the time column and return rows oldest first."""
+        db = self._db()
+
+        rows = db.select_range('expenses', {'user_id': 1}, 'created_at',
+                               '2026-01-01T00:00:00', '2026-01-03T00:00:00')
+
+        assert [r['item'] for r in rows] == ['кофе', 'обед']
+        assert from_micros(rows[0]['created_at']) == datetime(2026, 1, 1, 9, 0)
+
+    def test_aggregate_by_category(self):
+        """Aggregation sums interned category codes without building rows."""
+        db = self._db()
+
+        rows = db.aggregate('expenses', {'user_id': 1}, 'created_at',
+                            '2026-01-01T00:00:00', '2026-02-01T00:00:00',
+                            group_by='category', value='amount')
+
+        assert {r['category']: (r['total'], r['count']) for r in rows} == {
+            'Еда': (800, 2), 'Транспорт': (600, 1),
+        }
+
+    def test_insert_same_key_replaces_row(self):
+        """(user_id, created_at) is the key, like an UPSERT."""
+        db = self._db()
+
+        db.insert('expenses', {'user_id': 1, 'item': 'кофе', 'amount': 350,
+                               'category': 'Еда', 'created_at': '2026-01-01T09:00:00'})
+
+        rows = db.select('expenses', {'user_id': 1, 'created_at': '2026-01-01T09:00:00'})
+        assert len(rows) == 1
+        assert rows[0]['amount'] == 350
+
+    def test_update_and_delete_by_key(self):
+        db = self._db()
+
+        assert db.update('expenses', {'user_id': 1, 'created_at': '2026-01-02T12:00:00'},
+                         {'category': 'Другое'})
+        db.delete('expenses', {'user_id': 1, 'created_at': '2026-01-01T09:00:00'})
+
+        rows = db.select('expenses', {'user_id': 1})
+        assert [(r['item'], r['category']) for r in rows] == [('обед', 'Другое'), ('такси', 'Транспорт')]
+
+    def test_other_tables_are_row_based(self):
+        db = ColumnarMemoryDB()
+
+        db.insert('user_settings', {'user_id': 1, 'budget': 50000})
+
+        assert db.select('user_settings', {'user_id': 1}) == [{'user_id': 1, 'budget': 50000}]
+
+
+class TestColumnarExpenseStorage:
+    """ExpenseStorage runs unchanged on the columnar backend."""
+
+    def test_storage_selects_columnar_layout(self, monkeypatch):
+        monkeypatch.setenv('MEMORY_DB_LAYOUT', 'columnar')
+        storage = ExpenseStorage(use_memory=True)
+        now = datetime.now()
+        storage.save_expense(Expense(user_id=1, item="кофе", amount=300, category="Еда", created_at=now))
+        storage.save_expense(Expense(user_id=1, item="такси", amount=500, category="Транспорт",
+                                     created_at=now - timedelta(seconds=1)))
+
+        assert isinstance(storage.db, ColumnarMemoryDB)
+        assert storage.get_total(1) == 800
+        assert [e.item for e in storage.get_monthly_expenses(1)] == ["такси", "кофе"]
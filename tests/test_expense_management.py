@@ -52,6 +52,24 @@ class TestExpenseManagement:
         assert len(expenses) == 1
         assert expenses[0].item == "first"
 
+    @pytest.mark.asyncio
+    async def test_delete_expense_beyond_first_page(self, handlers):
+        """Scenario: Delete a recent expense of a long history
+        Given user has more than 100 saved expenses
+        When user deletes the newest one
+        Then it is found by its key and deleted
+        """
+        user_id = 12345
+        for i in range(150):
+            self._add_expense(handlers, user_id, f"кофе {i}", 100, "Еда", days_ago=150 - i)
+        last = handlers.storage.get_last_expense(user_id)
+
+        result = await handlers.delete_expense(user_id, last.created_at.isoformat())
+
+        assert result["success"] is True
+        assert "кофе 149" in result["message"]
+        assert handlers.storage.get_last_expense(user_id).item == "кофе 148"
+
     @pytest.mark.asyncio
     async def test_undo_no_expenses(self, handlers):
         """Scenario: Undo with no expenses
@@ -139,6 +157,45 @@ class TestExpenseManagement:
         assert "не найден" in result["message"].lower() or "нет" in result["message"].lower()
 
 
+    @pytest.mark.asyncio
+    async def test_category_correction_is_learned(self, handlers):
+        """Scenario: Corrected category is reused
+        Given user saved "стрижка 1500" and moved it to "Здоровье"
+        When user sends "стрижка 1200"
+        Then it is saved as "Здоровье" without asking YaGPT
+        """
+        user_id = 12345
+        expense = self._add_expense(handlers, user_id, "стрижка", 1500, "Другое")
+        await handlers.change_expense_category(user_id, expense.created_at.isoformat(), "Здоровье")
+        handlers.yagpt._call_yagpt = lambda *args: pytest.fail("YaGPT called")
+
+        response = await handlers.handle_message(user_id, "Стрижка 1200")
+
+        assert "Здоровье" in response
+        assert handlers.storage.get_category_totals(user_id) == {"Здоровье": 2700}
+
+    @pytest.mark.asyncio
+    async def test_learned_category_applies_to_yagpt_items(self, handlers):
+        """Scenario: Learned category overrides YaGPT's
+        Given user moved "обед" to "Развлечения"
+        When "обед 1 500" is parsed by YaGPT as "обед" in "Еда"
+        Then it is saved as "Развлечения"
+        """
+        user_id = 12345
+        expense = self._add_expense(handlers, user_id, "обед", 800, "Еда")
+        await handlers.change_expense_category(user_id, expense.created_at.isoformat(), "Развлечения")
+
+        async def call_yagpt(*args):
+            return '[{"item": "обед", "amount": 1500, "category": "Еда"}]'
+
+        handlers.yagpt._call_yagpt = call_yagpt
+
+        response = await handlers.handle_message(user_id, "обед 1 500")
+
+        assert "Развлечения" in response
+        assert handlers.storage.get_category_totals(user_id) == {"Развлечения": 2300}
+
+
 class TestExportFormat:
     """Test CSV export format"""
 
@@ -2,9 +2,15 @@
 Tests for Expense Storage Service
 BDD Reference: NLE-A-10
 """
+import copy
+import pickle
 import pytest
+from dataclasses import FrozenInstanceError
 from datetime import datetime, timedelta
-from src.services.expense_storage import ExpenseStorage, Expense
+from src.db import schema
+from src.db.ydb_client import YDBClient
+from src.services import expense_storage
+from src.services.expense_storage import ExpenseStorage, AsyncExpenseStorage, Expense
 
 
 class TestExpenseStorage:
@@ -108,3 +114,400 @@ class TestExpenseStorage:
         total = storage.get_total(user_id=12345)
 
         assert total == 800
+
+    def test_get_expenses_between(self, storage):
+        """Scenario: Range query returns only rows inside [start, end)
+        Given expenses 1, 5 and 10 days ago
+        When get_expenses_between(user_id, 7 days ago, 2 days ago) called
+        Then return only the 5-days-ago expense
+        """
+        now = datetime.now()
+        for days_ago, item in [(1, "вчера"), (5, "среда"), (10, "давно")]:
+            storage.save_expense(Expense(
+                user_id=12345, item=item, amount=100, category="Еда",
+                created_at=now - timedelta(days=days_ago),
+            ))
+
+        expenses = storage.get_expenses_between(
+            12345, now - timedelta(days=7), now - timedelta(days=2)
+        )
+
+        assert [e.item for e in expenses] == ["среда"]
+
+    def test_monthly_expenses_not_capped_at_100_rows(self, storage):
+        """Scenario: Heavy users keep all rows in monthly report
+        Given user has 150 expenses today
+        When get_total(user_id) called
+        Then all 150 rows are counted
+        """
+        now = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        for i in range(150):
+            storage.save_expense(Expense(
+                user_id=12345, item="кофе", amount=10, category="Еда",
+                created_at=now + timedelta(seconds=i),
+            ))
+
+        assert len(storage.get_monthly_expenses(user_id=12345)) == 150
+        assert storage.get_total(user_id=12345) == 1500
+
+    def test_get_category_stats(self, storage):
+        """Scenario: Aggregate sums and counts per category
+        Given user has 2 Еда and 1 Транспорт expenses this month
+        When get_category_stats(user_id) called
+        Then return (sum, count) per category
+        """
+        storage.save_expense(Expense(user_id=12345, item="кофе", amount=300, category="Еда"))
+        storage.save_expense(Expense(user_id=12345, item="обед", amount=500, category="Еда"))
+        storage.save_expense(Expense(user_id=12345, item="такси", amount=600, category="Транспорт"))
+        storage.save_expense(Expense(user_id=999, item="такси", amount=900, category="Транспорт"))
+
+        stats = storage.get_category_stats(user_id=12345)
+
+        assert stats == {"Еда": (800, 2), "Транспорт": (600, 1)}
+
+    def test_monthly_rollup_follows_writes(self, storage):
+        """Scenario: Monthly rollup is maintained on save, update and delete
+        Given user saved кофе 300 and обед 500 in Еда
+        When обед is moved to Другое and кофе is deleted
+        Then the rollup holds only Другое 500
+        """
+        now = datetime.now().replace(microsecond=0)
+        coffee = Expense(user_id=12345, item="кофе", amount=300, category="Еда", created_at=now)
+        lunch = Expense(user_id=12345, item="обед", amount=500, category="Еда",
+                        created_at=now - timedelta(seconds=1))
+        storage.save_expense(coffee)
+        storage.save_expense(lunch)
+        assert storage.get_category_stats(12345) == {"Еда": (800, 2)}
+
+        storage.update_expense_category(12345, lunch.created_at.isoformat(), "Другое")
+        storage.delete_expense(12345, coffee.created_at.isoformat())
+
+        assert storage.get_category_stats(12345) == {"Другое": (500, 1)}
+
+    def test_rebuild_monthly_rollup(self, storage):
+        """Scenario: Rollup can be rebuilt from raw rows"""
+        storage.save_expense(Expense(user_id=12345, item="кофе", amount=300, category="Еда"))
+        storage.db.delete(storage.ROLLUP_TABLE, {"user_id": 12345})
+        assert storage.db.select(storage.ROLLUP_TABLE, {"user_id": 12345}) == []
+
+        storage.rebuild_monthly_rollup(12345)
+
+        assert storage.db.select(storage.ROLLUP_TABLE, {"user_id": 12345})[0]["total"] == 300
+        assert storage.get_total(12345) == 300
+
+    def test_totals_before_rollup_backfill(self, storage):
+        """
+        Scenario: Expenses saved before the rollup existed still count
+        Given a user with expenses this month and no rollup rows
+        When totals, top categories and stats are read
+        Then they are aggregated from the raw expense rows
+        """
+        storage.save_expense(Expense(user_id=12345, item="кофе", amount=300, category="Еда"))
+        storage.save_expense(Expense(user_id=12345, item="такси", amount=600, category="Транспорт"))
+        storage.db.delete(storage.ROLLUP_TABLE, {"user_id": 12345})
+
+        assert storage.get_category_stats(12345) == {"Еда": (300, 1), "Транспорт": (600, 1)}
+        assert storage.get_total(12345) == 900
+        assert storage.get_top_categories(12345, limit=1) == [("Транспорт", 600)]
+
+    def test_save_expenses_batch(self, storage):
+        """Scenario: Save several expenses in one write
+        Given three expenses parsed from one message
+        When save_expenses is called
+        Then all are stored and the rollup is updated
+        """
+        now = datetime.now()
+        result = storage.save_expenses([
+            Expense(user_id=12345, item="кофе", amount=300, category="Еда", created_at=now),
+            Expense(user_id=12345, item="обед", amount=500, category="Еда", created_at=now),
+            Expense(user_id=12345, item="такси", amount=600, category="Транспорт", created_at=now),
+        ])
+
+        assert result is True
+        assert len(storage.get_monthly_expenses(user_id=12345)) == 3
+        assert storage.get_category_totals(user_id=12345) == {"Еда": 800, "Транспорт": 600}
+
+
+    def test_iter_expenses_pages_through_history(self, storage):
+        """Scenario: Stream a long history in small pages
+        Given user has 25 expenses over 25 days
+        When iter_expenses(user_id, page_size=10) is consumed
+        Then all 25 come back oldest first, and since/until bound the range
+        """
+        start = datetime(2025, 1, 1, 12, 0)
+        for day in range(25):
+            storage.save_expense(Expense(
+                user_id=12345, item=f"день {day}", amount=100, category="Еда",
+                created_at=start + timedelta(days=day),
+            ))
+
+        expenses = list(storage.iter_expenses(12345, page_size=10))
+        bounded = list(storage.iter_expenses(
+            12345, since=start + timedelta(days=5), until=start + timedelta(days=15), page_size=3,
+        ))
+
+        assert [e.item for e in expenses] == [f"день {d}" for d in range(25)]
+        assert [e.item for e in bounded] == [f"день {d}" for d in range(5, 15)]
+
+    def test_scan_expenses_streams_range(self):
+        """Scenario: Long-range reads stream rows oldest first."""
+        storage = ExpenseStorage(use_memory=True)
+        start = datetime(2025, 1, 1, 12, 0)
+        storage.save_expenses([
+            Expense(user_id=1, item=f"день {d}", amount=100, category="Еда", created_at=start + timedelta(days=d))
+            for d in range(40)
+        ])
+
+        expenses = storage.scan_expenses(1, since=start + timedelta(days=30))
+
+        assert [e.item for e in expenses] == [f"день {d}" for d in range(30, 40)]
+
+    def test_reads_use_read_only_transactions(self):
+        """Scenario: Report reads ask the backend for a read-only snapshot."""
+        storage = ExpenseStorage(use_memory=True)
+        modes = []
+        select_page, aggregate = storage.db.select_page, storage.db.aggregate
+
+        def spy(method):
+            def call(*args, tx_mode=None, **kwargs):
+                modes.append(tx_mode)
+                return method(*args, **kwargs)
+            return call
+
+        storage.db.select_page, storage.db.aggregate = spy(select_page), spy(aggregate)
+        storage.get_monthly_expenses(1)
+        storage.get_category_stats(1, datetime(2026, 1, 1), datetime(2026, 2, 1))
+
+        assert modes == ["snapshot", "snapshot"]
+
+    def test_save_budget_is_one_batch(self):
+        storage = ExpenseStorage(use_memory=True)
+        batches = []
+        batch = storage.db.batch
+        storage.db.batch = lambda ops: batches.append(ops) or batch(ops)
+
+        storage.save_budget(1, 30000)
+        storage.save_budget(1, 50000)
+
+        assert len(batches) == 2
+        assert storage.get_budget(1) == 50000
+
+    def test_pop_last_expense_updates_rollup(self):
+        storage = ExpenseStorage(use_memory=True)
+        now = datetime.now()
+        storage.save_expense(Expense(user_id=1, item="кофе", amount=300, category="Еда", created_at=now))
+        storage.save_expense(Expense(user_id=1, item="такси", amount=500, category="Транспорт",
+                                     created_at=now + timedelta(seconds=1)))
+
+        popped = storage.pop_last_expense(1)
+
+        assert popped.item == "такси"
+        assert storage.get_category_totals(1) == {"Еда": 300}
+        assert storage.pop_last_expense(2) is None
+
+    def test_last_expense_beyond_first_page(self):
+        """
+        Scenario: Last expense of a long history
+        Given a user with more than 100 expenses
+        When the last expense is looked up, and an old one by its key
+        Then the newest and the requested expenses are returned
+        """
+        storage = ExpenseStorage(use_memory=True)
+        start = datetime(2026, 1, 1, 9, 0)
+        storage.save_expenses([
+            Expense(user_id=1, item=f"кофе {i}", amount=100, category="Еда",
+                    created_at=start + timedelta(minutes=i))
+            for i in range(150)
+        ])
+
+        assert storage.get_last_expense(1).item == "кофе 149"
+        assert storage.get_expense(1, (start + timedelta(minutes=120)).isoformat()).item == "кофе 120"
+        assert storage.get_last_expense(2) is None
+
+    def test_pop_last_expense_on_ydb_is_one_request(self):
+        """Scenario: Undo reads, un-counts and deletes in one YQL request."""
+        storage = ExpenseStorage(use_memory=True)
+        storage.db = YDBClient()
+        calls = []
+        row = {"user_id": 1, "item": "такси", "amount": 500, "category": "Транспорт",
+               "created_at": Expense(1, "x", 1, "Еда").created_at_us}
+        storage.db.execute_many = lambda statements: calls.append(statements) or [row]
+
+        popped = storage.pop_last_expense(1)
+
+        assert popped.item == "такси"
+        assert len(calls) == 1
+        query = "\n".join(text for text, _ in calls[0])
+        # YQL forbids reading a table after writing it in the same query
+        assert query.index("SELECT * FROM $last") < query.index("UPSERT INTO expense_rollups")
+        assert query.index("LEFT JOIN expense_rollups") < query.index("DELETE FROM expenses")
+
+    def test_find_expenses_by_normalized_prefix(self, storage):
+        """Scenario: Item search matches the normalized name prefix."""
+        storage.save_expense(Expense(user_id=1, item="Кофе", amount=300, category="Еда"))
+        storage.save_expense(Expense(user_id=1, item="кофе  латте", amount=400, category="Еда"))
+        storage.save_expense(Expense(user_id=1, item="ёлка", amount=2000, category="Другое"))
+        storage.save_expense(Expense(user_id=1, item="такси", amount=500, category="Транспорт"))
+
+        assert sorted(e.amount for e in storage.find_expenses(1, "КОФЕ")) == [300, 400]
+        assert [e.item for e in storage.find_expenses(1, "елка")] == ["ёлка"]
+        assert storage.get_item_total(1, "кофе латте") == 400
+
+    def test_item_total_ignores_other_months(self, storage):
+        storage.save_expense(Expense(user_id=1, item="кофе", amount=300, category="Еда"))
+        storage.save_expense(Expense(user_id=1, item="кофе", amount=900, category="Еда",
+                                     created_at=datetime.now() - timedelta(days=40)))
+
+        assert storage.get_item_total(1, "кофе") == 300
+
+    def test_category_and_item_reads_use_indexes(self, storage):
+        views = []
+        select_page, aggregate = storage.db.select_page, storage.db.aggregate
+
+        def spy(method):
+            def call(*args, view=None, **kwargs):
+                views.append(view)
+                return method(*args, view=view, **kwargs)
+            return call
+
+        storage.db.select_page, storage.db.aggregate = spy(select_page), spy(aggregate)
+        storage.get_by_category(1, "Еда")
+        storage.get_item_total(1, "кофе")
+
+        assert views == [ExpenseStorage.CATEGORY_INDEX, ExpenseStorage.ITEM_INDEX]
+
+    def test_learned_categories_from_corrections_and_confirmations(self, storage):
+        """
+        Scenario: Corrections and confirmed expenses teach item categories
+        Given one expense recategorized and one saved as confirmed
+        When learned categories are looked up by item
+        Then both are found by normalized item name, for that user only
+        """
+        expense = Expense(user_id=1, item="Стрижка", amount=1500, category="Другое")
+        storage.save_expense(expense)
+        storage.update_expense_category(1, expense.created_at.isoformat(), "Здоровье")
+        storage.save_expense(Expense(user_id=1, item="вода", amount=50, category="Еда"), confirmed=True)
+
+        assert storage.get_learned_categories(1, ["стрижка", "Вода", "такси"]) == {
+            "стрижка": "Здоровье", "вода": "Еда",
+        }
+        assert storage.get_learned_categories(2, ["стрижка"]) == {}
+
+    def test_learned_categories_cached(self, storage):
+        storage.save_expense(Expense(user_id=1, item="вода", amount=50, category="Еда"), confirmed=True)
+        selects = []
+        select = storage.db.select
+        storage.db.select = lambda *args, **kwargs: selects.append(args[0]) or select(*args, **kwargs)
+
+        for _ in range(2):
+            assert storage.get_learned_categories(1, ["вода", "такси"]) == {"вода": "Еда"}
+
+        # "вода" was cached when it was learned, "такси" as unknown on first read
+        assert selects == [ExpenseStorage.LEARNED_TABLE]
+
+    def test_schema_version_checked_once_without_ddl(self, monkeypatch):
+        """
+        Scenario: Startup only reads the schema version
+        Given a YDB database migrated to the current schema version
+        When storage checks the schema twice
+        Then schema_version is queried once and no DDL runs
+        """
+        monkeypatch.setattr(expense_storage, "_schema_versions", {})
+        storage = ExpenseStorage(use_memory=True)
+        storage.db = YDBClient()
+        queries = []
+        storage.db.execute_scheme = lambda query: queries.append(query)
+        storage.db.execute = lambda query, parameters=None, tx_mode=None: (
+            queries.append(query) or [{"version": schema.SCHEMA_VERSION}])
+
+        assert storage.check_schema()
+        assert storage.check_schema()
+        assert queries == [ExpenseStorage.SCHEMA_VERSION_QUERY]
+
+    def test_outdated_schema_reported(self, monkeypatch):
+        monkeypatch.setattr(expense_storage, "_schema_versions", {})
+        storage = ExpenseStorage(use_memory=True)
+        storage.db = YDBClient()
+        storage.db.execute = lambda query, parameters=None, tx_mode=None: [{"version": None}]
+
+        assert not storage.check_schema()
+
+
+class TestAsyncExpenseStorage:
+    """Awaitable storage over the same backend"""
+
+    @pytest.mark.asyncio
+    async def test_async_storage_shares_backend(self):
+        storage = ExpenseStorage(use_memory=True)
+        async_storage = AsyncExpenseStorage.from_storage(storage)
+        now = datetime.now()
+
+        await async_storage.save_expenses([
+            Expense(user_id=1, item="кофе", amount=300, category="Еда", created_at=now),
+            Expense(user_id=1, item="такси", amount=500, category="Транспорт", created_at=now),
+        ])
+
+        assert storage.get_total(1) == 800
+        assert await async_storage.get_category_totals(1) == {"Еда": 300, "Транспорт": 500}
+        assert [e.item async for e in async_storage.iter_expenses(1, page_size=1)] == ["кофе", "такси"]
+
+    @pytest.mark.asyncio
+    async def test_async_delete_and_recategorize_update_rollup(self):
+        async_storage = AsyncExpenseStorage(use_memory=True)
+        expense = Expense(user_id=1, item="кофе", amount=300, category="Еда")
+        await async_storage.save_expense(expense)
+        created_at = expense.created_at.isoformat()
+
+        await async_storage.update_expense_category(1, created_at, "Другое")
+        assert await async_storage.get_category_totals(1) == {"Другое": 300}
+
+        await async_storage.delete_expense(1, created_at)
+        assert await async_storage.get_total(1) == 0
+        assert await async_storage.get_last_expense(1) is None
+
+
+    @pytest.mark.asyncio
+    async def test_async_scan_expenses(self):
+        async_storage = AsyncExpenseStorage(use_memory=True)
+        now = datetime.now()
+        await async_storage.save_expense(Expense(user_id=1, item="кофе", amount=300, category="Еда", created_at=now))
+
+        assert [e.item async for e in async_storage.scan_expenses(1)] == ["кофе"]
+
+
+class TestExpenseRecord:
+    """Compact Expense record"""
+
+    def test_created_at_stored_as_micros(self):
+        created_at = datetime(2026, 3, 1, 12, 30, 15, 123456)
+        expense = Expense(user_id=1, item="кофе", amount=300, category="Еда", created_at=created_at)
+
+        assert isinstance(expense.created_at_us, int)
+        assert expense.created_at == created_at
+        assert not hasattr(expense, "__dict__")
+
+    def test_expense_is_frozen(self):
+        expense = Expense(user_id=1, item="кофе", amount=300, category="Еда")
+
+        with pytest.raises(FrozenInstanceError):
+            expense.amount = 500
+
+    def test_expense_copy_and_pickle(self):
+        expense = Expense(user_id=1, item="кофе", amount=300, category="Еда",
+                          created_at=datetime(2026, 3, 1, 12, 30, 15, 123456))
+
+        assert copy.copy(expense) == expense
+        assert copy.deepcopy(expense) == expense
+        restored = pickle.loads(pickle.dumps(expense))
+        assert restored == expense
+        assert restored.created_at_us == expense.created_at_us
+
+    def test_from_row_accepts_micros_and_iso(self):
+        created_at = datetime(2026, 3, 1, 12, 30)
+        from_iso = Expense.from_row({"user_id": 1, "item": "кофе", "amount": 300,
+                                     "category": "Еда", "created_at": created_at.isoformat()})
+        from_micros = Expense.from_row({"user_id": 1, "item": "кофе", "amount": 300,
+                                        "category": "Еда", "created_at": from_iso.created_at_us})
+
+        assert from_iso == from_micros
+        assert from_iso.created_at == created_at
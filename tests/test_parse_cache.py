@@ -0,0 +1,92 @@
+"""Tests for the YaGPT parse cache."""
+from src.services.parse_cache import ParseCache, SQLiteCacheBackend, normalize_message
+from src.services.yagpt_service import YaGPTService, MULTIPLE_EXPENSES_PROMPT
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestParseCache:
+    """Bounded LRU with TTL and hit/miss counters"""
+
+    def test_key_normalizes_message_and_tracks_prompt(self):
+        assert normalize_message("  Обед   ЁЖ 500! ") == "обед еж 500"
+        assert ParseCache.key("Обед 500", "prompt") == ParseCache.key("обед  500.", "prompt")
+        assert ParseCache.key("обед 500", "prompt v1") != ParseCache.key("обед 500", "prompt v2")
+
+    def test_lru_eviction(self):
+        cache = ParseCache(max_size=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")
+        cache.set("c", "3")
+
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+        assert cache.get("c") == "3"
+        assert cache.stats()["size"] == 2
+
+    def test_ttl_and_counters(self):
+        clock = FakeClock()
+        cache = ParseCache(ttl=60, clock=clock)
+        cache.set("a", "1")
+
+        assert cache.get("a") == "1"
+        clock.now += 61
+        assert cache.get("a") is None
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert cache.stats()["hit_rate"] == 0.5
+
+    def test_sqlite_backend_survives_restart(self, tmp_path):
+        """
+        Scenario: Cached answers survive a restart
+        Given an answer cached with an on-disk backend
+        When a new cache opens the same file
+        Then the answer is a hit
+        """
+        path = str(tmp_path / "parse_cache.sqlite")
+        cache = ParseCache(backend=SQLiteCacheBackend(path))
+        cache.set("a", "1")
+        cache.close()
+
+        restarted = ParseCache(backend=SQLiteCacheBackend(path))
+        assert restarted.get("a") == "1"
+        assert restarted.hits == 1
+        restarted.close()
+
+
+class TestYaGPTServiceCache:
+    """Repeated messages are answered from the cache"""
+
+    def test_repeated_message_calls_yagpt_once(self):
+        """
+        Scenario: Same phrase twice costs one completion
+        Given a message the local parser sends to YaGPT
+        When the user sends it twice, with different spacing and case
+        Then YaGPT is called once and both parses match
+        """
+        service = YaGPTService(cache=ParseCache())
+        calls = []
+        answer = '[{"item": "жене", "amount": 500, "category": "Переводы"}]'
+        service._call_yagpt = lambda prompt, system_prompt="": calls.append(system_prompt) or answer
+
+        first = service.parse_multiple_expenses("жене 500")
+        second = service.parse_multiple_expenses("Жене  500")
+
+        assert first == second
+        assert calls == [MULTIPLE_EXPENSES_PROMPT]
+        assert (service.cache.hits, service.cache.misses) == (1, 1)
+
+    def test_failed_call_not_cached(self):
+        service = YaGPTService(cache=ParseCache())
+        service._call_yagpt = lambda prompt, system_prompt="": ""
+
+        service.parse_multiple_expenses("жене 500")
+        service.parse_multiple_expenses("жене 500")
+
+        assert service.cache.misses == 2
@@ -0,0 +1,111 @@
+"""Tests for the YDB schema DDL."""
+from src.db import schema
+
+
+class TestPartitioning:
+    """Tables are created pre-split and auto-partitioned by size and load."""
+
+    def test_create_table_partitioning(self, monkeypatch):
+        """
+        Scenario: Expenses table DDL carries partitioning settings
+        Given min 4 and max 32 partitions configured
+        When the CREATE TABLE statement is built
+        Then it enables size and load splitting within those limits
+        And pre-splits the user_id range into 4 partitions
+        """
+        monkeypatch.setenv('YDB_MIN_PARTITIONS', '4')
+        monkeypatch.setenv('YDB_MAX_PARTITIONS', '32')
+
+        ddl = schema.expenses_table_ddl()
+
+        assert "AUTO_PARTITIONING_BY_SIZE = ENABLED" in ddl
+        assert "AUTO_PARTITIONING_BY_LOAD = ENABLED" in ddl
+        assert "AUTO_PARTITIONING_MIN_PARTITIONS_COUNT = 4" in ddl
+        assert "AUTO_PARTITIONING_MAX_PARTITIONS_COUNT = 32" in ddl
+        assert "PARTITION_AT_KEYS = (2147483648, 4294967296, 6442450944)" in ddl
+        assert f"INDEX {schema.ITEM_INDEX} GLOBAL" in ddl
+
+    def test_max_never_below_min(self, monkeypatch):
+        monkeypatch.setenv('YDB_MIN_PARTITIONS', '8')
+        monkeypatch.setenv('YDB_MAX_PARTITIONS', '2')
+
+        assert schema.partition_limits()['max'] == 8
+
+    def test_alter_statements_skip_initial_split(self):
+        """
+        Scenario: Existing tables get the settings through ALTER
+        Given the expenses table and its indexes already exist
+        When partitioning ALTER statements are built
+        Then the table and each index are altered
+        And PARTITION_AT_KEYS, valid only on CREATE, is left out
+        """
+        statements = schema.partitioning_alter_statements('expenses', list(schema.EXPENSE_INDEXES))
+
+        assert len(statements) == 1 + len(schema.EXPENSE_INDEXES)
+        assert statements[0].startswith("ALTER TABLE expenses SET (AUTO_PARTITIONING_BY_SIZE")
+        assert statements[1].startswith(f"ALTER TABLE expenses ALTER INDEX {schema.CATEGORY_INDEX} SET (")
+        assert not any("PARTITION_AT_KEYS" in s for s in statements)
+
+
+class TestMigrations:
+    """Migrations are versioned and applied only when missing."""
+
+    def test_versions_ascend_to_schema_version(self):
+        versions = [m.version for m in schema.migrations()]
+
+        assert versions == sorted(set(versions))
+        assert versions[-1] == schema.SCHEMA_VERSION
+
+    def test_pending_migrations(self):
+        """
+        Scenario: Runner applies only missing migrations
+        Given a database at version 1
+        When pending migrations are listed
+        Then only the later versions are returned, in order
+        """
+        assert [m.version for m in schema.pending_migrations(1)] == list(range(2, schema.SCHEMA_VERSION + 1))
+        assert schema.pending_migrations(schema.SCHEMA_VERSION) == []
+
+    def test_rollup_backfill_groups_raw_expenses(self):
+        """
+        Scenario: Rollups are backfilled for expenses saved before they existed
+        Given the rollup backfill migration
+        Then it upserts sums and counts grouped by user, month and category
+        """
+        backfill = next(m for m in schema.migrations() if "expense_rollups" in m.description and m.backfill)
+        query = backfill.backfill[0]
+
+        assert f"UPSERT INTO {schema.ROLLUP_TABLE}" in query
+        assert f"FROM {schema.EXPENSES_TABLE}" in query
+        assert "SUM(amount) AS total, COUNT(*) AS expense_count" in query
+        assert "GROUP BY user_id," in query and "AS month, category" in query
+
+    def test_migration_ddl_is_frozen_at_its_version(self):
+        """
+        Scenario: A fresh database is built step by step
+        Given the first migration
+        Then it creates the tables as they were at version 1
+        And item_key, its indexes and partitioning come from later migrations
+        """
+        first, second = schema.migrations()[:2]
+        ddl = "\n".join(first.scheme)
+
+        assert "item_key" not in ddl
+        assert "INDEX" not in ddl
+        assert "AUTO_PARTITIONING" not in ddl
+        assert second.scheme[0] == f"ALTER TABLE {schema.EXPENSES_TABLE} ADD COLUMN item_key Utf8"
+
+    def test_backfills_run_in_user_id_ranges(self):
+        """
+        Scenario: Backfills never rewrite the whole table in one request
+        Given the migrations that rewrite existing rows
+        Then each statement is bounded by a user_id range
+        And the ranges cover every Int64 user_id without gaps
+        """
+        backfills = [q for m in schema.migrations() for q in m.backfill]
+        ranges = schema.backfill_ranges()
+
+        assert backfills and not any(m.data for m in schema.migrations())
+        assert all("user_id >= $from_user_id AND user_id < $to_user_id" in q for q in backfills)
+        assert ranges[0][0] == schema.INT64_MIN and ranges[-1][1] == schema.INT64_MAX
+        assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
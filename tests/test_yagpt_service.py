@@ -2,8 +2,16 @@
 Tests for YaGPT Service
 BDD Reference: NLE-A-8
 """
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
 import pytest
-from src.services.yagpt_service import YaGPTService, ParsedExpense, Intent
+from src.services.yagpt_service import (
+    AsyncYaGPTService, YaGPTService, ParsedExpense, Intent, CATEGORY_KEYWORDS, compile_keywords,
+)
 
 
 class TestYaGPTExpenseParser:
@@ -125,3 +133,215 @@ class TestYaGPTExpenseParser:
         assert "маме" in response
         assert "пиво" in response
         assert "2 000" in response or "2,000" in response  # total
+
+
+class TestAsyncYaGPTService:
+    """Feature: Pooled async YaGPT client"""
+
+    def _service(self, monkeypatch, handler):
+        monkeypatch.setenv("YC_TOKEN", "oauth")
+        monkeypatch.setenv("YC_FOLDER_ID", "folder")
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return AsyncYaGPTService(client=client)
+
+    @pytest.mark.asyncio
+    async def test_concurrent_messages_share_client_and_token(self, monkeypatch):
+        """
+        Scenario: Concurrent users reuse one client and one IAM token
+        Given three messages parsed at the same time
+        When the service calls YaGPT
+        Then the IAM token is requested once
+        And every completion goes through the shared client
+        """
+        requests = []
+
+        async def handler(request):
+            requests.append(request.url.host)
+            await asyncio.sleep(0)
+            if request.url.host.startswith("iam."):
+                return httpx.Response(200, json={"iamToken": "token"})
+            answer = '[{"item": "жене", "amount": 500, "category": "Переводы"}]'
+            return httpx.Response(200, json={"result": {"alternatives": [{"message": {"text": answer}}]}})
+
+        service = self._service(monkeypatch, handler)
+
+        messages = ["жене 500", "жене 600", "жене 700"]
+        results = await asyncio.gather(*(service.parse_multiple_expenses(m) for m in messages))
+
+        assert [[(e.item, e.category) for e in r] for r in results] == [[("жене", "Переводы")]] * 3
+        assert requests.count("iam.api.cloud.yandex.net") == 1
+        assert requests.count("llm.api.cloud.yandex.net") == 3
+        await service.close()
+
+    @pytest.mark.asyncio
+    async def test_identical_messages_in_flight_share_one_call(self, monkeypatch):
+        """
+        Scenario: A burst of the same message costs one YaGPT call
+        Given the same message arrives three times before YaGPT answers
+        When the messages are parsed concurrently
+        Then only the first one calls YaGPT and the others await its answer
+        And cancelling one waiting caller does not cancel the call
+        """
+        release = asyncio.Event()
+        completions = []
+
+        async def handler(request):
+            if request.url.host.startswith("iam."):
+                return httpx.Response(200, json={"iamToken": "token"})
+            completions.append(request)
+            await release.wait()
+            answer = '[{"item": "жене", "amount": 500, "category": "Переводы"}]'
+            return httpx.Response(200, json={"result": {"alternatives": [{"message": {"text": answer}}]}})
+
+        service = self._service(monkeypatch, handler)
+
+        callers = [asyncio.ensure_future(service.parse_multiple_expenses("жене 500")) for _ in range(3)]
+        while not completions:
+            await asyncio.sleep(0)
+        callers[0].cancel()
+        release.set()
+        results = await asyncio.gather(*callers[1:])
+
+        assert [[(e.item, e.category) for e in r] for r in results] == [[("жене", "Переводы")]] * 2
+        assert len(completions) == 1
+        assert service.coalesced == 2
+        await service.close()
+
+    def test_identical_messages_in_flight_share_one_call_sync(self, monkeypatch):
+        service = YaGPTService()
+        release = threading.Event()
+        calls = []
+
+        def call_yagpt(prompt, system_prompt=""):
+            calls.append(prompt)
+            release.wait(5)
+            return '[{"item": "жене", "amount": 500, "category": "Переводы"}]'
+
+        monkeypatch.setattr(service, "_call_yagpt", call_yagpt)
+        with ThreadPoolExecutor(3) as pool:
+            futures = [pool.submit(service.parse_multiple_expenses, "Жене 500") for _ in range(3)]
+            for _ in range(500):
+                if service.coalesced == 2:
+                    break
+                time.sleep(0.01)
+            release.set()
+            results = [f.result() for f in futures]
+
+        assert [[e.category for e in r] for r in results] == [["Переводы"]] * 3
+        assert calls == ["Жене 500"]
+
+    @pytest.mark.asyncio
+    async def test_api_error_falls_back_to_local_parse(self, monkeypatch):
+        async def handler(request):
+            if request.url.host.startswith("iam."):
+                return httpx.Response(200, json={"iamToken": "token"})
+            return httpx.Response(503)
+
+        service = self._service(monkeypatch, handler)
+
+        expected = ParsedExpense(item="жене", amount=500, category="Другое")
+        assert await service.parse_multiple_expenses("жене 500") == [expected]
+        assert await service.parse_expense("жене 500") == expected
+        await service.close()
+
+
+class TestLocalExpenseParser:
+    """Feature: Common phrasings are parsed without YaGPT"""
+
+    @pytest.fixture
+    def service(self, monkeypatch):
+        service = YaGPTService()
+        monkeypatch.setattr(service, "_call_yagpt", lambda *args: pytest.fail("YaGPT called"))
+        return service
+
+    @pytest.mark.parametrize("message,expected", [
+        ("кофе 300", [("кофе", 300, "Еда")]),
+        ("такси 2к", [("такси", 2000, "Транспорт")]),
+        ("маме отправил две тыщи", [("маме", 2000, "Переводы")]),
+        ("косарь на продукты", [("продукты", 1000, "Еда")]),
+        ("кофе 3 сотни", [("кофе", 300, "Еда")]),
+        ("продукты 15 000", [("продукты", 15000, "Еда")]),
+        ("ремонт 1 000 000р", [("ремонт", 1000000, "Дом")]),
+        ("эээ обед тыща двести", [("обед", 1200, "Еда")]),
+        ("пиво косарь, такси пятихатка и кофе 200",
+         [("пиво", 1000, "Развлечения"), ("такси", 500, "Транспорт"), ("кофе", 200, "Еда")]),
+        ("заплатил за интернет и мобильную связь 900", [("интернет и мобильную связь", 900, "Связь")]),
+        # no digits at all
+        ("пятихатка на обед", [("обед", 500, "Еда")]),
+        ("полтос на кофе", [("кофе", 50, "Еда")]),
+        ("пол ляма на ремонт", [("ремонт", 500000, "Дом")]),
+        # inflected keywords
+        ("обеды 900", [("обеды", 900, "Еда")]),
+        ("у врача 2000", [("врача", 2000, "Здоровье")]),
+    ])
+    def test_confident_messages_skip_yagpt(self, service, message, expected):
+        """Scenario: Number words, slang and lists are parsed locally
+        Given a message in a common phrasing
+        When it is parsed
+        Then every expense is found without calling YaGPT
+        """
+        result = service.parse_multiple_expenses(message)
+
+        assert [(e.item, e.amount, e.category) for e in result] == expected
+
+    @pytest.mark.parametrize("message", [
+        "купил 2 кофе по 200",     # quantity
+        "около 200 на мелочи",     # estimate
+        "жене 500",                # unknown category
+        "такси 500 и кофе",        # phrase without amount
+        "пять пять кофе",          # malformed amount
+        "кофе 300 к обеду",        # "к" is a preposition, not thousands
+        "торт 500 к чаю",
+        "кофе 150 200",            # two amounts, not "150 200"
+        "обед 450 350",
+        "такси 300 500 метро",
+        # keyword only inside another word
+        "клубника 400",            # клуб
+        "виноград 300",            # вино
+        "барбершоп 1500",          # бар
+        "кафель 2000",             # кафе
+        "метрополь 900",           # метро
+    ])
+    def test_unsure_messages_go_to_yagpt(self, message):
+        service = YaGPTService()
+        calls = []
+        service._call_yagpt = lambda prompt, system_prompt="": calls.append(prompt) or "[]"
+
+        service.parse_multiple_expenses(message)
+
+        assert calls == [message]
+
+
+class TestCategoryKeywords:
+    """Feature: Compiled keyword matcher"""
+
+    @staticmethod
+    def _reference(item):
+        """Keyword loop the compiled matcher replaces"""
+        item_lower = item.lower()
+        for category, keywords in CATEGORY_KEYWORDS.items():
+            for keyword in keywords:
+                if keyword in item_lower:
+                    return category
+        return "Другое"
+
+    def test_matches_keyword_loop(self):
+        """Scenario: Compiled matcher keeps the table's priority
+        Given items containing one, several or overlapping keywords
+        When categories are detected
+        Then they match the category-by-category keyword loop
+        """
+        service = YaGPTService()
+        keywords = [k for words in CATEGORY_KEYWORDS.values() for k in words]
+        items = [f"{a} {b}" for a in keywords for b in keywords[::7]]
+        items += ["подписка на яндекс плюс", "Netflix", "пивоварня", "ничего", "", "кофемашина"]
+
+        for item in items:
+            assert service._detect_category(item) == self._reference(item), item
+
+    def test_overlapping_keywords_use_priority(self):
+        pattern, _ = compile_keywords({"A": ["cd"], "B": ["abcde"]})
+        service = YaGPTService()
+
+        assert [m.group(1) for m in pattern.finditer("abcde")] == ["abcde", "cd"]
+        assert service._detect_category("такси с кофе") == "Еда"
@@ -1,6 +1,11 @@
 """Tests for YDB Client - SQL injection prevention."""
+import asyncio
+from types import SimpleNamespace
+
 import pytest
-from src.db.ydb_client import YDBClient, MemoryDB
+from datetime import datetime, timezone
+from src.db.timestamps import to_micros
+from src.db.ydb_client import YDBClient, AsyncYDBClient, AsyncMemoryDB, MemoryDB, Prefix, get_async_db
 
 
 class TestYDBClientParameterizedQueries:
@@ -53,6 +58,155 @@ class TestYDBClientParameterizedQueries:
         assert 'LIMIT 50' in query
         assert params is None or params == {}
 
+    def test_range_query_uses_parameters(self):
+        """Scenario: select_range() compiles a half-open range predicate.
+
+        Given a YDBClient instance
+        When I build a range query over created_at
+        Then bounds are bound as parameters, not inlined
+        """
+        client = YDBClient()
+
+        query, params = client._build_range_query(
+            'expenses', {'user_id': 1}, 'created_at',
+            '2026-01-01T00:00:00', '2026-02-01T00:00:00',
+        )
+
+        assert 'created_at >= $r_start AND created_at < $r_end' in query
+        assert 'user_id = $p_user_id' in query
+        assert '2026-01-01' not in query
+        assert 'DECLARE $r_start AS Timestamp;' in query
+        assert params['$r_start'] == to_micros('2026-01-01T00:00:00')
+        assert params['$r_end'] == to_micros('2026-02-01T00:00:00')
+
+    def test_legacy_utf8_timestamps(self):
+        """Scenario: Tables not yet migrated keep binding created_at as Utf8."""
+        client = YDBClient(timestamp_columns=[])
+
+        query, params = client._build_range_query(
+            'expenses', {'user_id': 1}, 'created_at',
+            '2026-01-01T00:00:00', '2026-02-01T00:00:00',
+        )
+
+        assert 'DECLARE $r_start AS Utf8;' in query
+        assert params['$r_start'] == '2026-01-01T00:00:00'
+
+    def test_epoch_micros_bound_for_either_column_type(self):
+        """Scenario: Rows carry created_at as epoch micros whatever the column type."""
+        micros = to_micros('2026-01-01T09:30:00.000001')
+
+        _, params = YDBClient()._bind_all({'created_at': micros}, 'p_')
+        assert params['$p_created_at'] == micros
+
+        types, params = YDBClient(timestamp_columns=[])._bind_all({'created_at': micros}, 'p_')
+        assert types == ('Utf8',)
+        assert params['$p_created_at'] == '2026-01-01T09:30:00.000001'
+        # other Utf8 columns keep ints as text
+        assert YDBClient()._convert('Utf8', 5, 'item') == '5'
+
+    def test_timestamp_results_decoded_to_micros(self):
+        """Scenario: Native Timestamp results come back as epoch micros."""
+        client = YDBClient()
+        created_at = datetime(2026, 1, 1, 9, 30, tzinfo=timezone.utc)
+
+        row = client._decode_row({'user_id': 1, 'created_at': created_at})
+
+        assert row['created_at'] == to_micros(datetime(2026, 1, 1, 9, 30))
+
+    def test_aggregate_query_groups_by_category(self):
+        """Scenario: aggregate() compiles a single GROUP BY query."""
+        client = YDBClient()
+
+        query, params = client._build_aggregate_query(
+            'expenses', {'user_id': 1}, 'created_at',
+            '2026-01-01T00:00:00', '2026-02-01T00:00:00',
+            group_by='category', value='amount',
+        )
+
+        assert 'SUM(amount) AS total' in query
+        assert 'COUNT(*) AS count' in query
+        assert query.rstrip().endswith('GROUP BY category')
+        assert params['$p_user_id'] == 1
+
+    def test_batch_compiles_single_query(self):
+        """Scenario: batch() writes several statements in one request.
+
+        Increments of the same table are merged into one UPSERT so the
+        counter table is read once before being modified.
+        """
+        client = YDBClient()
+
+        query, params = client._build_batch_query([
+            ('insert', 'expenses', {'user_id': 1, 'item': 'кофе', 'amount': 300}),
+            ('increment', 'rollups', {'user_id': 1, 'category': 'Еда'}, {'total': 300}),
+            ('increment', 'rollups', {'user_id': 1, 'category': 'Еда'}, {'total': 200}),
+        ])
+
+        assert query.count('UPSERT INTO rollups') == 1
+        assert 'UPSERT INTO expenses' in query
+        assert params['$o0_item'] == 'кофе'
+        assert params['$inc0_rows'] == [{'user_id': 1, 'category': 'Еда', 'total': 500}]
+
+    def test_upsert_is_one_statement(self):
+        """Scenario: upsert() replaces a keyed row with one UPSERT."""
+        client = YDBClient()
+
+        query, params = client._build_batch_query([
+            ('upsert', 'item_categories', {'user_id': 1, 'item_key': 'обед'}, {'category': 'Еда'}),
+        ])
+
+        assert query.count('UPSERT INTO item_categories') == 1
+        assert 'DELETE' not in query
+        assert params['$o0_category'] == 'Еда'
+
+    def test_insert_many_uses_as_table(self):
+        """Scenario: insert_many() writes all rows with one UPSERT."""
+        client = YDBClient()
+
+        query, params = client._build_batch_query([
+            ('insert_many', 'expenses', [
+                {'user_id': 1, 'item': 'кофе', 'amount': 300},
+                {'user_id': 1, 'item': 'обед', 'amount': 500},
+            ]),
+        ])
+
+        assert 'UPSERT INTO expenses SELECT * FROM AS_TABLE($o0_rows)' in query
+        assert 'List<Struct<user_id: Int64, item: Utf8, amount: Int64>>' in query
+        assert len(params['$o0_rows']) == 2
+
+    def test_page_query_uses_keyset_continuation(self):
+        """Scenario: select_page() continues after the last seen key."""
+        client = YDBClient()
+
+        query, params = client._build_page_query(
+            'expenses', {'user_id': 1}, 'created_at',
+            end='2026-02-01T00:00:00', after='2026-01-15T10:00:00', limit=50,
+        )
+
+        assert 'created_at > $r_after' in query
+        assert 'created_at < $r_end' in query
+        assert '$r_start' not in query
+        assert query.endswith('ORDER BY created_at LIMIT 50')
+        assert params['$r_after'] == to_micros('2026-01-15T10:00:00')
+
+    def test_descending_page_reads_from_the_end(self):
+        """Scenario: A descending page continues before the last seen key."""
+        client = YDBClient()
+
+        query, _ = client._build_page_query(
+            'expenses', {'user_id': 1}, 'created_at', after='2026-01-15T10:00:00', limit=1, descending=True,
+        )
+
+        assert 'created_at < $r_after' in query
+        assert query.endswith('ORDER BY created_at DESC LIMIT 1')
+
+    def test_range_query_validates_column(self):
+        """Scenario: Range column names should be validated."""
+        client = YDBClient()
+
+        with pytest.raises(ValueError):
+            client._build_range_query('expenses', {'user_id': 1}, 'created_at; --', 'a', 'b')
+
     def test_delete_uses_parameters(self):
         """Scenario: delete() should use parameterized queries.
 
@@ -87,6 +241,510 @@ class TestYDBClientParameterizedQueries:
             client._build_delete_query('expenses; DROP TABLE users', {'id': '1'})
 
 
+class TestYDBClientIndexes:
+    """Test secondary index reads and prefix filters."""
+
+    def test_select_reads_view(self):
+        """Scenario: Queries can read a secondary index with VIEW."""
+        client = YDBClient()
+
+        query, _ = client._build_page_query('expenses', {'user_id': 1, 'category': 'Еда'}, 'created_at',
+                                            view='idx_user_category')
+
+        assert 'FROM expenses VIEW idx_user_category WHERE' in query
+
+    def test_prefix_becomes_key_range(self):
+        """Scenario: A Prefix value reads a key range instead of filtering."""
+        client = YDBClient()
+
+        query, params = client._build_aggregate_query(
+            'expenses', {'user_id': 1, 'item_key': Prefix('кофе')}, 'created_at',
+            '2026-01-01T00:00:00', '2026-02-01T00:00:00', 'category', 'amount', view='idx_user_item',
+        )
+
+        assert 'item_key >= $p_item_key AND item_key < $p_item_key_end' in query
+        assert params['$p_item_key'] == 'кофе'
+        assert params['$p_item_key_end'] == 'кофе' + Prefix.UPPER
+
+    def test_prefix_and_equality_templates_differ(self):
+        client = YDBClient()
+
+        exact, _ = client._build_select_query('expenses', {'user_id': 1, 'item_key': 'кофе'})
+        prefix, _ = client._build_select_query('expenses', {'user_id': 1, 'item_key': Prefix('кофе')})
+
+        assert exact != prefix
+
+    def test_view_name_validated(self):
+        client = YDBClient()
+
+        with pytest.raises(ValueError):
+            client._build_select_query('expenses', {'user_id': 1}, view='idx; DROP TABLE expenses')
+
+    def test_memory_db_prefix_match(self):
+        db = MemoryDB()
+        for item in ('кофе', 'кофе латте', 'какао'):
+            db.insert('expenses', {'user_id': 1, 'item_key': item, 'created_at': item})
+
+        rows = db.select('expenses', {'user_id': 1, 'item_key': Prefix('кофе')}, view='idx_user_item')
+
+        assert sorted(r['item_key'] for r in rows) == ['кофе', 'кофе латте']
+
+
+class TestYDBClientCaching:
+    """Test statement template cache."""
+
+    def test_statement_template_reused(self):
+        """Scenario: Same (table, columns, types) reuses the query text."""
+        client = YDBClient()
+
+        query1, params1 = client._build_select_query('expenses', {'user_id': 1, 'category': 'Еда'})
+        query2, params2 = client._build_select_query('expenses', {'user_id': 2, 'category': 'Такси'})
+
+        assert query1 is query2
+        assert params1 != params2
+
+    def test_template_cache_evicts_least_recently_used(self):
+        client = YDBClient()
+        client.TEMPLATE_CACHE_SIZE = 2
+
+        for key in ('a', 'b', 'a', 'c'):
+            client._template((key,), lambda: key.upper())
+
+        assert list(client._templates) == [('a',), ('c',)]
+
+
+class TestYDBClientTransactions:
+    """Test per-call transaction modes."""
+
+    class FakeSession:
+        def __init__(self):
+            self.modes = []
+
+        def prepare(self, query):
+            return query
+
+        def transaction(self, *settings):
+            self.modes.append(settings)
+            return self
+
+        def execute(self, query, parameters=None, commit_tx=False):
+            return []
+
+    class FakePool:
+        def __init__(self, session):
+            self.session = session
+
+        def retry_operation_sync(self, callee):
+            return callee(self.session)
+
+    def _client(self):
+        client = YDBClient()
+        session = self.FakeSession()
+        client.driver = object()
+        client.pool = self.FakePool(session)
+        client._tx_settings = lambda mode: YDBClient.TX_MODES[mode] and f'{mode}-settings'
+        return client, session
+
+    def test_read_uses_requested_mode(self):
+        """Scenario: Reads can run in a snapshot read-only transaction."""
+        client, session = self._client()
+
+        client.select('expenses', {'user_id': 1}, tx_mode='snapshot')
+        client.aggregate('expenses', {'user_id': 1}, 'created_at', '2026-01-01T00:00:00', '2026-02-01T00:00:00',
+                         group_by='category', value='amount', tx_mode='stale')
+
+        assert session.modes == [('snapshot-settings',), ('stale-settings',)]
+
+    def test_default_mode_is_sdk_default(self):
+        client, session = self._client()
+
+        client.insert('expenses', {'user_id': 1, 'created_at': '2026-01-01T09:00:00'})
+
+        assert session.modes == [()]
+
+    def test_execute_many_is_one_request(self):
+        """Scenario: Several statements share one request and one commit."""
+        client, session = self._client()
+        queries = []
+        session.execute = lambda query, parameters=None, commit_tx=False: queries.append((query, parameters)) or []
+
+        client.execute_many([
+            ('DECLARE $a AS Int64; $x = (SELECT * FROM t WHERE id = $a);', {'$a': 1}),
+            ('DELETE FROM t ON SELECT * FROM $x;', None),
+        ])
+
+        assert len(queries) == 1
+        assert queries[0][0].index('$x =') < queries[0][0].index('DELETE')
+        assert queries[0][1] == {'$a': 1}
+
+    def test_execute_many_rejects_duplicate_parameters(self):
+        client = YDBClient()
+
+        with pytest.raises(ValueError):
+            client._join_statements([('Q1', {'$a': 1}), ('Q2', {'$a': 2})])
+
+    def test_unknown_mode_rejected(self):
+        client = YDBClient()
+        client.driver = object()
+
+        with pytest.raises(ValueError):
+            client.execute('SELECT 1', tx_mode='dirty')
+
+
+class TestYDBClientBulkUpsert:
+    """Test BulkUpsert batching against a fake table client."""
+
+    class FakeFuture:
+        def __init__(self, table_client):
+            self.table_client = table_client
+            self.done = False
+
+        def result(self):
+            if not self.done:
+                self.done = True
+                self.table_client.in_flight -= 1
+
+    class FakeTableClient:
+        def __init__(self):
+            self.calls = []
+            self.in_flight = 0
+            self.max_in_flight = 0
+
+        def async_bulk_upsert(self, path, rows, columns):
+            self.calls.append((path, rows, columns))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return TestYDBClientBulkUpsert.FakeFuture(self)
+
+    class FakeDriver:
+        def __init__(self):
+            self.table_client = TestYDBClientBulkUpsert.FakeTableClient()
+
+    def _client(self):
+        client = YDBClient()
+        client.database = '/local'
+        client.driver = self.FakeDriver()
+        client._bulk_columns = lambda types: types
+        return client, client.driver.table_client
+
+    def test_rows_streamed_in_typed_batches(self):
+        """Scenario: A generator of rows is loaded in fixed-size typed batches."""
+        client, table_client = self._client()
+        rows = ({'user_id': i, 'item': 'кофе', 'created_at': f'2026-01-01T09:00:{i:02d}'} for i in range(25))
+
+        written = client.bulk_upsert('expenses', rows, batch_size=10)
+
+        assert written == 25
+        assert [len(call[1]) for call in table_client.calls] == [10, 10, 5]
+        path, batch, columns = table_client.calls[0]
+        assert path == '/local/expenses'
+        assert columns == {'user_id': 'Int64', 'item': 'Utf8', 'created_at': 'Timestamp'}
+        assert batch[1]['created_at'] == to_micros('2026-01-01T09:00:01')
+
+    def test_in_flight_batches_are_bounded(self):
+        client, table_client = self._client()
+
+        client.bulk_upsert('expenses', ({'user_id': i} for i in range(100)), batch_size=5, max_in_flight=3)
+
+        assert len(table_client.calls) == 20
+        assert table_client.max_in_flight == 3
+        assert table_client.in_flight == 0
+
+    def test_explicit_column_types(self):
+        client, table_client = self._client()
+
+        client.bulk_upsert('expenses', [{'user_id': 1, 'amount': None}], column_types={'item': 'Utf8'})
+
+        assert table_client.calls[0][2] == {'user_id': 'Int64', 'amount': 'Int64', 'item': 'Utf8'}
+        # missing and None columns are written as NULL, not as 0 / ''
+        assert table_client.calls[0][1] == [{'user_id': 1, 'amount': None, 'item': None}]
+
+    def test_values_converted_by_declared_type(self):
+        """
+        Scenario: Bulk values follow their declared primitive type
+        Given explicit Uint64, Double and Bool columns
+        When rows are bulk upserted
+        Then each value is converted to that type, not to text or a timestamp
+        """
+        client, table_client = self._client()
+
+        client.bulk_upsert(
+            'stats', [{'user_id': 1, 'hits': 5, 'ratio': 1, 'active': 1}],
+            column_types={'hits': 'Uint64', 'ratio': 'Double', 'active': 'Bool'},
+        )
+
+        assert table_client.calls[0][1] == [{'user_id': 1, 'hits': 5, 'ratio': 1.0, 'active': True}]
+        assert client._convert('Uint64', 5) == 5
+        assert client._convert('Double', 1.5) == 1.5
+        assert client._convert('Bool', True) is True
+
+    def test_memory_db_bulk_upsert(self):
+        db = MemoryDB()
+
+        written = db.bulk_upsert('expenses', ({'user_id': 1, 'created_at': str(i)} for i in range(7)), batch_size=3)
+
+        assert written == 7
+        assert len(db.select('expenses', {'user_id': 1})) == 7
+
+
+class TestYDBClientScan:
+    """Test scan query streaming against a fake table client."""
+
+    class FakeResponse:
+        def __init__(self, rows):
+            self.result_set = type('ResultSet', (), {'rows': rows})()
+
+    class FakeTableClient:
+        def __init__(self, parts):
+            self.parts = parts
+            self.queries = []
+            self.consumed = 0
+
+        def scan_query(self, query, parameters):
+            self.queries.append((query, parameters))
+            for rows in self.parts:
+                self.consumed += 1
+                yield TestYDBClientScan.FakeResponse(rows)
+
+    def _client(self, parts):
+        client = YDBClient()
+        client.driver = type('Driver', (), {})()
+        client.driver.table_client = self.FakeTableClient(parts)
+        client._scan_query = lambda query, parameters: query
+        return client, client.driver.table_client
+
+    def test_scan_yields_rows_as_parts_arrive(self):
+        """Scenario: Rows stream lazily, one result part at a time."""
+        created_at = datetime(2026, 1, 1, 9, 0)
+        client, table_client = self._client([[{'user_id': 1, 'created_at': created_at}], [{'user_id': 2}]])
+
+        rows = client.scan('SELECT * FROM expenses')
+
+        assert next(rows) == {'user_id': 1, 'created_at': to_micros(created_at)}
+        assert table_client.consumed == 1
+        assert list(rows) == [{'user_id': 2}]
+
+    def test_scan_batches(self):
+        client, _ = self._client([[{'n': 1}, {'n': 2}], [], [{'n': 3}]])
+
+        assert list(client.scan('SELECT 1', batches=True)) == [[{'n': 1}, {'n': 2}], [{'n': 3}]]
+
+    def test_scan_range_is_unbounded_ordered_select(self):
+        client, table_client = self._client([])
+
+        list(client.scan_range('expenses', {'user_id': 1}, 'created_at', start='2026-01-01T00:00:00'))
+
+        query, params = table_client.queries[0]
+        assert 'ORDER BY created_at' in query
+        assert 'LIMIT' not in query
+        assert set(params) == {'$p_user_id', '$r_start'}
+
+    def test_declared_types(self):
+        client = YDBClient()
+        query, _ = client._build_page_query('expenses', {'user_id': 1}, 'created_at', start='2026-01-01T00:00:00')
+
+        assert client._declared_types(query) == {'$p_user_id': 'Int64', '$r_start': 'Timestamp'}
+
+
+class TestAsyncYDBClient:
+    """Test the asyncio client against a fake ydb.aio session pool."""
+
+    class FakeResultSet:
+        def __init__(self, rows):
+            self.rows = rows
+
+    class FakeTx:
+        def __init__(self, session):
+            self.session = session
+
+        async def execute(self, query, parameters=None, commit_tx=False):
+            self.session.executed.append((query, parameters))
+            return [TestAsyncYDBClient.FakeResultSet(self.session.rows)]
+
+    class FakeSession:
+        def __init__(self, rows=()):
+            self.rows = list(rows)
+            self.prepared = 0
+            self.executed = []
+
+        async def prepare(self, query):
+            self.prepared += 1
+            return query
+
+        def transaction(self):
+            return TestAsyncYDBClient.FakeTx(self)
+
+    class FakePool:
+        def __init__(self, session):
+            self.session = session
+
+        async def retry_operation(self, callee):
+            return await callee(self.session)
+
+    def _client(self, rows=()):
+        client = AsyncYDBClient()
+        session = self.FakeSession(rows)
+        client.pool = self.FakePool(session)
+        return client, session
+
+    @pytest.mark.asyncio
+    async def test_select_awaits_prepared_query(self):
+        """Scenario: Awaited selects run prepared queries and decode timestamps."""
+        created_at = datetime(2026, 1, 1, 9, 0)
+        client, session = self._client([{'user_id': 1, 'created_at': created_at}])
+
+        rows = await client.select('expenses', {'user_id': 1})
+        await client.select('expenses', {'user_id': 2})
+
+        assert rows == [{'user_id': 1, 'created_at': to_micros(created_at)}]
+        # caching prepared queries is left to the SDK's per-session LRU
+        assert session.prepared == 2
+        assert [params['$p_user_id'] for _, params in session.executed] == [1, 2]
+
+    @pytest.mark.asyncio
+    async def test_batch_is_one_request(self):
+        client, session = self._client()
+
+        await client.batch([
+            ('insert', 'expenses', {'user_id': 1, 'created_at': '2026-01-01T09:00:00', 'amount': 300}),
+            ('increment', 'expense_rollups', {'user_id': 1, 'month': '2026-01', 'category': 'Еда'},
+             {'total': 300, 'expense_count': 1}),
+        ])
+
+        assert len(session.executed) == 1
+
+    @pytest.mark.asyncio
+    async def test_memory_db_wrapper_shares_tables(self):
+        db = MemoryDB()
+        async_db = get_async_db(db)
+
+        await async_db.insert('user_settings', {'user_id': 1, 'budget': 50000})
+
+        assert isinstance(async_db, AsyncMemoryDB)
+        assert db.select('user_settings', {'user_id': 1}) == [{'user_id': 1, 'budget': 50000}]
+        assert await async_db.select('user_settings', {'user_id': 1}) == [{'user_id': 1, 'budget': 50000}]
+
+    class FakeWarmPool:
+        def __init__(self, fail=False, created_at_type='Timestamp'):
+            self.fail = fail
+            self.created_at_type = created_at_type
+            self.acquired = 0
+            self.released = 0
+            self.pinged = 0
+            self.described = []
+
+        async def retry_operation(self, callee):
+            pool = self
+
+            class Session:
+                async def describe_table(self, path):
+                    pool.described.append(path)
+                    columns = {'user_id': 'Int64', 'created_at': pool.created_at_type, 'item': 'Utf8'}
+                    return SimpleNamespace(columns=[
+                        SimpleNamespace(name=name, type=f'Optional<{t}>') for name, t in columns.items()
+                    ])
+
+            return await callee(Session())
+
+        async def acquire(self):
+            if self.fail:
+                raise ConnectionError("discovery failed")
+            self.acquired += 1
+            pool = self
+
+            class Session:
+                async def keep_alive(self):
+                    pool.pinged += 1
+
+            return Session()
+
+        async def release(self, session):
+            self.released += 1
+
+        async def stop(self):
+            pass
+
+    @pytest.mark.asyncio
+    async def test_warmup_creates_and_releases_sessions(self):
+        """Scenario: Startup warmup pre-creates sessions and marks the pool ready."""
+        client = AsyncYDBClient(pool_size=5)
+        client.keepalive_interval = 0
+        client.pool = self.FakeWarmPool()
+
+        assert not client.ready
+        assert await client.warmup(sessions=3)
+
+        assert client.ready
+        assert (client.pool.acquired, client.pool.pinged, client.pool.released) == (3, 3, 3)
+
+    @pytest.mark.asyncio
+    async def test_warmup_detects_legacy_utf8_created_at(self, monkeypatch):
+        """
+        Scenario: A table created before the Timestamp migration keeps working
+        Given YDB_TIMESTAMP_COLUMNS is not set
+        And the expenses table stores created_at as Utf8
+        When the client warms up
+        Then created_at is bound as Utf8
+        """
+        monkeypatch.delenv('YDB_TIMESTAMP_COLUMNS', raising=False)
+        client = AsyncYDBClient()
+        client.keepalive_interval = 0
+        client.pool = self.FakeWarmPool(created_at_type='Utf8')
+        assert client.timestamp_columns == {'created_at'}
+
+        assert await client.warmup()
+
+        assert client.timestamp_columns == set()
+        assert client.pool.described == [f'{client.database}/expenses']
+        query, _ = client._build_range_query('expenses', {'user_id': 1}, 'created_at', '2026-01-01', None)
+        assert 'DECLARE $r_start AS Utf8;' in query
+
+        await client.warmup()
+        assert len(client.pool.described) == 1
+
+    @pytest.mark.asyncio
+    async def test_pinned_timestamp_columns_skip_detection(self, monkeypatch):
+        monkeypatch.setenv('YDB_TIMESTAMP_COLUMNS', 'created_at')
+        client = AsyncYDBClient()
+        client.keepalive_interval = 0
+        client.pool = self.FakeWarmPool(created_at_type='Utf8')
+
+        assert await client.warmup()
+
+        assert client.timestamp_columns == {'created_at'}
+        assert client.pool.described == []
+
+    @pytest.mark.asyncio
+    async def test_failed_warmup_is_not_ready(self):
+        client = AsyncYDBClient()
+        client.keepalive_interval = 0
+        client.pool = self.FakeWarmPool(fail=True)
+
+        assert not await client.warmup()
+        assert not client.ready
+
+    @pytest.mark.asyncio
+    async def test_keepalive_loop_pings_sessions(self):
+        client = AsyncYDBClient(pool_size=2)
+        client.keepalive_interval = 0.01
+        client.pool = self.FakeWarmPool()
+
+        await client.warmup()
+        await asyncio.sleep(0.05)
+        task, pool = client._keepalive_task, client.pool
+        await client.close()
+
+        assert pool.pinged > 2
+        assert task.cancelled()
+        assert not client.ready
+
+    def test_async_counterpart_of_ydb_client(self):
+        client = get_async_db(YDBClient(timestamp_columns=()))
+
+        assert isinstance(client, AsyncYDBClient)
+        assert client.timestamp_columns == set()
+
+
 class TestMemoryDBSafety:
     """Test MemoryDB is also safe (even though it's in-memory)."""
 
@@ -112,3 +770,51 @@ class TestMemoryDBSafety:
         results = db.select('users')
         assert len(results) == 1
         assert results[0]['name'] == 'Bob'
+
+
+class TestMemoryDBIndexes:
+    """Test MemoryDB per-user hash index and sorted created_at index."""
+
+    def _db(self):
+        db = MemoryDB()
+        db.insert('expenses', {'user_id': 1, 'item': 'b', 'created_at': '2026-01-02T00:00:00'})
+        db.insert('expenses', {'user_id': 2, 'item': 'x', 'created_at': '2026-01-02T00:00:00'})
+        db.insert('expenses', {'user_id': 1, 'item': 'a', 'created_at': '2026-01-01T00:00:00'})
+        db.insert('expenses', {'user_id': 1, 'item': 'c', 'created_at': '2026-01-03T00:00:00'})
+        return db
+
+    def test_select_range_is_per_user_and_sorted(self):
+        """Range scans only see the user's rows, oldest first."""
+        db = self._db()
+
+        rows = db.select_range('expenses', {'user_id': 1}, 'created_at',
+                               '2026-01-01T00:00:00', '2026-01-03T00:00:00')
+
+        assert [r['item'] for r in rows] == ['a', 'b']
+
+    def test_delete_by_key_leaves_other_users(self):
+        """Delete by (user_id, created_at) removes exactly one row."""
+        db = self._db()
+
+        db.delete('expenses', {'user_id': 1, 'created_at': '2026-01-02T00:00:00'})
+
+        assert [r['item'] for r in db.select('expenses', {'user_id': 1})] == ['a', 'c']
+        assert len(db.select('expenses', {'user_id': 2})) == 1
+
+    def test_upsert_replaces_row_by_key(self):
+        """Upsert leaves one row per key, holding the latest data."""
+        db = MemoryDB()
+
+        db.batch([('upsert', 'learned', {'user_id': 1, 'item_key': 'обед'}, {'category': 'Еда'})])
+        db.batch([('upsert', 'learned', {'user_id': 1, 'item_key': 'обед'}, {'category': 'Дом'})])
+
+        assert db.select('learned', {'user_id': 1}) == [{'user_id': 1, 'item_key': 'обед', 'category': 'Дом'}]
+
+    def test_update_of_sort_column_keeps_order(self):
+        """Updating created_at moves the row to its new sorted position."""
+        db = self._db()
+
+        db.update('expenses', {'user_id': 1, 'created_at': '2026-01-01T00:00:00'},
+                  {'created_at': '2026-01-05T00:00:00'})
+
+        assert [r['item'] for r in db.select('expenses', {'user_id': 1})] == ['b', 'c', 'a']